@@ -4,6 +4,7 @@ from .models import *
 from .config import Config
 from .extensions import db, migrate
 from .blueprints import register_blueprints
+from .commands import register_commands
 
 def create_app():
     app = Flask(__name__)
@@ -16,5 +17,6 @@ def create_app():
     migrate.init_app(app, db)
 
     register_blueprints(app)
+    register_commands(app)
 
     return app
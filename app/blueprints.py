@@ -1,4 +1,6 @@
 from .routes.repository import repository_bp
+from .routes.jobs import jobs_bp
 
 def register_blueprints(app):
     app.register_blueprint(repository_bp)
+    app.register_blueprint(jobs_bp)
@@ -0,0 +1,47 @@
+import click
+
+from .services import embedding_migration, repository_service
+from .services.job_worker import JobWorkerPool
+
+def register_commands(app):
+    @app.cli.command('worker')
+    @click.option('--workers', type=int, default=None, help='Number of worker threads, defaults to JOB_WORKERS.')
+    def worker(workers):
+        """Runs background jobs from the queue until interrupted."""
+
+        pool = JobWorkerPool(
+            app,
+            {
+                repository_service.SETUP_JOB: repository_service.run_setup,
+                repository_service.BATCH_SETUP_JOB: repository_service.run_batch_setup,
+                embedding_migration.MIGRATE_EMBEDDINGS_JOB: embedding_migration.run_migration,
+            },
+            workers=workers or app.config['JOB_WORKERS'],
+            poll_interval=app.config['JOB_POLL_INTERVAL'],
+            stale_after=app.config['JOB_STALE_AFTER']
+        )
+
+        pool.start()
+
+        print(f"Started {len(pool.workers)} job workers")
+
+        try:
+            pool.join()
+        except KeyboardInterrupt:
+            print("Stopping job workers after their current jobs")
+            pool.stop()
+            pool.join()
+
+    @app.cli.command('migrate-embeddings')
+    @click.argument('name')
+    @click.option('--profile', default=None, help='Target profile as model:dimensions, defaults to EMBEDDING_PROFILE.')
+    @click.option('--rebuild', is_flag=True, help='Embed every chunk again instead of re-projecting the vectors.')
+    def migrate_embeddings(name, profile, rebuild):
+        """Queues the migration of a repository collection to another embedding profile."""
+
+        try:
+            job = embedding_migration.enqueue_migration(name, profile or app.config['EMBEDDING_PROFILE'], rebuild)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        print(f"Queued embedding migration of {name}: job {job.id}")
@@ -13,6 +13,47 @@ class Config:
         if self.OPENAI_API_KEY is None:
             raise ValueError('OPENAI_API_KEY is not set')
 
+        self.PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', 16))
+        self.PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 64))
+        self.PIPELINE_FLUSH_SIZE = int(os.getenv('PIPELINE_FLUSH_SIZE', 50))
+        self.PROCESS_POOL_WORKERS = int(os.getenv('PROCESS_POOL_WORKERS', 2))
+        self.PROCESS_POOL_CHUNK_SIZE = int(os.getenv('PROCESS_POOL_CHUNK_SIZE', 16))
+        self.PROCESS_POOL_INLINE_BYTES = int(os.getenv('PROCESS_POOL_INLINE_BYTES', 4_096))
+        self.LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', 8))
+        self.LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-4')
+        self.LLM_TRIAGE = os.getenv('LLM_TRIAGE', 'none')
+        self.LLM_TRIAGE_MODEL = os.getenv('LLM_TRIAGE_MODEL', 'gpt-4o-mini')
+        self.LLM_TRIAGE_ESCALATION_THRESHOLD = int(os.getenv('LLM_TRIAGE_ESCALATION_THRESHOLD', 50))
+        self.LLM_TRIAGE_STATIC_THRESHOLD = int(os.getenv('LLM_TRIAGE_STATIC_THRESHOLD', 40))
+        self.EMBEDDING_PROFILE = os.getenv('EMBEDDING_PROFILE', 'text-embedding-3-small:1536')
+        self.EMBEDDING_CONCURRENCY = int(os.getenv('EMBEDDING_CONCURRENCY', 32))
+        self.LLM_MAX_FILE_TOKENS = int(os.getenv('LLM_MAX_FILE_TOKENS', 100_000))
+        self.LLM_SECTION_TOKENS = int(os.getenv('LLM_SECTION_TOKENS', 6_000))
+        self.LLM_MIN_CODE_LINES = int(os.getenv('LLM_MIN_CODE_LINES', 3))
+        self.LLM_BATCH_MAX_FILES = int(os.getenv('LLM_BATCH_MAX_FILES', 8))
+        self.LLM_BATCH_MAX_TOKENS = int(os.getenv('LLM_BATCH_MAX_TOKENS', 3_000))
+        self.LLM_BATCH_FILE_TOKENS = int(os.getenv('LLM_BATCH_FILE_TOKENS', 600))
+        self.LLM_BATCH_LINGER = float(os.getenv('LLM_BATCH_LINGER', 0.2))
+        self.LLM_STAGE_CONCURRENCY = int(os.getenv('LLM_STAGE_CONCURRENCY', 16)) or None
+        self.LLM_STAGE_TIMEOUT = float(os.getenv('LLM_STAGE_TIMEOUT', 900)) or None
+        self.EMBEDDING_STAGE_CONCURRENCY = int(os.getenv('EMBEDDING_STAGE_CONCURRENCY', 16)) or None
+        self.EMBEDDING_STAGE_TIMEOUT = float(os.getenv('EMBEDDING_STAGE_TIMEOUT', 300)) or None
+        self.BATCH_CLONE_CONCURRENCY = int(os.getenv('BATCH_CLONE_CONCURRENCY', 4))
+        self.BATCH_REPOSITORY_CONCURRENCY = int(os.getenv('BATCH_REPOSITORY_CONCURRENCY', 8))
+        self.BATCH_PIPELINE_WORKERS = int(os.getenv('BATCH_PIPELINE_WORKERS', 64))
+        self.JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+        self.JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+        self.JOB_STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', 1800))
+        self.QDRANT_QUANTIZATION = os.getenv('QDRANT_QUANTIZATION', 'none')
+        self.QDRANT_PRODUCT_COMPRESSION = os.getenv('QDRANT_PRODUCT_COMPRESSION', 'x16')
+        self.QDRANT_QUANTIZATION_ALWAYS_RAM = os.getenv('QDRANT_QUANTIZATION_ALWAYS_RAM', 'true').lower() == 'true'
+        self.QDRANT_ON_DISK = os.getenv('QDRANT_ON_DISK', 'false').lower() == 'true'
+        self.QDRANT_HNSW_M = int(os.getenv('QDRANT_HNSW_M', 0)) or None
+        self.QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv('QDRANT_HNSW_EF_CONSTRUCT', 0)) or None
+        self.QDRANT_SEARCH_EF = int(os.getenv('QDRANT_SEARCH_EF', 0)) or None
+        self.QDRANT_OVERSAMPLING = float(os.getenv('QDRANT_OVERSAMPLING', 2.0))
+        self.IGNORE_GLOBS = [glob.strip() for glob in os.getenv('IGNORE_GLOBS', '').split(',') if glob.strip()]
+
 class DevelopmentConfig(Config):
     DEBUG = True
 
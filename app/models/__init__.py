@@ -1,4 +1,5 @@
 from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime
 import uuid
 
 from ..extensions import db
@@ -6,6 +7,9 @@ from ..extensions import db
 class Repository(db.Model):
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
     name = db.Column(db.String(100), nullable=False)
+    last_indexed_commit = db.Column(db.String(40), nullable=True)
+    embedding_model = db.Column(db.String(100), nullable=True)
+    embedding_dimensions = db.Column(db.Integer, nullable=True)
 
     def __init__(self, name: str):
         self.name = name
@@ -15,12 +19,19 @@ class Repository(db.Model):
 
 class File(db.Model):
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
-    path = db.Column(db.String(100), nullable=False)
+    path = db.Column(db.String(1024), nullable=False)
+    language = db.Column(db.String(100), nullable=True)
+    token_count = db.Column(db.Integer, nullable=True)
+    prompt_tokens = db.Column(db.Integer, nullable=True)
+    completion_tokens = db.Column(db.Integer, nullable=True)
+    analysis_tier = db.Column(db.String(32), nullable=True)
+    analysis_model = db.Column(db.String(100), nullable=True)
     repository_id = db.Column(UUID(as_uuid=True), db.ForeignKey('repository.id'), nullable=False)
 
-    def __init__(self, path: str, repository_id: UUID):
+    def __init__(self, path: str, repository_id: UUID, language: str = None):
         self.path = path
         self.repository_id = repository_id
+        self.language = language
 
     def __repr__(self):
         return f"File('{self.path}')"
@@ -56,3 +67,116 @@ class FileScore(db.Model):
         self.scoreKind = scoreKind
         self.score = score
 
+class ScoreRollup(db.Model):
+    """Precomputed score statistics of a repository, per language and across all languages."""
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
+    repository_id = db.Column(UUID(as_uuid=True), db.ForeignKey('repository.id'), nullable=False, index=True)
+    language = db.Column(db.String(100), nullable=False)
+    scoreKind = db.Column(db.String(100), nullable=False)
+    file_count = db.Column(db.Integer, nullable=False)
+    average = db.Column(db.Float, nullable=False)
+    minimum = db.Column(db.Float, nullable=False)
+    maximum = db.Column(db.Float, nullable=False)
+    distribution = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __init__(self, repository_id: UUID, language: str, scoreKind: str, file_count: int, average: float,
+                 minimum: float, maximum: float, distribution: list, updated_at: datetime):
+        self.repository_id = repository_id
+        self.language = language
+        self.scoreKind = scoreKind
+        self.file_count = file_count
+        self.average = average
+        self.minimum = minimum
+        self.maximum = maximum
+        self.distribution = distribution
+        self.updated_at = updated_at
+
+    def __repr__(self):
+        return f"ScoreRollup('{self.language}', '{self.scoreKind}', {self.average})"
+
+class Job(db.Model):
+    """A unit of background work, queued in the database and claimed by workers."""
+
+    # At most one running job per key, enforced by the database so two
+    # workers claiming jobs of the same key at once cannot both succeed.
+    __table_args__ = (
+        db.Index(
+            'ix_job_running_key', 'key', unique=True,
+            postgresql_where=db.text("status = 'running'"), sqlite_where=db.text("status = 'running'")
+        ),
+    )
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
+    kind = db.Column(db.String(64), nullable=False)
+    key = db.Column(db.String(256), nullable=True, index=True)
+    # Job that holds the key of this one, when it is a hold on a key rather than work to run.
+    holder_id = db.Column(UUID(as_uuid=True), nullable=True, index=True)
+    status = db.Column(db.String(32), nullable=False, index=True)
+    payload = db.Column(db.JSON, nullable=False)
+    progress = db.Column(db.JSON, nullable=False)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.String(1024), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __init__(self, kind: str, payload: dict, status: str, created_at: datetime, key: str = None):
+        self.kind = kind
+        self.key = key
+        self.payload = payload
+        self.status = status
+        self.progress = {}
+        self.created_at = created_at
+        self.updated_at = created_at
+
+    def __repr__(self):
+        return f"Job('{self.kind}', '{self.status}')"
+
+class IndexingRun(db.Model):
+    """An indexing run of a repository, resumable until it is completed."""
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
+    repository_id = db.Column(UUID(as_uuid=True), db.ForeignKey('repository.id'), nullable=False, index=True)
+    head_commit = db.Column(db.String(40), nullable=True)
+    incremental = db.Column(db.Boolean, nullable=False)
+    status = db.Column(db.String(32), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __init__(self, repository_id: UUID, head_commit: str, incremental: bool, status: str, created_at: datetime):
+        self.repository_id = repository_id
+        self.head_commit = head_commit
+        self.incremental = incremental
+        self.status = status
+        self.created_at = created_at
+        self.updated_at = created_at
+
+    def __repr__(self):
+        return f"IndexingRun('{self.head_commit}', '{self.status}')"
+
+class RunFile(db.Model):
+    """Checkpoint of a file in an indexing run: the outputs of its completed stages, and whether it was persisted."""
+
+    __table_args__ = (db.UniqueConstraint('run_id', 'path'),)
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
+    run_id = db.Column(UUID(as_uuid=True), db.ForeignKey('indexing_run.id'), nullable=False, index=True)
+    path = db.Column(db.String(1024), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    stages = db.Column(db.JSON, nullable=False)
+    persisted = db.Column(db.Boolean, nullable=False)
+    point_ids = db.Column(db.JSON, nullable=True)
+
+    def __init__(self, run_id: UUID, path: str, content_hash: str):
+        self.run_id = run_id
+        self.path = path
+        self.content_hash = content_hash
+        self.stages = {}
+        self.persisted = False
+
+    def __repr__(self):
+        return f"RunFile('{self.path}', persisted={self.persisted})"
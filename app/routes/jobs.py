@@ -0,0 +1,19 @@
+from flask import Blueprint, jsonify
+import logging
+
+from ..services import job_service
+
+logger = logging.getLogger(__name__)
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id: str):
+    """Endpoint to get the status and progress of a background job."""
+
+    try:
+        return job_service.get_job(job_id)
+
+    except Exception as err:
+        logger.error(f"Error getting job status: {str(err)}")
+        return jsonify({'message': 'Failed to get job status'}), 500
@@ -2,16 +2,16 @@ from flask import Blueprint, jsonify, request
 from marshmallow import ValidationError
 import logging
 
-from ..services import repository_service
-from ..schemas import SetupRepositorySchema, SetupRepository
+from ..services import repository_service, search_service
+from ..schemas import SetupRepositorySchema, SetupRepository, SetupRepositoriesSchema, SetupRepositories, SearchRepositorySchema
 
 logger = logging.getLogger(__name__)
 
 repository_bp = Blueprint('repository', __name__)
 
 @repository_bp.route('/repository/setup', methods=['POST'])
-async def repository_setup():
-    """Endpoint to setup the repository."""
+def repository_setup():
+    """Endpoint to queue the setup of the repository."""
 
     try:
         data = SetupRepositorySchema().load(request.get_json())
@@ -28,10 +28,64 @@ async def repository_setup():
         return jsonify({'message': 'Internal Server Error'}), 500
 
     try:
-        response = await repository_service.setup(data)
+        response = repository_service.setup(data)
 
         return response
 
     except Exception as err:
         logger.error(f"Error in repository setup: {str(err)}")
         return jsonify({'message': 'Failed to setup repository'}), 500
+
+@repository_bp.route('/repository/setup/batch', methods=['POST'])
+def repository_setup_batch():
+    """Endpoint to queue the setup of several repositories in one job."""
+
+    try:
+        data = SetupRepositoriesSchema().load(request.get_json())
+
+        if not isinstance(data, SetupRepositories):
+            raise ValidationError('Invalid data')
+
+    except ValidationError as err:
+        logger.error(f"Validation error: {err.messages}")
+        return jsonify({'errors': err.messages}), 400
+
+    except Exception as err:
+        logger.error(f"Unexpected error during validation: {str(err)}")
+        return jsonify({'message': 'Internal Server Error'}), 500
+
+    try:
+        return repository_service.setup_batch(data)
+
+    except Exception as err:
+        logger.error(f"Error in batch repository setup: {str(err)}")
+        return jsonify({'message': 'Failed to setup repositories'}), 500
+
+@repository_bp.route('/repository/<name>/scores', methods=['GET'])
+def repository_scores(name: str):
+    """Endpoint to get the precomputed score rollups of a repository."""
+
+    try:
+        return repository_service.get_scores(name)
+
+    except Exception as err:
+        logger.error(f"Error getting repository scores: {str(err)}")
+        return jsonify({'message': 'Failed to get repository scores'}), 500
+
+@repository_bp.route('/repository/<name>/search', methods=['GET'])
+def repository_search(name: str):
+    """Endpoint to search the indexed chunks of a repository."""
+
+    try:
+        data = SearchRepositorySchema().load(request.args)
+
+    except ValidationError as err:
+        logger.error(f"Validation error: {err.messages}")
+        return jsonify({'errors': err.messages}), 400
+
+    try:
+        return search_service.search(name, data)
+
+    except Exception as err:
+        logger.error(f"Error searching repository: {str(err)}")
+        return jsonify({'message': 'Failed to search repository'}), 500
@@ -1,21 +1,82 @@
-from marshmallow import Schema, fields, post_load
+from marshmallow import Schema, fields, post_load, validate, EXCLUDE
+from typing import List, Optional
 
 class SetupRepository():
-    def __init__(self, github_token: str, owner: str, repo: str, branch: str):
+    def __init__(self, github_token: str, owner: str, repo: str, branch: str, incremental: bool = True):
         self.github_token = github_token
         self.owner = owner
         self.repo = repo
         self.branch = branch
+        self.incremental = incremental
 
     def __repr__(self):
-        return f"<SetupRepository(github_token={self.github_token}, owner={self.owner}, repo={self.repo}, branch={self.branch})>"
+        return f"<SetupRepository(github_token={self.github_token}, owner={self.owner}, repo={self.repo}, branch={self.branch}, incremental={self.incremental})>"
 
 class SetupRepositorySchema(Schema):
     github_token = fields.Str(required=True)
     owner = fields.Str(required=True)
     repo = fields.Str(required=True)
     branch = fields.Str(required=True)
+    incremental = fields.Bool(load_default=True)
 
     @post_load()
     def make_setup_repository(self, data, **kwargs):
         return SetupRepository(**data)
+
+class SetupRepositories():
+    def __init__(self, github_token: str, repositories: List[dict]):
+        self.github_token = github_token
+        self.repositories = repositories
+
+    def __repr__(self):
+        return f"<SetupRepositories(github_token={self.github_token}, repositories={self.repositories})>"
+
+class BatchRepositorySchema(Schema):
+    owner = fields.Str(required=True)
+    repo = fields.Str(required=True)
+    branch = fields.Str(required=True)
+    incremental = fields.Bool(load_default=True)
+
+class SetupRepositoriesSchema(Schema):
+    github_token = fields.Str(required=True)
+    repositories = fields.List(
+        fields.Nested(BatchRepositorySchema), required=True, validate=validate.Length(min=1, max=1000)
+    )
+
+    @post_load()
+    def make_setup_repositories(self, data, **kwargs):
+        return SetupRepositories(**data)
+
+class SearchRepository():
+    def __init__(self, q: str, languages: List[str], path: Optional[str], limit: int, offset: int, score_threshold: Optional[float]):
+        self.q = q
+        self.languages = languages
+        self.path = path
+        self.limit = limit
+        self.offset = offset
+        self.score_threshold = score_threshold
+
+    def __repr__(self):
+        return f"<SearchRepository(q={self.q}, languages={self.languages}, path={self.path}, limit={self.limit}, offset={self.offset}, score_threshold={self.score_threshold})>"
+
+class SearchRepositorySchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    q = fields.Str(required=True, validate=validate.Length(min=1, max=2000))
+    language = fields.Str(load_default=None)
+    path = fields.Str(load_default=None)
+    limit = fields.Int(load_default=10, validate=validate.Range(min=1, max=100))
+    offset = fields.Int(load_default=0, validate=validate.Range(min=0, max=10_000))
+    score_threshold = fields.Float(load_default=None, validate=validate.Range(min=-1, max=1))
+
+    @post_load()
+    def make_search_repository(self, data, **kwargs):
+        return SearchRepository(
+            q=data["q"],
+            languages=[language.strip() for language in (data["language"] or "").split(",") if language.strip()],
+            path=(data["path"] or "").strip("/") or None,
+            limit=data["limit"],
+            offset=data["offset"],
+            score_threshold=data["score_threshold"]
+        )
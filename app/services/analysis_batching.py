@@ -0,0 +1,111 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+
+class PendingAnalysis:
+    """A file waiting to be analyzed in a batch, with the future its result is delivered to."""
+
+    def __init__(self, file_path: str, content: str, token_count: int, future: asyncio.Future, context: str = ""):
+        self.file_path = file_path
+        self.content = content
+        self.token_count = token_count
+        self.future = future
+        self.context = context
+
+class AnalysisBatcher:
+    """
+        Collects small files from many concurrent callers into batches of at
+        most `max_files` files and `max_tokens` tokens of content, analyzed
+        together in one request. A batch is sent once it is full, or
+        `linger` seconds after its first file arrived.
+
+        `analyze_batch` returns one result per file of a batch, in order; a
+        file it could not analyze gets None, so its caller can fall back to
+        analyzing it alone. When the whole request fails, every file of the
+        batch gets the exception.
+    """
+
+    def __init__(
+        self,
+        analyze_batch: Callable[[List[PendingAnalysis]], Awaitable[List[Optional[Any]]]],
+        max_files: int = 8,
+        max_tokens: int = 3_000,
+        linger: float = 0.2,
+    ):
+        self.analyze_batch = analyze_batch
+        self.max_files = max_files
+        self.max_tokens = max_tokens
+        self.linger = linger
+
+        self._pending: List[PendingAnalysis] = []
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Keeps the requests in flight referenced until they are done.
+        self._requests = set()
+
+        self.batch_count = 0
+        self.file_count = 0
+        self.failed_files = 0
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batch_count,
+            "files": self.file_count,
+            "failed_files": self.failed_files,
+            "files_per_batch": self.file_count / self.batch_count if self.batch_count else 0.0,
+        }
+
+    async def analyze(self, file_path: str, content: str, token_count: int, context: str = "") -> Optional[Any]:
+        """Returns the result of a file once its batch is analyzed, or None if the batch left it out."""
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(PendingAnalysis(file_path, content, token_count, future, context))
+
+        return await future
+
+    def _enqueue(self, pending: PendingAnalysis) -> None:
+        if self._pending and self._pending_tokens + pending.token_count > self.max_tokens:
+            self._send_pending()
+
+        self._pending.append(pending)
+        self._pending_tokens += pending.token_count
+
+        if len(self._pending) >= self.max_files:
+            self._send_pending()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.linger, self._send_pending)
+
+    def _send_pending(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._pending:
+            return
+
+        batch = self._pending
+        self._pending = []
+        self._pending_tokens = 0
+
+        request = asyncio.ensure_future(self._send(batch))
+        self._requests.add(request)
+        request.add_done_callback(self._requests.discard)
+
+    async def _send(self, batch: List[PendingAnalysis]) -> None:
+        try:
+            results = await self.analyze_batch(batch)
+        except Exception as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+
+        self.batch_count += 1
+        self.file_count += len(batch)
+
+        for index, pending in enumerate(batch):
+            result = results[index] if index < len(results) else None
+
+            if result is None:
+                self.failed_files += 1
+
+            if not pending.future.done():
+                pending.future.set_result(result)
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from .embedding_cache import content_hash
+
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "./storage/cache/analyses.sqlite3")
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", 30 * 24 * 60 * 60))
+
+class AnalysisCache:
+    """
+        Persistent cache of analysis reports keyed by (model, prompt version,
+        content hash), stored in SQLite. Entries older than `ttl` seconds are
+        treated as missing, and when the stored reports exceed `max_bytes` the
+        least recently used entries are evicted. Concurrent requests for the
+        same key share a single analysis.
+
+        Each report is stored with the usage of the analysis that produced it
+        (tokens and seconds), so analyses can be replayed without the API.
+    """
+
+    def __init__(self, path: str = ANALYSIS_CACHE_PATH, max_bytes: int = ANALYSIS_CACHE_MAX_BYTES, ttl: float = ANALYSIS_CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._pending: Dict[Tuple[str, str, str], asyncio.Future] = {}
+
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS analyses (
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    report TEXT NOT NULL,
+                    usage TEXT,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, prompt_version, content_hash)
+                )
+                """
+            )
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(analyses)")}
+            if "usage" not in columns:
+                self._connection.execute("ALTER TABLE analyses ADD COLUMN usage TEXT")
+
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS analyses_last_used ON analyses (last_used)"
+            )
+            self._connection.execute(
+                "DELETE FROM analyses WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+            self._size = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM analyses"
+            ).fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.deduplicated + self.misses
+
+        return {
+            "hits": self.hits,
+            "deduplicated": self.deduplicated,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.deduplicated) / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "size_bytes": self._size,
+        }
+
+    async def get_or_create(
+        self,
+        model: str,
+        prompt_version: str,
+        content: str,
+        create: Callable[[], Awaitable[Tuple[dict, dict]]]
+    ) -> dict:
+        """
+        Returns the cached report of some content, waits for the analysis
+        already running for it, or runs `create` and caches the report and
+        usage it returns. When the analysis waited on is cancelled with the
+        request that started it, the waiter runs its own.
+        """
+        key = (model, prompt_version, content_hash(content))
+
+        if key not in self._pending:
+            entry = await asyncio.to_thread(self._get, key)
+
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+
+        # Checked again after the lookup, which another request for the same
+        # content may have overlapped.
+        while (pending := self._pending.get(key)) is not None:
+            try:
+                report = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                continue
+
+            self.deduplicated += 1
+            return report
+
+        self.misses += 1
+
+        future = asyncio.get_running_loop().create_future()
+        # Waiters re-raise a failed analysis; mark it retrieved when there are none.
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._pending[key] = future
+
+        try:
+            report, usage = await create()
+            future.set_result(report)
+            # Still pending while it is stored, so lookups never miss in between.
+            await asyncio.to_thread(self._put, key, report, usage)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+        finally:
+            del self._pending[key]
+
+        return report
+
+    def lookup(self, model: str, prompt_version: str, content: str) -> Optional[Tuple[dict, dict]]:
+        """Returns the cached report of some content and the usage of its analysis, if cached."""
+        return self._get((model, prompt_version, content_hash(content)))
+
+    def _get(self, key: Tuple[str, str, str]) -> Optional[Tuple[dict, dict]]:
+        now = time.time()
+
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT report, usage, size, created_at FROM analyses WHERE model = ? AND prompt_version = ? AND content_hash = ?",
+                key
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            report, usage, size, created_at = row
+
+            if created_at < now - self.ttl:
+                self._connection.execute(
+                    "DELETE FROM analyses WHERE model = ? AND prompt_version = ? AND content_hash = ?", key
+                )
+                self._size -= size
+                self.expirations += 1
+                return None
+
+            self._connection.execute(
+                "UPDATE analyses SET last_used = ? WHERE model = ? AND prompt_version = ? AND content_hash = ?",
+                (now, *key)
+            )
+
+        return json.loads(report), json.loads(usage) if usage else {}
+
+    def _put(self, key: Tuple[str, str, str], report: dict, usage: Optional[dict] = None) -> None:
+        now = time.time()
+        text = json.dumps(report)
+        size = len(text.encode("utf-8"))
+
+        with self._lock, self._connection:
+            previous = self._connection.execute(
+                "SELECT size FROM analyses WHERE model = ? AND prompt_version = ? AND content_hash = ?", key
+            ).fetchone()
+
+            self._connection.execute(
+                "INSERT OR REPLACE INTO analyses (model, prompt_version, content_hash, report, usage, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, text, json.dumps(usage or {}), size, now, now)
+            )
+
+            self._size += size - (previous[0] if previous else 0)
+
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Deletes least recently used entries until the cache is back under 90% of its limit."""
+        target = self.max_bytes * 0.9
+        rows = self._connection.execute(
+            "SELECT rowid, size FROM analyses ORDER BY last_used"
+        )
+        evicted = []
+
+        for rowid, size in rows:
+            if self._size <= target:
+                break
+
+            evicted.append((rowid,))
+            self._size -= size
+
+        self._connection.executemany("DELETE FROM analyses WHERE rowid = ?", evicted)
+        self.evictions += len(evicted)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,83 @@
+import uuid
+from typing import Dict, List
+from sqlalchemy import insert
+
+from ..extensions import db
+from ..models import File, Task, FileScore
+
+# Rows per INSERT statement.
+INSERT_BATCH_SIZE = 1000
+
+def _truncate(column, value: str) -> str:
+    length = column.type.length
+    return value[:length] if length and value else value
+
+def build_rows(repository_id: uuid.UUID, results: List[dict]) -> Dict[type, List[dict]]:
+    """
+    Builds the `File`, `Task` and `FileScore` rows of processed files. IDs are
+    generated here so tasks and scores can reference their file without a
+    round-trip per file.
+    """
+    rows = {File: [], Task: [], FileScore: []}
+    task_columns = Task.__table__.c
+
+    for result in results:
+        file_id = uuid.uuid4()
+        token_usage = result.get("token_usage") or {}
+
+        rows[File].append({
+            "id": file_id,
+            "path": result["file_path"],
+            "language": result.get("language"),
+            "token_count": result.get("token_count"),
+            "prompt_tokens": token_usage.get("prompt_tokens"),
+            "completion_tokens": token_usage.get("completion_tokens"),
+            "analysis_tier": result.get("analysis_tier"),
+            "analysis_model": result.get("analysis_model"),
+            "repository_id": repository_id,
+        })
+
+        for task in result.get("tasks") or []:
+            try:
+                rows[Task].append({
+                    "id": uuid.uuid4(),
+                    "title": _truncate(task_columns.title, task["title"]),
+                    "description": _truncate(task_columns.description, task["description"]),
+                    "category": _truncate(task_columns.category, task["category"]),
+                    "priority": _truncate(task_columns.priority, task["priority"]),
+                    "prompt": _truncate(task_columns.prompt, task["prompt"]),
+                    "file_id": file_id,
+                })
+            except KeyError as e:
+                print(f"Skipping invalid task for {result['file_path']}: missing {e}")
+
+        for score_kind, score in (result.get("scores") or {}).items():
+            rows[FileScore].append({
+                "id": uuid.uuid4(),
+                "file_id": file_id,
+                "scoreKind": score_kind,
+                "score": score,
+            })
+
+    return rows
+
+def persist_results(repository_id: uuid.UUID, results: List[dict]) -> Dict[str, int]:
+    """
+    Writes the rows of a batch of processed files with multi-row inserts in a
+    single transaction and returns the number of rows written per table.
+    """
+    rows = build_rows(repository_id, results)
+
+    try:
+        for model in (File, Task, FileScore):
+            model_rows = rows[model]
+
+            for start in range(0, len(model_rows), INSERT_BATCH_SIZE):
+                db.session.execute(insert(model), model_rows[start:start + INSERT_BATCH_SIZE])
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {model.__tablename__: len(model_rows) for model, model_rows in rows.items()}
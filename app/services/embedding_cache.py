@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import List, Optional
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./storage/cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# SQLite limits the number of bound parameters per statement.
+QUERY_BATCH_SIZE = 500
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+class EmbeddingCache:
+    """
+        Persistent cache of embedding vectors keyed by (model, content hash),
+        stored in SQLite. When the stored vectors exceed `max_bytes` the least
+        recently used entries are evicted.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, content_hash)
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+            self._size = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self._size,
+        }
+
+    async def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Returns the cached vector for each text, or None where it is not cached."""
+        return await asyncio.to_thread(self._get_many, model, texts)
+
+    async def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        await asyncio.to_thread(self._put_many, model, texts, vectors)
+
+    def _get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        hashes = [content_hash(text) for text in texts]
+        found = {}
+
+        with self._lock, self._connection:
+            for start in range(0, len(hashes), QUERY_BATCH_SIZE):
+                batch = list(set(hashes[start:start + QUERY_BATCH_SIZE]))
+                placeholders = ",".join("?" * len(batch))
+
+                rows = self._connection.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? AND content_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+
+                for hash_, vector in rows:
+                    found[hash_] = array("f", vector).tolist()
+
+                if rows:
+                    self._connection.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND content_hash IN ({placeholders})",
+                        [time.time(), model, *batch]
+                    )
+
+            results = [found.get(hash_) for hash_ in hashes]
+            hits = sum(1 for result in results if result is not None)
+
+            self.hits += hits
+            self.misses += len(results) - hits
+
+        return results
+
+    def _put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        now = time.time()
+        rows = []
+
+        for text, vector in zip(texts, vectors):
+            blob = array("f", vector).tobytes()
+            rows.append((model, content_hash(text), blob, len(blob), now))
+
+        with self._lock, self._connection:
+            for row in rows:
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO embeddings (model, content_hash, vector, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                    row
+                )
+
+                if cursor.rowcount:
+                    self._size += row[3]
+
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Deletes least recently used entries until the cache is back under 90% of its limit."""
+        target = self.max_bytes * 0.9
+        rows = self._connection.execute(
+            "SELECT rowid, size FROM embeddings ORDER BY last_used"
+        )
+        evicted = []
+
+        for rowid, size in rows:
+            if self._size <= target:
+                break
+
+            evicted.append((rowid,))
+            self._size -= size
+
+        self._connection.executemany("DELETE FROM embeddings WHERE rowid = ?", evicted)
+        self.evictions += len(evicted)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
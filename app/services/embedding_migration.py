@@ -0,0 +1,177 @@
+import asyncio
+import time
+import uuid
+from typing import Callable, Optional
+from flask import current_app
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import PointStruct
+
+from ..extensions import db
+from ..models import Job
+from .embedding_cache import EmbeddingCache
+from .embedding_profiles import EmbeddingProfile, reproject
+from .embeddings import BatchEmbedder
+from .repository_processsing import RepositoryProcessor
+from . import job_queue, qdrant_utils
+
+MIGRATE_EMBEDDINGS_JOB = "migrate_embeddings"
+
+REPROJECT = "reproject"
+REBUILD = "rebuild"
+
+# Points read from the old collection per scroll request.
+SCROLL_BATCH_SIZE = 256
+
+# Scrolled batches being converted and written at the same time.
+MIGRATION_CONCURRENCY = 4
+
+async def migrate_collection(
+    name: str,
+    source: EmbeddingProfile,
+    target: EmbeddingProfile,
+    settings: qdrant_utils.CollectionSettings,
+    rebuild: bool = False,
+    embedder: Optional[BatchEmbedder] = None,
+    qdrant_client: Optional[AsyncQdrantClient] = None,
+    on_progress: Optional[Callable[[dict], None]] = None
+) -> dict:
+    """
+    Copies every point of a collection into a new collection embedded with
+    `target`, then swaps it in under the same name. Vectors are re-projected
+    when `source` can be shortened into `target`, which needs no API calls;
+    otherwise, or when `rebuild` is set, each chunk is embedded again from
+    the text in its payload. Point IDs and payloads are kept, so incremental
+    indexing carries on from the migrated collection.
+    """
+    mode = REPROJECT if source.can_reproject_to(target) and not rebuild else REBUILD
+    qdrant_client = qdrant_client or qdrant_utils.get_qdrant_client()
+
+    if mode == REBUILD and embedder is None:
+        raise ValueError(f"Migrating {name} from {source} to {target} requires embedding again")
+
+    started = time.perf_counter()
+    collection_name = f"{name}_{target.dimensions}_{uuid.uuid4().hex[:8]}"
+
+    print(f"Migrating {name} from {source} to {target} by {mode} into {collection_name}")
+
+    await qdrant_utils.create_collection(collection_name, settings, target.dimensions, qdrant_client)
+    await qdrant_utils.ensure_payload_indexes(collection_name, qdrant_client)
+
+    writer = qdrant_utils.QdrantUpsertWriter(collection_name, qdrant_client)
+    slots = asyncio.Semaphore(MIGRATION_CONCURRENCY)
+    migrated = 0
+
+    async def copy(points) -> None:
+        nonlocal migrated
+
+        try:
+            if mode == REPROJECT:
+                vectors = [reproject(point.vector, target.dimensions) for point in points]
+            else:
+                vectors = await embedder.embed([point.payload["chunk"] for point in points])
+
+            await writer.write(
+                PointStruct(id=point.id, vector=vector, payload=point.payload)
+                for point, vector in zip(points, vectors)
+            )
+        finally:
+            slots.release()
+
+        migrated += len(points)
+
+        if on_progress is not None:
+            on_progress({"stage": "migrating", "mode": mode, "points_migrated": migrated})
+
+    try:
+        async with asyncio.TaskGroup() as group:
+            offset = None
+
+            while True:
+                points, offset = await qdrant_client.scroll(
+                    name,
+                    limit=SCROLL_BATCH_SIZE,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=mode == REPROJECT
+                )
+
+                await slots.acquire()
+                group.create_task(copy(points))
+
+                if offset is None:
+                    break
+
+        await writer.close()
+    except BaseException:
+        await qdrant_client.delete_collection(collection_name)
+        raise
+
+    await qdrant_utils.swap_collection(name, collection_name, qdrant_client)
+
+    return {
+        "mode": mode,
+        "source": str(source),
+        "target": str(target),
+        "collection": collection_name,
+        "points": migrated,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+def enqueue_migration(name: str, profile: str, rebuild: bool = False) -> Job:
+    """Queues the migration of a repository collection to another embedding profile."""
+
+    repository = RepositoryProcessor.find_repository(name)
+
+    if repository is None:
+        raise ValueError(f"Repository {name} not found")
+
+    EmbeddingProfile.parse(profile)
+
+    # Keyed like setup jobs, so a repository is never indexed while it is migrated.
+    return job_queue.enqueue(MIGRATE_EMBEDDINGS_JOB, {
+        'repository': repository.name,
+        'profile': profile,
+        'rebuild': rebuild,
+    }, key=repository.name)
+
+async def run_migration(payload: dict, on_progress: Callable[[dict], None]) -> dict:
+    """Job handler that migrates a repository collection and records its new embedding profile."""
+
+    repository = RepositoryProcessor.find_repository(payload['repository'])
+
+    if repository is None:
+        raise ValueError(f"Repository {payload['repository']} not found")
+
+    config = current_app.config
+    source = EmbeddingProfile.of_repository(repository) or EmbeddingProfile()
+    target = EmbeddingProfile.parse(payload['profile'])
+
+    if source == target and not payload.get('rebuild'):
+        return {'repository': repository.name, 'stats': {'mode': None, 'source': str(source), 'target': str(target)}}
+
+    embedding_cache = EmbeddingCache()
+    embedder = BatchEmbedder(
+        cache=embedding_cache,
+        model=target.model,
+        dimensions=target.request_dimensions,
+        max_in_flight=config['EMBEDDING_CONCURRENCY']
+    )
+
+    try:
+        stats = await migrate_collection(
+            qdrant_utils.make_collection_name(repository.name),
+            source,
+            target,
+            qdrant_utils.CollectionSettings.from_config(config),
+            rebuild=payload.get('rebuild', False),
+            embedder=embedder,
+            on_progress=on_progress
+        )
+    finally:
+        embedding_cache.close()
+        await qdrant_utils.close_qdrant_client()
+
+    target.record(repository)
+    db.session.commit()
+
+    return {'repository': repository.name, 'stats': stats}
@@ -0,0 +1,93 @@
+import math
+from typing import List, Mapping, Optional
+
+from ..models import Repository
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Size of the vectors each model returns when no `dimensions` are requested.
+MODEL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# Models whose vectors can be shortened: the API accepts `dimensions` for
+# them, and a prefix of one of their vectors, normalized again, is what the
+# API returns for fewer dimensions.
+SHORTENABLE_MODELS = {"text-embedding-3-small", "text-embedding-3-large"}
+
+class EmbeddingProfile:
+    """
+        Model and vector size a collection is embedded with. Fewer dimensions
+        take less storage and make searches faster, at some cost in recall.
+        Written as `model:dimensions`, e.g. `text-embedding-3-small:512`.
+    """
+
+    def __init__(self, model: str = EMBEDDING_MODEL, dimensions: Optional[int] = None):
+        if model not in MODEL_DIMENSIONS:
+            raise ValueError(f"Unknown embedding model '{model}'")
+
+        native = MODEL_DIMENSIONS[model]
+        dimensions = dimensions or native
+
+        if not 1 <= dimensions <= native:
+            raise ValueError(f"{model} embeds into 1 to {native} dimensions, not {dimensions}")
+
+        if dimensions != native and model not in SHORTENABLE_MODELS:
+            raise ValueError(f"{model} does not support shortened embeddings")
+
+        self.model = model
+        self.dimensions = dimensions
+
+    @classmethod
+    def parse(cls, text: str) -> "EmbeddingProfile":
+        model, _, dimensions = text.strip().partition(":")
+        return cls(model, int(dimensions) if dimensions else None)
+
+    @classmethod
+    def from_config(cls, config: Mapping) -> "EmbeddingProfile":
+        return cls.parse(config["EMBEDDING_PROFILE"])
+
+    @classmethod
+    def of_repository(cls, repository: Repository) -> Optional["EmbeddingProfile"]:
+        """Returns the profile the collection of a repository was embedded with, if it was recorded."""
+        if repository.embedding_model is None:
+            return None
+
+        return cls(repository.embedding_model, repository.embedding_dimensions)
+
+    @property
+    def shortened(self) -> bool:
+        return self.dimensions != MODEL_DIMENSIONS[self.model]
+
+    @property
+    def request_dimensions(self) -> Optional[int]:
+        """The `dimensions` to request from the API, None for the model's own size."""
+        return self.dimensions if self.shortened else None
+
+    def can_reproject_to(self, target: "EmbeddingProfile") -> bool:
+        """Whether vectors of this profile can be shortened into `target` without embedding again."""
+        return target.model == self.model and self.model in SHORTENABLE_MODELS and target.dimensions <= self.dimensions
+
+    def record(self, repository: Repository) -> None:
+        repository.embedding_model = self.model
+        repository.embedding_dimensions = self.dimensions
+
+    def __eq__(self, other):
+        return isinstance(other, EmbeddingProfile) and (self.model, self.dimensions) == (other.model, other.dimensions)
+
+    def __hash__(self):
+        return hash((self.model, self.dimensions))
+
+    def __str__(self):
+        return f"{self.model}:{self.dimensions}"
+
+    def __repr__(self):
+        return f"EmbeddingProfile('{self}')"
+
+def reproject(vector: List[float], dimensions: int) -> List[float]:
+    """Shortens a vector of a shortenable model to its first `dimensions`, normalized to unit length."""
+    prefix = vector[:dimensions]
+    norm = math.sqrt(sum(value * value for value in prefix)) or 1.0
+    return [value / norm for value in prefix]
@@ -0,0 +1,172 @@
+import asyncio
+from typing import List, Optional
+from openai import AsyncOpenAI
+
+from .embedding_cache import EmbeddingCache
+from .embedding_profiles import EMBEDDING_MODEL
+from .rate_limits import RateLimiter, get_rate_limiter
+from .token_counting import count_tokens
+
+# Limits of the OpenAI embeddings endpoint for a single request.
+MAX_BATCH_INPUTS = 2048
+MAX_BATCH_TOKENS = 300_000
+
+class PendingEmbedding:
+    """A text waiting to be sent, with the future its vector is delivered to."""
+
+    def __init__(self, text: str, token_count: int, future: asyncio.Future):
+        self.text = text
+        self.token_count = token_count
+        self.future = future
+
+class BatchEmbedder:
+    """
+        Collects texts from many concurrent callers into embedding requests
+        sized to the provider limits and sends them with a bounded number of
+        requests in flight, scheduled and retried by the model's rate limiter.
+        When a cache is given, texts already embedded with the same model and
+        `dimensions` are served from it and never sent.
+    """
+
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        cache: Optional[EmbeddingCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        model: str = EMBEDDING_MODEL,
+        dimensions: Optional[int] = None,
+        max_batch_inputs: int = MAX_BATCH_INPUTS,
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+        max_in_flight: int = 4,
+        linger: float = 0.05,
+    ):
+        # Retries are left to the rate limiter, which also reads the rate limit headers.
+        self.client = client or AsyncOpenAI(max_retries=0)
+        self.cache = cache
+        self.model = model
+        self.dimensions = dimensions
+        # Vectors of different sizes are cached apart.
+        self.cache_key = model if dimensions is None else f"{model}:{dimensions}"
+        self.rate_limiter = rate_limiter or get_rate_limiter(model)
+        self.max_batch_inputs = max_batch_inputs
+        self.max_batch_tokens = max_batch_tokens
+        self.linger = linger
+
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._pending: List[PendingEmbedding] = []
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._requests = set()
+
+        self.request_count = 0
+        self.input_count = 0
+        self.token_count = 0
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Returns one vector per text, in the order the texts were given."""
+        if not texts:
+            return []
+
+        if self.cache is not None:
+            vectors = await self.cache.get_many(self.cache_key, texts)
+        else:
+            vectors = [None] * len(texts)
+
+        missing = [index for index, vector in enumerate(vectors) if vector is None]
+
+        if not missing:
+            return vectors
+
+        loop = asyncio.get_running_loop()
+        futures = []
+
+        for index in missing:
+            future = loop.create_future()
+            self._enqueue(PendingEmbedding(texts[index], count_tokens(texts[index], self.model), future))
+            futures.append(future)
+
+        embedded = await asyncio.gather(*futures)
+
+        for index, vector in zip(missing, embedded):
+            vectors[index] = vector
+
+        if self.cache is not None:
+            await self.cache.put_many(self.cache_key, [texts[index] for index in missing], embedded)
+
+        return vectors
+
+    async def flush(self) -> None:
+        """Sends whatever is pending and waits for every request in flight."""
+        self._send_pending()
+
+        if self._requests:
+            await asyncio.gather(*self._requests, return_exceptions=True)
+
+    def _enqueue(self, pending: PendingEmbedding) -> None:
+        if self._pending and (
+            len(self._pending) >= self.max_batch_inputs
+            or self._pending_tokens + pending.token_count > self.max_batch_tokens
+        ):
+            self._send_pending()
+
+        self._pending.append(pending)
+        self._pending_tokens += pending.token_count
+
+        if len(self._pending) >= self.max_batch_inputs:
+            self._send_pending()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.linger, self._send_pending)
+
+    def _send_pending(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._pending:
+            return
+
+        batch = self._pending
+        self._pending = []
+        self._pending_tokens = 0
+
+        request = asyncio.ensure_future(self._send(batch))
+        self._requests.add(request)
+        request.add_done_callback(self._requests.discard)
+
+    async def _request(self, batch: List[PendingEmbedding]):
+        options = {} if self.dimensions is None else {"dimensions": self.dimensions}
+
+        raw_response = await self.client.embeddings.with_raw_response.create(
+            input=[pending.text for pending in batch],
+            model=self.model,
+            **options
+        )
+
+        return raw_response.parse(), raw_response.headers
+
+    async def _send(self, batch: List[PendingEmbedding]) -> None:
+        async with self._semaphore:
+            try:
+                response = await self.rate_limiter.run(
+                    lambda: self._request(batch),
+                    tokens=sum(pending.token_count for pending in batch)
+                )
+            except Exception as e:
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                return
+
+        self.request_count += 1
+        self.input_count += len(batch)
+        self.token_count += sum(pending.token_count for pending in batch)
+
+        for item in response.data:
+            pending = batch[item.index]
+
+            if not pending.future.done():
+                pending.future.set_result(item.embedding)
+
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_exception(ValueError("Embedding response is missing an input"))
@@ -0,0 +1,57 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Optional
+
+class EventLoopLagMonitor:
+    """
+        Measures how late the event loop wakes up a task sleeping for
+        `interval` seconds. Lag is time the loop spent running something
+        else, such as CPU-bound work, during which no I/O of any other task
+        made progress.
+
+        Totals cover the whole run, while the p99 is of the last `window`
+        samples, so stats stay cheap to report however long the run.
+    """
+
+    def __init__(self, interval: float = 0.05, window: int = 1_200):
+        self.interval = interval
+        self._lags: Deque[float] = deque(maxlen=window)
+        self._samples = 0
+        self._total = 0.0
+        self._max = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._monitor())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _monitor(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+
+            self._lags.append(lag)
+            self._samples += 1
+            self._total += lag
+            self._max = max(self._max, lag)
+
+    def stats(self) -> dict:
+        if not self._samples:
+            return {"samples": 0, "mean_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0, "stalled_seconds": 0.0}
+
+        lags = sorted(self._lags)
+
+        return {
+            "samples": self._samples,
+            "mean_ms": round(self._total / self._samples * 1000, 2),
+            "p99_ms": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000, 2),
+            "max_ms": round(self._max * 1000, 2),
+            "stalled_seconds": round(self._total, 3),
+        }
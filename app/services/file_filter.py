@@ -0,0 +1,215 @@
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import pathspec
+
+# Directories that never contain first-party source code.
+IGNORED_DIRECTORIES = {
+    ".git", ".hg", ".svn", ".idea", ".vscode", ".venv", "venv", ".tox", ".nox", ".mypy_cache",
+    ".pytest_cache", "__pycache__", "node_modules", "bower_components", "jspm_packages", "vendor",
+    "third_party", "Pods", "Carthage", ".next", ".nuxt", ".gradle", ".terraform", ".cache",
+    "site-packages",
+}
+
+# Build output directories, ignored only at the root of the repository: deeper
+# down these are common package names too (e.g. `src/build/` or a Go `target`
+# package). Nested build output is usually listed in a `.gitignore`.
+ROOT_BUILD_DIRECTORIES = {"dist", "build", "out", "target", "coverage"}
+
+# Extensions of files that are always binary, skipped without reading them.
+BINARY_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".icns", ".webp", ".tiff", ".psd",
+    ".mp3", ".mp4", ".wav", ".ogg", ".flac", ".avi", ".mov", ".webm",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".tar", ".jar", ".war", ".whl", ".egg",
+    ".exe", ".dll", ".so", ".dylib", ".a", ".o", ".obj", ".lib", ".class", ".pyc", ".pyo", ".wasm",
+    ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx",
+    ".ttf", ".otf", ".woff", ".woff2", ".eot",
+    ".sqlite", ".sqlite3", ".db", ".bin", ".dat", ".pkl", ".npy", ".npz", ".parquet",
+}
+
+# File names of lockfiles and other generated files, after linguist's generated.rb.
+GENERATED_FILE_NAMES = {
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "bun.lockb",
+    "composer.lock", "Gemfile.lock", "Cargo.lock", "poetry.lock", "Pipfile.lock", "go.sum",
+    "mix.lock", "pubspec.lock", "Podfile.lock", "flake.lock", "packages.lock.json",
+}
+
+GENERATED_FILE_PATTERN = re.compile(
+    r"(\.min\.(js|css)|-min\.(js|css)|\.bundle\.js|\.map|\.pb\.go|_pb2(_grpc)?\.pyi?|\.pb\.(cc|h)"
+    r"|\.designer\.(cs|vb)|\.g\.(cs|dart)|\.generated\.\w+|\.freezed\.dart)$"
+)
+
+GENERATED_CONTENT_PATTERN = re.compile(
+    r"(Code generated .* DO NOT EDIT|@generated|<auto-generated|This file (is|was) (automatically|auto-)generated"
+    r"|Generated by (the protocol buffer compiler|Django|ANTLR|Haxe)|DO NOT EDIT! GENERATED)",
+    re.IGNORECASE
+)
+
+# Bytes read from the start of a file to sniff its content.
+SNIFF_SIZE = 8192
+
+# Lines longer than this on average mark a file as minified.
+MINIFIED_LINE_LENGTH = 500
+
+TEXT_CHARACTERS = bytes(range(32, 127)) + b"\n\r\t\f\b"
+
+class RepositoryFileFilter:
+    """
+        Decides which files of a repository are worth processing. Applies the
+        repository's `.gitignore` files and extra ignore globs, prunes
+        dependency and build directories, and skips binary, generated and
+        minified files. Counts of skipped files are kept per reason.
+    """
+
+    def __init__(self, repo_path: str, ignore_globs: Iterable[str] = ()):
+        self.repo_path = repo_path.rstrip(os.sep)
+        self._ignore_spec = pathspec.GitIgnoreSpec.from_lines(list(ignore_globs))
+        self._specs: Dict[str, List[Tuple[str, pathspec.GitIgnoreSpec]]] = {}
+        self.skipped: Counter = Counter()
+
+    def _specs_for(self, directory: str) -> List[Tuple[str, pathspec.GitIgnoreSpec]]:
+        """Returns the `.gitignore` rules that apply in a directory, with the directory each is relative to."""
+        if directory in self._specs:
+            return self._specs[directory]
+
+        if directory == self.repo_path or not directory.startswith(self.repo_path):
+            specs = []
+        else:
+            specs = list(self._specs_for(os.path.dirname(directory)))
+
+        gitignore_path = os.path.join(directory, ".gitignore")
+
+        if os.path.isfile(gitignore_path):
+            with open(gitignore_path, "r", encoding="utf-8", errors="ignore") as gitignore_file:
+                specs.append((directory, pathspec.GitIgnoreSpec.from_lines(gitignore_file)))
+
+        self._specs[directory] = specs
+
+        return specs
+
+    def _is_ignored(self, path: str, is_directory: bool) -> bool:
+        suffix = "/" if is_directory else ""
+        relative_path = os.path.relpath(path, self.repo_path).replace(os.sep, "/")
+
+        if self._ignore_spec.match_file(relative_path + suffix):
+            return True
+
+        for base, spec in self._specs_for(os.path.dirname(path)):
+            if spec.match_file(os.path.relpath(path, base).replace(os.sep, "/") + suffix):
+                return True
+
+        return False
+
+    def _skip_directory(self, path: str) -> Optional[str]:
+        name = os.path.basename(path)
+
+        if name in IGNORED_DIRECTORIES:
+            return "ignored_directory"
+
+        if name in ROOT_BUILD_DIRECTORIES and os.path.dirname(path) == self.repo_path:
+            return "ignored_directory"
+
+        if self._is_ignored(path, is_directory=True):
+            return "ignored"
+
+        return None
+
+    def _skip_file(self, path: str) -> Optional[str]:
+        file_name = os.path.basename(path)
+
+        if self._is_ignored(path, is_directory=False):
+            return "ignored"
+
+        if os.path.splitext(file_name)[1].lower() in BINARY_EXTENSIONS:
+            return "binary"
+
+        if file_name in GENERATED_FILE_NAMES or GENERATED_FILE_PATTERN.search(file_name):
+            return "generated"
+
+        if os.path.islink(path) or not os.path.isfile(path):
+            return "not_a_file"
+
+        try:
+            with open(path, "rb") as file:
+                head = file.read(SNIFF_SIZE)
+        except OSError:
+            return "unreadable"
+
+        if not head:
+            return "empty"
+
+        if b"\0" in head:
+            return "binary"
+
+        if len(head.translate(None, TEXT_CHARACTERS)) / len(head) > 0.3:
+            # Non-ASCII UTF-8 text has many high bytes too, so only call it binary
+            # when it does not decode. The sniff may end inside a multi-byte character.
+            try:
+                head.decode("utf-8")
+            except UnicodeDecodeError as e:
+                if e.start < len(head) - 3:
+                    return "binary"
+
+        text = head.decode("utf-8", errors="ignore")
+
+        if GENERATED_CONTENT_PATTERN.search(text[:1024]):
+            return "generated"
+
+        lines = text.splitlines()
+
+        if len(head) == SNIFF_SIZE and len(lines) > 0 and len(text) / len(lines) > MINIFIED_LINE_LENGTH:
+            return "minified"
+
+        return None
+
+    def accepts(self, path: str) -> bool:
+        """Returns whether a single file should be processed, checking its parent directories too."""
+        directory = os.path.dirname(path)
+
+        while directory.startswith(self.repo_path) and directory != self.repo_path:
+            reason = self._skip_directory(directory)
+
+            if reason:
+                self.skipped[reason] += 1
+                return False
+
+            directory = os.path.dirname(directory)
+
+        reason = self._skip_file(path)
+
+        if reason:
+            self.skipped[reason] += 1
+            return False
+
+        return True
+
+    def filter(self, paths: Iterable[str]) -> Iterator[str]:
+        return (path for path in paths if self.accepts(path))
+
+    def walk(self) -> Iterator[str]:
+        """Yields the files to process, never entering ignored directories."""
+        for root, directories, files in os.walk(self.repo_path, topdown=True):
+            kept = []
+
+            for directory in directories:
+                reason = self._skip_directory(os.path.join(root, directory))
+
+                if reason:
+                    self.skipped[reason] += 1
+                else:
+                    kept.append(directory)
+
+            directories[:] = kept
+
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                reason = self._skip_file(path)
+
+                if reason:
+                    self.skipped[reason] += 1
+                else:
+                    yield path
+
+    def stats(self) -> dict:
+        return dict(self.skipped)
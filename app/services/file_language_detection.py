@@ -1,18 +1,189 @@
 import os
+import re
 import json
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
-def detect_language(file_path: str) -> str:
-    file_extension = os.path.splitext(file_path)[1]
+LANGUAGE_MAP_PATH = "./language_map.json"
+UNKNOWN_LANGUAGE = "unknown"
 
-    with open("./language_map.json", "r") as language_map_file:
-        language_map = json.load(language_map_file)
-        language_results = list(map(
-                lambda file_args: file_args[0] if file_extension in list(map(
-                    lambda i: i, file_args[1].get("extensions", []))) else None, language_map.items()))
-        language_results = list(filter(None, language_results))
+# Content heuristics for extensions shared by several languages, modelled on
+# linguist's heuristics.yml. Rules are tried in order and the first language
+# whose pattern matches the file content wins.
+HEURISTICS: Dict[str, List[Tuple[str, re.Pattern]]] = {
+    ".h": [
+        ("Objective-C", re.compile(r"^\s*(@(interface|class|protocol|property|end|implementation)\b|#import\s)", re.M)),
+        ("C++", re.compile(r"^\s*(template\s*<|namespace\s+\w+|class\s+\w+\s*(:|\{)|#include\s*<(iostream|string|vector|map|memory|cstdint)>|using\s+namespace\s)", re.M)),
+    ],
+    ".m": [
+        ("Objective-C", re.compile(r"^\s*(@(interface|class|protocol|property|end|implementation|synthesize)\b|#import\s)", re.M)),
+        ("Mercury", re.compile(r":-\s*module\s*\(?\w", re.M)),
+        ("MATLAB", re.compile(r"^\s*(function\s+[\w\[\], ]*=?\s*\w+\s*\(|%[ %{]|end\s*$)", re.M)),
+        ("Mathematica", re.compile(r"^\s*\(\*|\[\[|\w+\[[^\]]*\]\s*:?=", re.M)),
+    ],
+    ".pl": [
+        ("Prolog", re.compile(r"^[^#]*:-", re.M)),
+        ("Raku", re.compile(r"^\s*(use\s+v6\b|my\s+class\b|(unit\s+)?module\s+\w+;|grammar\s+\w+)", re.M)),
+        ("Perl", re.compile(r"\buse\s+(strict|warnings)\b|^\s*(my|our)\s+[$@%]|^\s*sub\s+\w+", re.M)),
+    ],
+    ".es": [
+        ("Erlang", re.compile(r"^\s*(%%|main\s*\(.*?\)\s*->)", re.M)),
+    ],
+    ".ts": [
+        ("XML", re.compile(r"<TS\b")),
+    ],
+    ".md": [
+        ("GCC Machine Description", re.compile(r"^\s*\(define_(insn|expand|peephole|constants|split)", re.M)),
+    ],
+    ".cs": [
+        ("Smalltalk", re.compile(r"!\s*\w+\s+(methodsFor|subclass):")),
+    ],
+    ".r": [
+        ("Rebol", re.compile(r"\bRebol\s*\[", re.I)),
+    ],
+    ".v": [
+        ("Verilog", re.compile(r"^\s*(module\s+\w+\s*[(#;]|always\s*@|endmodule\b)", re.M)),
+        ("Coq", re.compile(r"^\s*(Require\s+Import|Theorem|Lemma|Proof\.|Inductive|Definition)\b", re.M)),
+    ],
+    ".pp": [
+        ("Puppet", re.compile(r"^\s*(class|define|node)\s+[\w:]+.*\{|=>", re.M)),
+    ],
+    ".inc": [
+        ("PHP", re.compile(r"<\?(php|=)?")),
+        ("SourcePawn", re.compile(r"^\s*#(pragma\s+semicolon|include\s+<sourcemod>)", re.M)),
+        ("HTML", re.compile(r"<(html|div|span|table|p)\b", re.I)),
+    ],
+    ".sql": [
+        ("PLpgSQL", re.compile(r"\$\$|\bLANGUAGE\s+'?plpgsql", re.I)),
+        ("PLSQL", re.compile(r"\b(CREATE\s+OR\s+REPLACE\s+PACKAGE|PRAGMA\s+\w+|DBMS_\w+|EXCEPTION\s+WHEN)\b", re.I)),
+        ("TSQL", re.compile(r"^\s*GO\s*$|\bBEGIN\s+TRAN(SACTION)?\b|@@\w+", re.I | re.M)),
+    ],
+}
 
-        if len(language_results) == 0:
-            return "unknown"
-        else:
-            return language_results[0]
+# Preferred language for shared extensions when no heuristic matches.
+DEFAULT_LANGUAGES: Dict[str, str] = {
+    ".es": "JavaScript",
+    ".inc": "PHP",
+    ".m": "Objective-C",
+    ".md": "Markdown",
+    ".pl": "Perl",
+    ".rs": "Rust",
+    ".sql": "SQL",
+    ".v": "Verilog",
+}
 
+SHEBANG_PATTERN = re.compile(r"^#!\s*(?:/usr/bin/env\s+(?:-\S+\s+)*)?(?:\S*/)?(\S+)")
+
+
+class LanguageDetector:
+    """
+        Detects the language of a file from its name, extension and, when
+        ambiguous, its content. All lookups are done against indexes built
+        once from the linguist language map.
+    """
+
+    def __init__(self, language_map: dict):
+        self.language_map = language_map
+        self._filenames: Dict[str, str] = {}
+        self._extensions: Dict[str, List[str]] = {}
+        self._interpreters: Dict[str, str] = {}
+        self._max_extension_parts = 1
+
+        for language, attributes in language_map.items():
+            for file_name in attributes.get("filenames", []):
+                self._filenames.setdefault(file_name, language)
+
+            for extension in attributes.get("extensions", []):
+                extension = extension.lower()
+                self._extensions.setdefault(extension, []).append(language)
+                self._max_extension_parts = max(self._max_extension_parts, extension.count("."))
+
+            for interpreter in attributes.get("interpreters", []):
+                self._interpreters.setdefault(interpreter, language)
+
+        for extension, languages in self._extensions.items():
+            languages.sort(key=lambda language: self._preference(language, extension))
+
+    @classmethod
+    def from_file(cls, path: str = LANGUAGE_MAP_PATH) -> "LanguageDetector":
+        with open(path, "r") as language_map_file:
+            return cls(json.load(language_map_file))
+
+    def _preference(self, language: str, extension: str) -> tuple:
+        """
+        Orders candidates for an extension: the configured default first, then
+        languages whose primary extension it is, then programming languages,
+        then alphabetical.
+        """
+        attributes = self.language_map[language]
+        extensions = attributes.get("extensions", [])
+        is_primary = bool(extensions) and extensions[0].lower() == extension
+
+        return (DEFAULT_LANGUAGES.get(extension) != language, not is_primary, attributes.get("type") != "programming", language)
+
+    def _candidate_extensions(self, file_name: str):
+        """Yields the extensions of a file name from the longest compound one to the shortest."""
+        lowered = file_name.lower()
+        dots = [index for index, character in enumerate(lowered) if character == "." and index > 0]
+
+        for index in dots[-self._max_extension_parts:]:
+            yield lowered[index:]
+
+    def _disambiguate(self, extension: str, candidates: List[str], content: Optional[str]) -> str:
+        if content is not None and len(candidates) > 1:
+            for language, pattern in HEURISTICS.get(extension, []):
+                if language in candidates and pattern.search(content):
+                    return language
+
+        return candidates[0]
+
+    def _detect_from_shebang(self, content: Optional[str]) -> Optional[str]:
+        if not content or not content.startswith("#!"):
+            return None
+
+        match = SHEBANG_PATTERN.match(content)
+
+        if match is None:
+            return None
+
+        interpreter = match.group(1)
+
+        if interpreter in self._interpreters:
+            return self._interpreters[interpreter]
+
+        # python3.12 -> python3 -> python
+        interpreter = re.sub(r"[\d.]+$", "", interpreter)
+        return self._interpreters.get(interpreter)
+
+    def detect(self, file_path: str, content: Optional[str] = None) -> str:
+        """
+        Returns the language of a file, or `unknown` if it cannot be detected.
+        Passing the file content enables shebang detection and the heuristics
+        used to resolve extensions shared by several languages.
+        """
+        file_name = os.path.basename(file_path)
+
+        if file_name in self._filenames:
+            return self._filenames[file_name]
+
+        for extension in self._candidate_extensions(file_name):
+            candidates = self._extensions.get(extension)
+
+            if candidates:
+                return self._disambiguate(extension, candidates, content)
+
+        return self._detect_from_shebang(content) or UNKNOWN_LANGUAGE
+
+    def get_language(self, language: str) -> dict:
+        """Returns the language map entry for a language."""
+        return self.language_map.get(language, {})
+
+
+@lru_cache(maxsize=None)
+def get_language_detector(path: str = LANGUAGE_MAP_PATH) -> LanguageDetector:
+    """Returns the process wide detector, loading the language map on first use."""
+    return LanguageDetector.from_file(path)
+
+
+def detect_language(file_path: str, content: Optional[str] = None) -> str:
+    return get_language_detector().detect(file_path, content)
@@ -0,0 +1,175 @@
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import and_, exists, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from ..extensions import db
+from ..models import Job
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Payload keys that are dropped once a job is finished, so credentials only
+# live in the database while a worker still needs them.
+SECRET_PAYLOAD_KEYS = {"github_token"}
+
+# Kind of the rows through which a running job holds another key, e.g. a
+# batch holding each repository it sets up. Holds are never claimed.
+KEY_HOLD = "key_hold"
+
+# ID of the job the current handler runs, set by the worker running it.
+current_job_id: ContextVar[Optional[uuid.UUID]] = ContextVar("current_job_id", default=None)
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def enqueue(kind: str, payload: dict, key: Optional[str] = None) -> Job:
+    """
+    Adds a job to the queue. Jobs sharing a `key`, e.g. setups of the same
+    repository, are never run at the same time.
+    """
+    job = Job(kind=kind, payload=payload, status=QUEUED, created_at=_now(), key=key)
+
+    db.session.add(job)
+    db.session.commit()
+
+    return job
+
+def get_job(job_id: str) -> Optional[Job]:
+    try:
+        return db.session.get(Job, uuid.UUID(job_id))
+    except ValueError:
+        return None
+
+def claim_next(stale_after: Optional[float] = None) -> Optional[Job]:
+    """
+    Marks the oldest queued job as running and returns it, or returns None
+    when the queue is empty. Jobs whose key is held by a running job wait
+    for it to finish, or to be claimed again once stale. A running job that
+    has not reported progress nor a heartbeat for `stale_after` seconds is
+    assumed to have
+    lost its worker and is claimed again, resuming from its checkpoints. On
+    Postgres the candidate row is locked with `SKIP LOCKED` so concurrent
+    workers pick different jobs; the status check in the update keeps the
+    claim atomic on databases without row locks, and the unique index on
+    the keys of running jobs stops two workers claiming different jobs of
+    the same key at once.
+    """
+    now = _now()
+    claimable = Job.status == QUEUED
+    running = aliased(Job)
+
+    if stale_after is not None:
+        stale_before = now - timedelta(seconds=stale_after)
+        claimable = or_(claimable, and_(Job.status == RUNNING, Job.kind != KEY_HOLD, Job.updated_at < stale_before))
+
+        # Holds whose holder stopped sending heartbeats release their keys.
+        db.session.execute(
+            update(Job)
+            .where(Job.kind == KEY_HOLD, Job.status == RUNNING, Job.updated_at < stale_before)
+            .values(status=FAILED, error="The holder stopped sending heartbeats", updated_at=now, finished_at=now)
+        )
+
+    key_is_running = exists().where(running.key == Job.key, running.id != Job.id, running.status == RUNNING)
+
+    job_id = db.session.execute(
+        select(Job.id)
+        .where(claimable, ~key_is_running)
+        .order_by(Job.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).scalar()
+
+    if job_id is None:
+        db.session.commit()
+        return None
+
+    try:
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, claimable, ~key_is_running)
+            .values(status=RUNNING, started_at=now, updated_at=now)
+        )
+        db.session.commit()
+    except IntegrityError:
+        # Another worker claimed a job of the same key first.
+        db.session.rollback()
+        return None
+
+    if claimed.rowcount != 1:
+        return None
+
+    return db.session.get(Job, job_id, populate_existing=True)
+
+def update_progress(job_id: uuid.UUID, progress: dict) -> None:
+    db.session.execute(update(Job).where(Job.id == job_id).values(progress=progress, updated_at=_now()))
+    db.session.commit()
+
+def heartbeat(job_id: uuid.UUID) -> None:
+    """Marks a running job and the keys it holds as alive without changing its progress."""
+    db.session.execute(
+        update(Job)
+        .where(or_(Job.id == job_id, Job.holder_id == job_id), Job.status == RUNNING)
+        .values(updated_at=_now())
+    )
+    db.session.commit()
+
+def hold(key: str, holder_id: Optional[uuid.UUID]) -> Optional[Job]:
+    """
+    Takes `key` for part of the work of a running job, so that no job of the
+    key runs until the hold is released, and returns the hold, or returns
+    None when a job of the key is running. Holds are kept alive by the
+    heartbeat of their holder and released when it finishes.
+    """
+    now = _now()
+    job = Job(kind=KEY_HOLD, payload={}, status=RUNNING, created_at=now, key=key)
+    job.holder_id = holder_id
+    job.started_at = now
+
+    # A savepoint, so losing the key does not roll back the rest of the session.
+    try:
+        with db.session.begin_nested():
+            db.session.add(job)
+    except IntegrityError:
+        job = None
+
+    # Also when the key is taken, so the transaction is not left open while the caller waits.
+    db.session.commit()
+
+    return job
+
+def release(hold: Job) -> None:
+    now = _now()
+
+    db.session.execute(
+        update(Job).where(Job.id == hold.id, Job.status == RUNNING).values(status=SUCCEEDED, updated_at=now, finished_at=now)
+    )
+    db.session.commit()
+
+def _finish(job_id: uuid.UUID, status: str, result: Optional[dict] = None, error: Optional[str] = None) -> None:
+    job = db.session.get(Job, job_id, populate_existing=True)
+    now = _now()
+
+    job.status = status
+    job.result = result
+    job.error = error[:Job.__table__.c.error.type.length] if error else None
+    job.payload = {key: value for key, value in job.payload.items() if key not in SECRET_PAYLOAD_KEYS}
+    job.updated_at = now
+    job.finished_at = now
+
+    db.session.execute(
+        update(Job).where(Job.holder_id == job_id, Job.status == RUNNING).values(status=SUCCEEDED, updated_at=now, finished_at=now)
+    )
+
+    db.session.commit()
+
+def complete(job_id: uuid.UUID, result: dict) -> None:
+    _finish(job_id, SUCCEEDED, result=result)
+
+def fail(job_id: uuid.UUID, error: str) -> None:
+    _finish(job_id, FAILED, error=error)
@@ -0,0 +1,24 @@
+from flask import Response, jsonify
+
+from . import job_queue
+
+def get_job(job_id: str) -> tuple[Response, int]:
+    """Returns the status, progress and result of a background job."""
+
+    job = job_queue.get_job(job_id)
+
+    if job is None:
+        return jsonify({'message': 'Job not found'}), 404
+
+    return jsonify({
+        'id': str(job.id),
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'result': job.result,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'updated_at': job.updated_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }), 200
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional
+from flask import Flask
+
+from ..extensions import db
+from . import job_queue
+
+# A handler receives the job payload and a callback to report progress, and
+# returns the result stored on the job.
+JobHandler = Callable[[dict, Callable[[dict], None]], Awaitable[dict]]
+
+class JobHeartbeat(threading.Thread):
+    """
+        Thread that marks a running job as alive every `interval` seconds in
+        its own application context, so a job spending longer than the stale
+        timeout in one step without reporting progress, e.g. a slow batch or
+        clone, is not claimed again by another worker while it still runs.
+    """
+
+    def __init__(self, app: Flask, job_id, interval: float):
+        super().__init__(name=f"job-heartbeat-{job_id}", daemon=True)
+        self.app = app
+        self.job_id = job_id
+        self.interval = interval
+        self._stopping = threading.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self.join()
+
+    def run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    job_queue.heartbeat(self.job_id)
+                except Exception as e:
+                    print(f"Failed to record the heartbeat of job {self.job_id}: {e}")
+                finally:
+                    db.session.remove()
+
+class JobWorker(threading.Thread):
+    """
+        Thread that claims queued jobs and runs each one on a fresh event loop
+        inside its own application context, so every job gets its own database
+        session and clients bound to its loop. While a job runs, a heartbeat
+        keeps it from being taken for stale, four times per `stale_after`.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        handlers: Dict[str, JobHandler],
+        poll_interval: float = 1.0,
+        stale_after: Optional[float] = None,
+        name: str = None
+    ):
+        super().__init__(name=name, daemon=True)
+        self.app = app
+        self.handlers = handlers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._stopping = threading.Event()
+
+    def stop(self) -> None:
+        """Stops the worker after its current job."""
+        self._stopping.set()
+
+    def run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                ran = self.run_once()
+            except Exception as e:
+                print(f"Job worker {self.name} failed to claim a job: {e}")
+                ran = False
+
+            if not ran:
+                self._stopping.wait(self.poll_interval)
+
+    def run_once(self) -> bool:
+        """Runs the next queued job, returning False when there was none."""
+        with self.app.app_context():
+            try:
+                job = job_queue.claim_next(self.stale_after)
+
+                if job is None:
+                    return False
+
+                self._run(job.id, job.kind, dict(job.payload))
+
+                return True
+            finally:
+                db.session.remove()
+
+    def _run(self, job_id, kind: str, payload: dict) -> None:
+        print(f"Job worker {self.name} running {kind} job {job_id}")
+
+        handler = self.handlers.get(kind)
+
+        if handler is None:
+            job_queue.fail(job_id, f"No handler for job kind '{kind}'")
+            return
+
+        heartbeat = None
+
+        if self.stale_after is not None:
+            heartbeat = JobHeartbeat(self.app, job_id, self.stale_after / 4)
+            heartbeat.start()
+
+        current_job = job_queue.current_job_id.set(job_id)
+
+        try:
+            result = asyncio.run(handler(payload, lambda progress: job_queue.update_progress(job_id, progress)))
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            db.session.rollback()
+            job_queue.fail(job_id, str(e) or type(e).__name__)
+            return
+        finally:
+            job_queue.current_job_id.reset(current_job)
+
+            if heartbeat is not None:
+                heartbeat.stop()
+
+        job_queue.complete(job_id, result)
+
+class JobWorkerPool:
+    """
+        Fixed number of `JobWorker` threads polling the same queue.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        handlers: Dict[str, JobHandler],
+        workers: int = 2,
+        poll_interval: float = 1.0,
+        stale_after: Optional[float] = None
+    ):
+        self.workers: List[JobWorker] = [
+            JobWorker(app, handlers, poll_interval, stale_after, name=f"job-worker-{index}")
+            for index in range(workers)
+        ]
+
+    def start(self) -> None:
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self) -> None:
+        for worker in self.workers:
+            worker.stop()
+
+    def join(self) -> None:
+        for worker in self.workers:
+            while worker.is_alive():
+                worker.join(timeout=1.0)
@@ -0,0 +1,151 @@
+import asyncio
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+def get_process_pool(max_workers: int) -> Optional[ProcessPoolExecutor]:
+    """
+    Returns the process-wide pool for CPU-bound work, creating it on first
+    use, or None when `max_workers` is 0 and the work runs in the caller.
+    Workers start on demand and are kept across runs, since each one pays
+    for importing the application once.
+
+    Workers are spawned rather than forked, so the threads, clients and
+    connections of this process are never copied into them.
+    """
+    global _process_pool
+
+    if max_workers <= 0:
+        return None
+
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+        return _process_pool
+
+@atexit.register
+def shutdown_process_pool() -> None:
+    global _process_pool
+
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(cancel_futures=True)
+            _process_pool = None
+
+def run_chunk(calls: List[Tuple[Callable, tuple]]) -> List[Tuple[bool, Any]]:
+    """Runs a chunk of calls in a worker, returning whether each succeeded with its result or exception."""
+    results = []
+
+    for function, args in calls:
+        try:
+            results.append((True, function(*args)))
+        except Exception as e:
+            results.append((False, e))
+
+    return results
+
+class ProcessPoolOffloader:
+    """
+        Runs the CPU-bound work of files, such as splitting, token counting
+        and measuring, in a process pool instead of on the event loop. Calls
+        from concurrent files are submitted together in chunks of up to
+        `chunk_size`, or after `linger` seconds, so a round-trip to a worker
+        is shared by several files.
+
+        Work on content smaller than `inline_bytes` runs on the event loop,
+        where it is cheaper than sending the content to a worker, and so
+        does all work when there is no executor. Functions and arguments
+        must be picklable.
+    """
+
+    def __init__(
+        self,
+        executor: Optional[Executor] = None,
+        chunk_size: int = 16,
+        linger: float = 0.005,
+        inline_bytes: int = 4_096
+    ):
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self.linger = linger
+        self.inline_bytes = inline_bytes
+
+        self._pending: List[Tuple[Callable, tuple, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.inline_calls = 0
+        self.offloaded_calls = 0
+        self.chunk_count = 0
+
+    def stats(self) -> dict:
+        return {
+            "inline": self.inline_calls,
+            "offloaded": self.offloaded_calls,
+            "chunks": self.chunk_count,
+            "calls_per_chunk": self.offloaded_calls / self.chunk_count if self.chunk_count else 0.0,
+        }
+
+    async def run(self, size: int, function: Callable, *args) -> Any:
+        """Returns `function(*args)`, computed in the pool when the content it works on is `size` bytes or more."""
+        if self.executor is None or size < self.inline_bytes:
+            self.inline_calls += 1
+            return function(*args)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((function, args, future))
+
+        if len(self._pending) >= self.chunk_size:
+            self._submit_pending()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.linger, self._submit_pending)
+
+        return await future
+
+    def _submit_pending(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._pending:
+            return
+
+        chunk = self._pending
+        self._pending = []
+
+        self.chunk_count += 1
+        self.offloaded_calls += len(chunk)
+
+        try:
+            submitted = asyncio.wrap_future(self.executor.submit(run_chunk, [(function, args) for function, args, _ in chunk]))
+        except Exception as e:
+            # e.g. the pool is shut down or broken.
+            for _, _, future in chunk:
+                future.set_exception(e)
+            return
+
+        submitted.add_done_callback(lambda done: self._deliver(chunk, done))
+
+    @staticmethod
+    def _deliver(chunk: List[Tuple[Callable, tuple, asyncio.Future]], done: asyncio.Future) -> None:
+        error = done.exception() if not done.cancelled() else asyncio.CancelledError()
+
+        for index, (_, _, future) in enumerate(chunk):
+            if future.done():
+                continue
+
+            if error is not None:
+                future.set_exception(error)
+                continue
+
+            succeeded, value = done.result()[index]
+
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
@@ -1,12 +1,59 @@
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from typing import List
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchAny, MatchExcept, MatchValue,
+    FilterSelector, HasIdCondition, HnswConfigDiff, PayloadSchemaType, ScalarQuantization,
+    ScalarQuantizationConfig, ScalarType, ProductQuantization, ProductQuantizationConfig,
+    CompressionRatio, QuantizationSearchParams, SearchParams, CreateAlias, CreateAliasOperation,
+    DeleteAlias, DeleteAliasOperation, CollectionInfo
+)
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Union
 from qdrant_client import AsyncQdrantClient
+from weakref import WeakKeyDictionary
+import asyncio
+import os
+import random
 import uuid
 
-def get_qdrant_client():
-    qdrant_client = AsyncQdrantClient(host="localhost", port=6333, grpc_port=6334, prefer_grpc=True)
+from .embedding_cache import content_hash
+
+# Namespace of the deterministic point IDs.
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a34-8f0e-4d5b-9a67-3e2b1c0d9f48")
+
+# Number of files per delete request when sweeping stale points.
+DELETE_BATCH_SIZE = 100
+
+# Payload fields searches filter on, indexed so filters do not scan every point.
+PAYLOAD_INDEXES = {
+    "language": PayloadSchemaType.KEYWORD,
+    "file_path": PayloadSchemaType.KEYWORD,
+    "path_prefixes": PayloadSchemaType.KEYWORD,
+}
+
+QUANTIZATIONS = ("none", "scalar", "product")
+
+# Clients are bound to the event loop they were created on, so one client is
+# kept per running loop and reused by every call made on it.
+_qdrant_clients: "WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncQdrantClient]" = WeakKeyDictionary()
+
+def get_qdrant_client() -> AsyncQdrantClient:
+    loop = asyncio.get_running_loop()
+    qdrant_client = _qdrant_clients.get(loop)
+
+    if qdrant_client is None:
+        qdrant_client = AsyncQdrantClient(host="localhost", port=6333, grpc_port=6334, prefer_grpc=True)
+        _qdrant_clients[loop] = qdrant_client
+
     return qdrant_client
 
+async def close_qdrant_client() -> None:
+    """
+    Closes the client of the running event loop. Must be called before the
+    loop is closed, e.g. at the end of a request handled on its own loop.
+    """
+    qdrant_client = _qdrant_clients.pop(asyncio.get_running_loop(), None)
+
+    if qdrant_client is not None:
+        await qdrant_client.close()
+
 def make_collection_name(repo_path: str) -> str:
     collection_name = repo_path.split("/")[-1]
     collection_name = collection_name.replace(" ", "_").replace('-', '_').lower()
@@ -16,12 +63,149 @@ def make_collection_name(repo_path: str) -> str:
 
     return collection_name
 
-async def create_collection_for_repo(repo_path: str) -> None:
+class CollectionSettings:
     """
-    Creates a collection in Qdrant for a repository.
+        How the vectors of a repository collection are stored and indexed:
+        quantization (`none`, `scalar` int8 or `product`), whether the
+        original vectors live on disk, and the HNSW graph parameters. With
+        quantization, searches run on the compressed vectors and rescore
+        `oversampling` times the requested results with the original ones.
     """
 
-    qdrant_client = get_qdrant_client()
+    def __init__(
+        self,
+        quantization: str = "none",
+        product_compression: str = "x16",
+        quantization_always_ram: bool = True,
+        on_disk: bool = False,
+        hnsw_m: Optional[int] = None,
+        hnsw_ef_construct: Optional[int] = None,
+        search_ef: Optional[int] = None,
+        oversampling: float = 2.0,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {', '.join(QUANTIZATIONS)}")
+
+        self.quantization = quantization
+        self.product_compression = CompressionRatio(product_compression)
+        self.quantization_always_ram = quantization_always_ram
+        self.on_disk = on_disk
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construct = hnsw_ef_construct
+        self.search_ef = search_ef
+        self.oversampling = oversampling
+
+    @classmethod
+    def from_config(cls, config: Mapping) -> "CollectionSettings":
+        return cls(
+            quantization=config["QDRANT_QUANTIZATION"],
+            product_compression=config["QDRANT_PRODUCT_COMPRESSION"],
+            quantization_always_ram=config["QDRANT_QUANTIZATION_ALWAYS_RAM"],
+            on_disk=config["QDRANT_ON_DISK"],
+            hnsw_m=config["QDRANT_HNSW_M"],
+            hnsw_ef_construct=config["QDRANT_HNSW_EF_CONSTRUCT"],
+            search_ef=config["QDRANT_SEARCH_EF"],
+            oversampling=config["QDRANT_OVERSAMPLING"],
+        )
+
+    def vectors_config(self, size: int = 1536) -> VectorParams:
+        return VectorParams(size=size, distance=Distance.COSINE, on_disk=self.on_disk or None)
+
+    def hnsw_config(self) -> Optional[HnswConfigDiff]:
+        if self.hnsw_m is None and self.hnsw_ef_construct is None:
+            return None
+
+        return HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def quantization_config(self) -> Optional[Union[ScalarQuantization, ProductQuantization]]:
+        if self.quantization == "scalar":
+            return ScalarQuantization(scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8, quantile=0.99, always_ram=self.quantization_always_ram
+            ))
+
+        if self.quantization == "product":
+            return ProductQuantization(product=ProductQuantizationConfig(
+                compression=self.product_compression, always_ram=self.quantization_always_ram
+            ))
+
+        return None
+
+    def search_params(self, collection: Optional[CollectionInfo] = None) -> Optional[SearchParams]:
+        """
+        Returns the parameters of searches. When the `collection` searched is
+        given, whether to rescore follows the quantization it was built with
+        rather than these settings, which may have changed since.
+        """
+        if collection is None:
+            quantized = self.quantization != "none"
+        else:
+            vectors = collection.config.params.vectors
+            quantized = collection.config.quantization_config is not None or (
+                isinstance(vectors, VectorParams) and vectors.quantization_config is not None
+            )
+
+        if not quantized and self.search_ef is None:
+            return None
+
+        return SearchParams(
+            hnsw_ef=self.search_ef,
+            quantization=QuantizationSearchParams(rescore=True, oversampling=self.oversampling)
+            if quantized else None
+        )
+
+    def __repr__(self):
+        return (
+            f"<CollectionSettings(quantization={self.quantization}, on_disk={self.on_disk}, "
+            f"hnsw_m={self.hnsw_m}, hnsw_ef_construct={self.hnsw_ef_construct}, search_ef={self.search_ef})>"
+        )
+
+async def ensure_payload_indexes(collection_name: str, qdrant_client: Optional[AsyncQdrantClient] = None) -> None:
+    """Creates the payload indexes of `PAYLOAD_INDEXES` missing from a collection."""
+    qdrant_client = qdrant_client or get_qdrant_client()
+
+    collection = await qdrant_client.get_collection(collection_name)
+
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name not in (collection.payload_schema or {}):
+            await qdrant_client.create_payload_index(collection_name, field_name, field_schema, wait=True)
+
+async def create_collection(
+    collection_name: str,
+    settings: CollectionSettings,
+    size: int,
+    qdrant_client: Optional[AsyncQdrantClient] = None
+) -> None:
+    qdrant_client = qdrant_client or get_qdrant_client()
+
+    print(f"Creating collection: {collection_name} of {size} dimensions {settings}")
+    await qdrant_client.create_collection(
+        collection_name=collection_name,
+        vectors_config=settings.vectors_config(size),
+        hnsw_config=settings.hnsw_config(),
+        quantization_config=settings.quantization_config(),
+    )
+
+async def vector_size(collection_name: str, qdrant_client: Optional[AsyncQdrantClient] = None) -> int:
+    qdrant_client = qdrant_client or get_qdrant_client()
+
+    collection = await qdrant_client.get_collection(collection_name)
+    return collection.config.params.vectors.size
+
+async def create_collection_for_repo(
+    repo_path: str,
+    settings: Optional[CollectionSettings] = None,
+    qdrant_client: Optional[AsyncQdrantClient] = None,
+    size: int = 1536
+) -> None:
+    """
+    Creates a collection in Qdrant for a repository, stored and indexed as
+    `settings` describe, and makes sure its payload indexes exist. Settings
+    only apply to new collections; an existing collection must already
+    store vectors of `size` dimensions.
+    """
+
+    settings = settings or CollectionSettings()
+    qdrant_client = qdrant_client or get_qdrant_client()
 
     try:
         collection_name = make_collection_name(repo_path)
@@ -31,54 +215,299 @@ async def create_collection_for_repo(repo_path: str) -> None:
         print(f"Collection exists: {collection_exists}")
 
         if not collection_exists:
-            print(f"Creating collection: {collection_name}")
-            await qdrant_client.create_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(size=1536, distance=Distance.COSINE),
+            await create_collection(collection_name, settings, size, qdrant_client)
+        elif (existing_size := await vector_size(collection_name, qdrant_client)) != size:
+            raise ValueError(
+                f"Collection {collection_name} stores vectors of {existing_size} dimensions, not {size}; "
+                f"migrate its embeddings first"
             )
+
+        await ensure_payload_indexes(collection_name, qdrant_client)
     except Exception as e:
         print(f"Failed to create collection: {e}")
         raise e
 
-    await qdrant_client.close()
+async def swap_collection(
+    name: str,
+    collection_name: str,
+    qdrant_client: Optional[AsyncQdrantClient] = None,
+    max_retries: int = 3,
+    backoff: float = 0.5
+) -> None:
+    """
+    Points `name` at another collection through an alias and deletes the
+    collection it referred to. When `name` is already an alias the switch is
+    atomic; a collection that was created under `name` is deleted first,
+    since an alias cannot share its name, so searches fail for a moment.
 
-async def store_embeddings_for_repo(repo_path: str, metadatas: List[dict]) -> None:
+    Switching the alias is retried with backoff. If it still fails the new
+    collection is kept, and the error names it: after a first migration it
+    holds the only copy of the points.
     """
-    Stores embeddings for a repository in Qdrant.
+    qdrant_client = qdrant_client or get_qdrant_client()
+
+    aliases = {alias.alias_name: alias.collection_name for alias in (await qdrant_client.get_aliases()).aliases}
+    previous = aliases.get(name)
+
+    if previous is None and await qdrant_client.collection_exists(name):
+        await qdrant_client.delete_collection(name)
+
+    operations = [CreateAliasOperation(create_alias=CreateAlias(collection_name=collection_name, alias_name=name))]
+
+    if previous is not None:
+        operations.insert(0, DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=name)))
+
+    for attempt in range(max_retries + 1):
+        try:
+            await qdrant_client.update_collection_aliases(change_aliases_operations=operations)
+            break
+        except Exception as e:
+            if attempt < max_retries:
+                await asyncio.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+                continue
+
+            message = (
+                f"Failed to point {name} at {collection_name}: {e}. The migrated points are kept in {collection_name}; "
+                + (f"{name} still refers to {previous}" if previous is not None
+                   else f"{name} was deleted, create the alias {name} -> {collection_name} to recover it")
+            )
+            print(message)
+            raise RuntimeError(message) from e
+
+    if previous is not None and previous != collection_name:
+        await qdrant_client.delete_collection(previous)
+
+class QdrantUpsertWriter:
+    """
+        Writes a stream of points to a collection in fixed-size batches. Up to
+        `max_in_flight` batches are sent concurrently; once that many are
+        pending, `add` waits for one to finish. Failed batches are retried with
+        jittered exponential backoff and `close` raises if any batch still
+        could not be written.
     """
-    qdrant_client = get_qdrant_client()
 
-    collection_name = make_collection_name(repo_path)
+    def __init__(
+        self,
+        collection_name: str,
+        qdrant_client: Optional[AsyncQdrantClient] = None,
+        batch_size: int = 256,
+        max_in_flight: int = 4,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+    ):
+        self.collection_name = collection_name
+        self.qdrant_client = qdrant_client or get_qdrant_client()
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
 
-    if not metadatas:
-        return
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._batch: List[PointStruct] = []
+        self._requests = set()
+
+        self.written = 0
+        self.retries = 0
+        self.failed = 0
+
+    async def add(self, point: PointStruct) -> None:
+        self._batch.append(point)
+
+        if len(self._batch) >= self.batch_size:
+            await self._send_batch()
+
+    async def write(self, points: Iterable[PointStruct]) -> None:
+        for point in points:
+            await self.add(point)
 
-    points = []
+    async def flush(self) -> None:
+        """Sends the partial batch and waits for every batch in flight."""
+        if self._batch:
+            await self._send_batch()
 
+        if self._requests:
+            await asyncio.gather(*self._requests)
+
+    async def close(self) -> None:
+        await self.flush()
+
+        if self.failed:
+            raise RuntimeError(f"Failed to store {self.failed} points in {self.collection_name}")
+
+    async def _send_batch(self) -> None:
+        batch = self._batch
+        self._batch = []
+
+        await self._slots.acquire()
+
+        request = asyncio.ensure_future(self._upsert(batch))
+        self._requests.add(request)
+        request.add_done_callback(self._requests.discard)
+
+    async def _upsert(self, batch: List[PointStruct]) -> None:
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await self.qdrant_client.upsert(collection_name=self.collection_name, points=batch, wait=True)
+                    self.written += len(batch)
+                    return
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        print(f"Error storing embeddings, giving up on {len(batch)} points: {e}")
+                        self.failed += len(batch)
+                        return
+
+                    delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                    print(f"Error storing embeddings, retrying in {delay:.2f}s: {e}")
+                    self.retries += 1
+                    await asyncio.sleep(delay)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"written": self.written, "retries": self.retries, "failed": self.failed}
+
+def make_point_id(collection_name: str, file_path: str, chunk_index: int, chunk_hash: str) -> str:
+    """
+    Derives the ID of a chunk's point, so re-indexing unchanged content
+    overwrites the existing point instead of adding a new one.
+    """
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{collection_name}\0{file_path}\0{chunk_index}\0{chunk_hash}"))
+
+def path_prefixes(path: str) -> List[str]:
+    """
+    Returns the directories containing a path and the path itself, e.g.
+    `src`, `src/app` and `src/app/main.py`, so points can be filtered by
+    path prefix with an exact match on any of them.
+    """
+    parts = path.split("/")
+    return ["/".join(parts[:end]) for end in range(1, len(parts) + 1)]
+
+def make_points(collection_name: str, metadatas: Iterable[Optional[dict]], repo_path: Optional[str] = None) -> Iterator[PointStruct]:
+    """Yields one point per chunk of each file."""
     for metadata in metadatas:
         if metadata is None:
             continue
 
-        payload = {
-            "file_path": metadata["file_path"],
-            "language": metadata["language"],
-            "chunk": metadata["chunk"],
-            "line_count": metadata["line_count"],
-            "word_count": metadata["word_count"],
-        }
-
-        point = PointStruct(
-            id=str(uuid.uuid4()),
-            vector=metadata["embeddings"],
-            payload=payload
+        relative_path = os.path.relpath(metadata["file_path"], repo_path).replace(os.sep, "/") if repo_path else None
+
+        for chunk in metadata.get("chunks", []):
+            chunk_hash = content_hash(chunk["text"])
+
+            payload = {
+                "file_path": metadata["file_path"],
+                "language": metadata["language"],
+                "chunk": chunk["text"],
+                "chunk_index": chunk["index"],
+                "content_hash": chunk_hash,
+                "start_offset": chunk["start"],
+                "end_offset": chunk["end"],
+                "start_line": chunk["start_line"],
+                "end_line": chunk["end_line"],
+                "line_count": metadata["line_count"],
+                "word_count": metadata["word_count"],
+            }
+
+            if relative_path is not None:
+                payload["path"] = relative_path
+                payload["path_prefixes"] = path_prefixes(relative_path)
+
+            yield PointStruct(
+                id=make_point_id(collection_name, metadata["file_path"], chunk["index"], chunk_hash),
+                vector=chunk["embeddings"],
+                payload=payload
+            )
+
+async def store_embeddings_for_repo(repo_path: str, metadatas: List[dict], writer: Optional[QdrantUpsertWriter] = None) -> Dict[str, List[str]]:
+    """
+    Stores embeddings for a repository in Qdrant and returns the IDs of the
+    points written for each file. When a writer is given the points are added
+    to its stream and sent as its batches fill up.
+    """
+    point_ids = {metadata["file_path"]: [] for metadata in metadatas if metadata is not None}
+
+    if not point_ids:
+        return point_ids
+
+    collection_name = make_collection_name(repo_path)
+    owns_writer = writer is None
+
+    if owns_writer:
+        writer = QdrantUpsertWriter(collection_name)
+
+    for point in make_points(collection_name, metadatas, repo_path):
+        point_ids[point.payload["file_path"]].append(point.id)
+        await writer.add(point)
+
+    if owns_writer:
+        await writer.close()
+
+    return point_ids
+
+async def delete_stale_points(repo_path: str, point_ids: Dict[str, List[str]]) -> None:
+    """
+    Deletes the points of the given files that are not among their current
+    point IDs, i.e. chunks left over from a previous version of the file.
+    """
+    if not point_ids:
+        return
+
+    qdrant_client = get_qdrant_client()
+
+    collection_name = make_collection_name(repo_path)
+    file_paths = list(point_ids)
+
+    for start in range(0, len(file_paths), DELETE_BATCH_SIZE):
+        conditions = [
+            Filter(
+                must=[FieldCondition(key="file_path", match=MatchValue(value=file_path))],
+                must_not=[HasIdCondition(has_id=point_ids[file_path])] if point_ids[file_path] else None
+            )
+            for file_path in file_paths[start:start + DELETE_BATCH_SIZE]
+        ]
+
+        await qdrant_client.delete(
+            collection_name=collection_name,
+            points_selector=FilterSelector(filter=Filter(should=conditions)),
+            wait=True
         )
 
-        points.append(point)
+async def delete_orphaned_points(repo_path: str, file_paths: List[str]) -> None:
+    """
+    Deletes every point of the repository collection whose file is not one of
+    `file_paths`, i.e. points of files that no longer exist.
+    """
+    qdrant_client = get_qdrant_client()
 
-    if points:
-        try:
-            await qdrant_client.upsert(collection_name=collection_name, points=points, wait=True)
-        except Exception as e:
-            print(f"Error storing embeddings: {e}")
+    collection_name = make_collection_name(repo_path)
+
+    await qdrant_client.delete(
+        collection_name=collection_name,
+        points_selector=FilterSelector(
+            filter=Filter(must=[FieldCondition(key="file_path", match=MatchExcept(**{"except": file_paths}))])
+        ),
+        wait=True
+    )
+
+async def delete_embeddings_for_files(repo_path: str, file_paths: List[str]) -> None:
+    """
+    Deletes the points of the given files from the repository collection.
+    """
+    if not file_paths:
+        return
+
+    qdrant_client = get_qdrant_client()
 
-    await qdrant_client.close()
+    collection_name = make_collection_name(repo_path)
+
+    try:
+        if await qdrant_client.collection_exists(collection_name):
+            await qdrant_client.delete(
+                collection_name=collection_name,
+                points_selector=FilterSelector(
+                    filter=Filter(must=[FieldCondition(key="file_path", match=MatchAny(any=file_paths))])
+                ),
+                wait=True
+            )
+    except Exception as e:
+        print(f"Failed to delete embeddings: {e}")
+        raise e
@@ -0,0 +1,328 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Mapping, Optional, Tuple, TypeVar
+
+import openai
+
+T = TypeVar("T")
+
+# Matches the durations of the rate limit reset headers, e.g. "20ms", "1s" or "6m0s".
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+# Interval at which callers blocked on the concurrency limit check it again.
+CONCURRENCY_POLL_INTERVAL = 0.02
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parses a rate limit reset header into seconds."""
+    if not value:
+        return None
+
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    parts = DURATION_PATTERN.findall(value)
+
+    if not parts:
+        return None
+
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Returns the delay requested by the server in a failed response, in seconds."""
+    response = getattr(error, "response", None)
+
+    if response is None:
+        return None
+
+    milliseconds = response.headers.get("retry-after-ms")
+
+    if milliseconds:
+        try:
+            return float(milliseconds) / 1000
+        except ValueError:
+            pass
+
+    return parse_duration(response.headers.get("retry-after"))
+
+def is_rate_limit(error: Exception) -> bool:
+    # Running out of quota is reported as a 429 too, but waiting does not help.
+    return isinstance(error, openai.RateLimitError) and getattr(error, "code", None) != "insufficient_quota"
+
+def is_retryable(error: Exception) -> bool:
+    if is_rate_limit(error):
+        return True
+
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409) or error.status_code >= 500
+
+    return isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError))
+
+class Budget:
+    """
+        Estimate of what is left of one rate limit (requests or tokens). It is
+        reset from the limit, remaining and reset headers of every response
+        and refills in between at the rate the reset header implies, which is
+        how the provider replenishes it.
+    """
+
+    def __init__(self):
+        self.limit: Optional[float] = None
+        self.level = 0.0
+        self.refill_rate = 0.0
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.limit is not None:
+            self.level = min(self.limit, self.level + (now - self.updated_at) * self.refill_rate)
+
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Returns how long to wait before `amount` can be spent, 0 if it can be spent now."""
+        if self.limit is None:
+            return 0.0
+
+        self._refill(now)
+
+        # A request larger than the whole budget is let through once the budget is full.
+        if self.level >= min(amount, self.limit):
+            return 0.0
+
+        if self.refill_rate <= 0:
+            return 1.0
+
+        return (min(amount, self.limit) - self.level) / self.refill_rate
+
+    def spend(self, amount: float, now: float) -> None:
+        if self.limit is not None:
+            self._refill(now)
+            self.level -= amount
+
+    def update(self, limit: Optional[str], remaining: Optional[str], reset: Optional[str], now: float) -> None:
+        try:
+            limit, remaining = float(limit), float(remaining)
+        except (TypeError, ValueError):
+            return
+
+        reset_seconds = parse_duration(reset)
+
+        self.limit = limit
+        self.level = remaining
+        self.updated_at = now
+
+        if reset_seconds and remaining < limit:
+            self.refill_rate = (limit - remaining) / reset_seconds
+        elif not self.refill_rate:
+            self.refill_rate = limit / 60
+
+class RateLimiter:
+    """
+        Schedules the calls made to one OpenAI model so they stay within its
+        requests and tokens per minute, learned from the rate limit headers of
+        each response. Calls that fail with a rate limit, a server error or a
+        connection error are retried with jittered exponential backoff, or
+        after the delay the server asks for.
+
+        The number of calls in flight adapts: it is halved on a rate limit
+        error and grows back by one per round of successful calls, up to
+        `max_concurrency`. Like TCP's AIMD, it is halved at most once per
+        round: errors of calls that started before the last decrease were
+        sent at the old concurrency and do not halve it again.
+
+        State is guarded by a thread lock rather than asyncio primitives, so a
+        limiter can be shared by pipelines running on different event loops.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_concurrency: int = 64,
+        min_concurrency: int = 1,
+        max_retries: int = 6,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._requests = Budget()
+        self._tokens = Budget()
+        self._concurrency = float(max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._decreased_at = float("-inf")
+
+        self.request_count = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.wait_time = 0.0
+
+    @property
+    def concurrency(self) -> int:
+        return max(self.min_concurrency, int(self._concurrency))
+
+    def _reserve(self, tokens: int) -> float:
+        """Reserves a slot and budget for a call, or returns how long to wait before trying again."""
+        now = time.monotonic()
+
+        with self._lock:
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            if self._in_flight >= self.concurrency:
+                return CONCURRENCY_POLL_INTERVAL
+
+            wait = max(self._requests.wait_time(1, now), self._tokens.wait_time(tokens, now))
+
+            if wait > 0:
+                return wait
+
+            self._requests.spend(1, now)
+            self._tokens.spend(tokens, now)
+            self._in_flight += 1
+            self.request_count += 1
+
+            return 0.0
+
+    async def acquire(self, tokens: int) -> float:
+        """Waits for a slot and budget for a call, returning when it was reserved."""
+        while True:
+            wait = self._reserve(tokens)
+
+            if wait <= 0:
+                return time.monotonic()
+
+            self.wait_time += wait
+            await asyncio.sleep(wait)
+
+    def release(
+        self,
+        headers: Optional[Mapping[str, str]] = None,
+        error: Optional[BaseException] = None,
+        started_at: Optional[float] = None
+    ) -> None:
+        now = time.monotonic()
+
+        with self._lock:
+            self._in_flight -= 1
+
+            if headers:
+                self._requests.update(
+                    headers.get("x-ratelimit-limit-requests"),
+                    headers.get("x-ratelimit-remaining-requests"),
+                    headers.get("x-ratelimit-reset-requests"),
+                    now
+                )
+                self._tokens.update(
+                    headers.get("x-ratelimit-limit-tokens"),
+                    headers.get("x-ratelimit-remaining-tokens"),
+                    headers.get("x-ratelimit-reset-tokens"),
+                    now
+                )
+
+            if error is None:
+                self._concurrency = min(self.max_concurrency, self._concurrency + 1 / self._concurrency)
+            elif is_rate_limit(error):
+                self.rate_limited += 1
+
+                if started_at is None or started_at >= self._decreased_at:
+                    self._concurrency = max(self.min_concurrency, self._concurrency / 2)
+                    self._decreased_at = now
+
+                delay = retry_after(error)
+
+                if delay:
+                    self._paused_until = max(self._paused_until, now + delay)
+
+    async def run(self, request: Callable[[], Awaitable[Tuple[T, Mapping[str, str]]]], tokens: int = 0) -> T:
+        """
+        Runs a request within the limits, retrying it when it fails with a
+        retryable error. `request` returns the result and the response
+        headers, and `tokens` estimates what the request counts against the
+        tokens per minute.
+        """
+        for attempt in range(self.max_retries + 1):
+            started_at = await self.acquire(tokens)
+
+            try:
+                result, headers = await request()
+            except Exception as e:
+                self.release(getattr(getattr(e, "response", None), "headers", None), e, started_at)
+
+                if attempt == self.max_retries or not is_retryable(e):
+                    self.failures += 1
+                    raise
+
+                delay = retry_after(e) or min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+                self.retries += 1
+                print(f"OpenAI request to {self.model} failed, retrying in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException as e:
+                # A cancelled call, such as one that timed out, gives its slot back too.
+                self.release(error=e, started_at=started_at)
+                raise
+
+            self.release(headers, started_at=started_at)
+
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.request_count,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+            "wait_seconds": round(self.wait_time, 3),
+            "concurrency": self.concurrency,
+            "requests_limit": self._requests.limit,
+            "tokens_limit": self._tokens.limit,
+        }
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(model: str, max_concurrency: int = 64) -> RateLimiter:
+    """
+    Returns the process-wide limiter of a model, creating it on first use.
+    Limits apply per model, so every caller of a model shares its limiter.
+    """
+    with _rate_limiters_lock:
+        rate_limiter = _rate_limiters.get(model)
+
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(model, max_concurrency=max_concurrency)
+            _rate_limiters[model] = rate_limiter
+
+        return rate_limiter
+
+# Stats that add up over the life of a limiter, rather than describe its current state.
+CUMULATIVE_STATS = ("requests", "retries", "rate_limited", "failures", "wait_seconds")
+
+def rate_limit_stats(since: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+    """
+    Returns the stats of every limiter. Given the stats returned earlier,
+    e.g. when a run started, the cumulative ones are counted from then.
+    """
+    with _rate_limiters_lock:
+        stats = {model: rate_limiter.stats() for model, rate_limiter in _rate_limiters.items()}
+
+    for model, model_stats in stats.items():
+        earlier = (since or {}).get(model, {})
+
+        for key in CUMULATIVE_STATS:
+            model_stats[key] = round(model_stats[key] - earlier.get(key, 0), 3)
+
+    return stats
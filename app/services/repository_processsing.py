@@ -1,46 +1,159 @@
 import asyncio
+import bisect
 import os
+import re
 import aiofiles
-from typing import List
+from flask import current_app
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional
+from sqlalchemy import delete, select
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-import openai
 
 from ..extensions import db
-from ..models import Repository, File, Task
-from .stages import PipelineStage, StatGenerationStage
-from . import file_language_detection, qdrant_utils
-
+from ..models import Repository, File, Task, FileScore
+from .stages import PipelineStage, StaticMetricsStage, StatGenerationStage, TokenBudgetStage
+from .embedding_profiles import EmbeddingProfile
+from .triage import TriagePolicy
+from .embeddings import BatchEmbedder
+from .embedding_cache import EmbeddingCache, content_hash
+from .analysis_cache import AnalysisCache
+from .github_repository_extractor import RepositoryChanges
+from .scheduler import FileScheduler
+from .file_filter import RepositoryFileFilter
+from .run_checkpoints import RunCheckpoints
+from .event_loop_lag import EventLoopLagMonitor
+from . import bulk_persistence, file_language_detection, process_pool, qdrant_utils, rate_limits, score_rollups
+
+
+@lru_cache(maxsize=None)
+def chunk_splitter() -> RecursiveCharacterTextSplitter:
+    """Returns the splitter of the chunks files are embedded in, built once per process."""
+    return RecursiveCharacterTextSplitter(chunk_size=8191, chunk_overlap=200, add_start_index=True)
+
+def split_chunks(content: str) -> List[dict]:
+    """Splits a file into the chunks it is embedded in, with their offsets and line numbers."""
+    newlines = [match.start() for match in re.finditer("\n", content)]
+    chunks = []
+
+    for chunk_index, document in enumerate(chunk_splitter().create_documents([content])):
+        text = document.page_content
+        start = document.metadata["start_index"]
+        end = start + len(text)
+
+        chunks.append({
+            "index": chunk_index,
+            "text": text,
+            "start": start,
+            "end": end,
+            "start_line": bisect.bisect_left(newlines, start) + 1,
+            "end_line": bisect.bisect_left(newlines, end - 1) + 1,
+        })
+
+    return chunks
 
 class EmbeddingGenerationStage(PipelineStage):
     """
-        Pipeline stage to generate embeddings for a file
+        Pipeline stage to generate embeddings for a file. Splitting runs in
+        `offloader` when one is given.
     """
 
+    outputs = frozenset({"chunks"})
+
+    # Vectors are large and already kept in the embedding cache by content hash.
+    checkpoint = False
+
+    def __init__(
+        self,
+        embedder: BatchEmbedder,
+        offloader: Optional[process_pool.ProcessPoolOffloader] = None,
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        super().__init__(concurrency, timeout)
+        self.embedder = embedder
+        self.offloader = offloader or process_pool.ProcessPoolOffloader()
+        self.embedded_files = 0
+        self.embedded_chunks = 0
+
     async def process(self, file_path: str, file_content: str, metadata: dict):
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=8191, chunk_overlap=200)
+        chunks = await self.offloader.run(len(file_content), split_chunks, file_content)
 
-        chunks = text_splitter.split_text(file_content)
+        vectors = await self.embedder.embed([chunk["text"] for chunk in chunks])
 
-        for chunk in chunks:
-            response = openai.embeddings.create(
-                input=chunk,
-                model="text-embedding-3-small"
-            )
+        for chunk, embeddings in zip(chunks, vectors):
+            chunk["embeddings"] = embeddings
 
-            embeddings = response.data[0].embedding
+        metadata["chunks"] = chunks
 
-            metadata.update({
-                "chunk": chunk,
-                "embeddings": embeddings
-            })
+        self.embedded_files += 1
+        self.embedded_chunks += len(chunks)
 
 class FileProcessingPipeline:
     """
-        Class to process a file through a pipeline of stages
+        Class to process a file through a pipeline of stages. Each stage runs
+        as soon as the earlier stages producing its inputs are done, so stages
+        that do not depend on each other run concurrently.
     """
 
-    def __init__(self, stages: List[PipelineStage]):
+    def __init__(self, stages: List[PipelineStage], checkpoints: Optional[RunCheckpoints] = None):
         self.stages = stages
+        self.checkpoints = checkpoints
+        self.dependencies = self._dependencies(stages)
+        self._slots = [stage.slots() for stage in stages]
+
+    @staticmethod
+    def _dependencies(stages: List[PipelineStage]) -> List[List[int]]:
+        """
+        Returns the indexes of the stages each stage depends on: the earlier
+        stages writing one of its inputs. An input written by a later stage
+        is a mistake in the order of the stages.
+        """
+        dependencies = []
+
+        for index, stage in enumerate(stages):
+            for later in stages[index + 1:]:
+                if stage.inputs & later.outputs:
+                    raise ValueError(
+                        f"{type(stage).__name__} reads {sorted(stage.inputs & later.outputs)} "
+                        f"written by {type(later).__name__}, which runs after it"
+                    )
+
+            dependencies.append([
+                earlier for earlier, earlier_stage in enumerate(stages[:index]) if stage.inputs & earlier_stage.outputs
+            ])
+
+        return dependencies
+
+    async def _run_stage(
+        self,
+        index: int,
+        file_path: str,
+        file_content: str,
+        metadata: dict,
+        restored: Dict[str, dict],
+        dependencies: List[asyncio.Task]
+    ) -> None:
+        stage = self.stages[index]
+        stage_name = type(stage).__name__
+
+        if dependencies:
+            await asyncio.gather(*dependencies)
+
+        if stage_name in restored:
+            metadata.update(restored[stage_name])
+            return
+
+        async with self._slots[index]:
+            try:
+                async with asyncio.timeout(stage.timeout):
+                    await stage.process(file_path, file_content, metadata)
+            except TimeoutError:
+                raise TimeoutError(f"{stage_name} timed out after {stage.timeout}s")
+
+        if self.checkpoints is not None and stage.checkpoint:
+            self.checkpoints.record(file_path, metadata["content_hash"], stage_name, {
+                key: metadata[key] for key in stage.outputs if key in metadata
+            })
 
     async def process_file(self, file_path: str):
         """
@@ -58,83 +171,385 @@ class FileProcessingPipeline:
         async with aiofiles.open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
             file_content = await file.read()
 
-            for stage in self.stages:
-                await stage.process(file_path, file_content, metadata)
+        metadata["language"] = file_language_detection.detect_language(file_path, file_content)
+        metadata["content_hash"] = content_hash(file_content)
+
+        restored = self.checkpoints.restore(file_path, metadata["content_hash"]) if self.checkpoints else {}
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks: List[asyncio.Task] = []
+
+                for index in range(len(self.stages)):
+                    tasks.append(group.create_task(self._run_stage(
+                        index, file_path, file_content, metadata, restored,
+                        [tasks[dependency] for dependency in self.dependencies[index]]
+                    )))
+        except ExceptionGroup as errors:
+            # The first failure cancels the other stages; report it rather than the group.
+            raise errors.exceptions[0]
 
         return metadata
 
+class PipelineResources:
+    """
+        Stages, caches and process pool that files are processed with. The
+        repositories processed with the same resources share them, so the
+        stage concurrency limits, caches and LLM chain apply across all of
+        them, and `file_slots` bounds the files in the pipeline at once across
+        all of their schedulers. Must be created on the event loop using it.
+    """
+
+    def __init__(self, config, workers: Optional[int] = None):
+        self.config = config
+        self.file_slots = asyncio.Semaphore(workers) if workers else None
+
+        self.embedding_cache = EmbeddingCache()
+        self.analysis_cache = AnalysisCache()
+
+        self.offloader = process_pool.ProcessPoolOffloader(
+            process_pool.get_process_pool(config["PROCESS_POOL_WORKERS"]),
+            chunk_size=config["PROCESS_POOL_CHUNK_SIZE"],
+            inline_bytes=config["PROCESS_POOL_INLINE_BYTES"]
+        )
+
+        self.metrics_stage = StaticMetricsStage(self.offloader, min_code_lines=config["LLM_MIN_CODE_LINES"])
+
+        self.budget_stage = TokenBudgetStage(
+            model=config["LLM_MODEL"],
+            max_file_tokens=config["LLM_MAX_FILE_TOKENS"],
+            section_tokens=config["LLM_SECTION_TOKENS"],
+            offloader=self.offloader
+        )
+
+        self.analysis_stage = StatGenerationStage(
+            max_concurrency=config["LLM_CONCURRENCY"],
+            model=config["LLM_MODEL"],
+            cache=self.analysis_cache,
+            concurrency=config["LLM_STAGE_CONCURRENCY"],
+            timeout=config["LLM_STAGE_TIMEOUT"],
+            batch_max_files=config["LLM_BATCH_MAX_FILES"],
+            batch_max_tokens=config["LLM_BATCH_MAX_TOKENS"],
+            batch_file_tokens=config["LLM_BATCH_FILE_TOKENS"],
+            batch_linger=config["LLM_BATCH_LINGER"],
+            triage=TriagePolicy.from_config(config)
+        )
+
+        self._embedding_stages: Dict[tuple, EmbeddingGenerationStage] = {}
+
+        # Limiters are process-wide and outlive the resources: their stats are counted from here.
+        self._rate_limits = rate_limits.rate_limit_stats()
+
+        self.loop_lag = EventLoopLagMonitor()
+        self.loop_lag.start()
+
+    def embedding_stage(self, profile: EmbeddingProfile) -> EmbeddingGenerationStage:
+        """Returns the embedding stage of a profile, shared by the collections embedded with it."""
+        key = (profile.model, profile.dimensions)
+
+        if key not in self._embedding_stages:
+            self._embedding_stages[key] = EmbeddingGenerationStage(
+                BatchEmbedder(
+                    cache=self.embedding_cache,
+                    model=profile.model,
+                    dimensions=profile.request_dimensions,
+                    max_in_flight=self.config["EMBEDDING_CONCURRENCY"]
+                ),
+                offloader=self.offloader,
+                concurrency=self.config["EMBEDDING_STAGE_CONCURRENCY"],
+                timeout=self.config["EMBEDDING_STAGE_TIMEOUT"]
+            )
+
+        return self._embedding_stages[key]
+
+    def stages(self, profile: EmbeddingProfile) -> List[PipelineStage]:
+        return [self.metrics_stage, self.budget_stage, self.analysis_stage, self.embedding_stage(profile)]
+
+    async def close(self) -> None:
+        self.embedding_cache.close()
+        self.analysis_cache.close()
+
+        await self.loop_lag.stop()
+
+    def stats(self) -> dict:
+        return {
+            "embedding_cache": self.embedding_cache.stats(),
+            "analysis_cache": self.analysis_cache.stats(),
+            "analysis_batches": self.analysis_stage.batch_stats(),
+            "analysis_tiers": self.analysis_stage.tier_counts,
+            "static_metrics": self.metrics_stage.stats(),
+            "process_pool": self.offloader.stats(),
+            "event_loop_lag": self.loop_lag.stats(),
+            "rate_limits": rate_limits.rate_limit_stats(self._rate_limits),
+        }
+
+    def print_stats(self) -> None:
+        print(f"Embedding cache: {self.embedding_cache.stats()}")
+        print(f"Analysis cache: {self.analysis_cache.stats()}")
+        print(f"Analysis batches: {self.analysis_stage.batch_stats()}")
+        print(f"Analysis tiers: {self.analysis_stage.tier_counts}")
+        print(f"Static metrics: {self.metrics_stage.stats()}")
+        print(f"Process pool: {self.offloader.stats()}, event loop lag: {self.loop_lag.stats()}")
+        print(f"Rate limits: {rate_limits.rate_limit_stats(self._rate_limits)}")
+
 class RepositoryProcessor:
     """
-        Class to process a repository through a pipeline
+        Class to process a repository through a pipeline. Repositories given
+        the same `resources` share them; otherwise the processor creates its
+        own for the run.
     """
 
-    def __init__(self, repo_path: str):
+    def __init__(
+        self,
+        repo_path: str,
+        head_commit: Optional[str] = None,
+        changes: Optional[RepositoryChanges] = None,
+        on_progress: Optional[Callable[[dict], None]] = None,
+        resources: Optional[PipelineResources] = None
+    ):
         self._repo_path = repo_path
+        self._head_commit = head_commit
+        self._changes = changes
+        self._on_progress = on_progress
+        self._resources = resources
+        self._pipeline: Optional[FileProcessingPipeline] = None
+        self._checkpoints: Optional[RunCheckpoints] = None
+        self._row_counts: Dict[str, int] = {}
+        self._token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "skipped_files": 0}
+        self._embedded_files = 0
+        self._embedded_chunks = 0
+
+    @staticmethod
+    def find_repository(repo_path: str) -> Optional[Repository]:
+        return db.session.execute(
+            select(Repository).filter_by(name=os.path.basename(repo_path))
+        ).scalars().first()
+
+    def _file_paths(self, file_filter: RepositoryFileFilter) -> Iterator[str]:
+        """
+        Yields the files to send through the pipeline: every file of the
+        repository, or only the changed ones when processing incrementally,
+        leaving out the files rejected by the filter.
+        """
+        if self._changes is None:
+            return file_filter.walk()
+
+        return file_filter.filter(os.path.join(self._repo_path, path) for path in self._changes.to_process)
+
+    def _stale_file_paths(self, repository: Repository) -> List[str]:
+        """Returns the indexed files whose rows must be replaced or removed."""
+        if self._changes is None:
+            return list(db.session.execute(
+                select(File.path).filter_by(repository_id=repository.id)
+            ).scalars())
+
+        return [os.path.join(self._repo_path, path) for path in self._changes.to_remove]
+
+    def _remove_files(self, repository: Repository, file_paths: List[str]) -> None:
+        """Removes the `File`, `Task` and `FileScore` rows of the given files."""
+        if not file_paths:
+            return
+
+        file_ids = select(File.id).where(File.repository_id == repository.id, File.path.in_(file_paths))
+
+        db.session.execute(delete(Task).where(Task.file_id.in_(file_ids)))
+        db.session.execute(delete(FileScore).where(FileScore.file_id.in_(file_ids)))
+        db.session.execute(delete(File).where(File.id.in_(file_ids)))
+        db.session.commit()
+
+    def _report_progress(self, stage: str, scheduler: FileScheduler) -> None:
+        if self._on_progress is None:
+            return
+
+        self._on_progress({
+            "stage": stage,
+            "files_discovered": scheduler.discovered,
+            "files_processed": scheduler.processed,
+            "files_failed": scheduler.failed,
+            "files_embedded": self._embedded_files,
+            "chunks_embedded": self._embedded_chunks,
+            "files_persisted": scheduler.persisted,
+            "event_loop_lag_ms": self._resources.loop_lag.stats()["p99_ms"],
+        })
+
+    async def _process_file(self, file_path: str) -> Optional[dict]:
+        result = await self._pipeline.process_file(file_path)
+
+        # The embedding stage may be shared with other repositories, so files are counted here.
+        if result is not None and "chunks" in result:
+            self._embedded_files += 1
+            self._embedded_chunks += len(result["chunks"])
+
+        return result
+
+    async def _sweep_points(self, repository: Repository, point_ids: Dict[str, List[str]]) -> None:
+        """
+        Deletes points left over from previous runs: chunks of re-processed files
+        that no longer exist, and every point of files that were not written
+        again, because they were removed, filtered out or failed.
+        """
+        await qdrant_utils.delete_stale_points(self._repo_path, point_ids)
+
+        if self._changes is None:
+            file_paths = list(db.session.execute(
+                select(File.path).filter_by(repository_id=repository.id)
+            ).scalars())
+
+            await qdrant_utils.delete_orphaned_points(self._repo_path, file_paths)
+        else:
+            changed = set(self._changes.to_remove) | set(self._changes.to_process)
+
+            await qdrant_utils.delete_embeddings_for_files(self._repo_path, [
+                file_path for file_path in (os.path.join(self._repo_path, path) for path in sorted(changed))
+                if file_path not in point_ids
+            ])
 
     async def process(self):
         """
         Processes all relevant files in the repository through the pipeline.
         """
 
-        repository = Repository(
-            name=os.path.basename(self._repo_path)
-        )
-        db.session.add(repository)
+        repository = self.find_repository(self._repo_path)
 
-        db.session.commit()
+        if repository is None:
+            repository = Repository(
+                name=os.path.basename(self._repo_path)
+            )
+            db.session.add(repository)
 
-        pipeline = FileProcessingPipeline([
-            StatGenerationStage(),
-            EmbeddingGenerationStage()
-        ])
+            db.session.commit()
 
         if not os.path.exists(self._repo_path):
             print(f"Repository path does not exist: {self._repo_path}")
             return
 
-        await qdrant_utils.create_collection_for_repo(self._repo_path)
+        print(f"Processing {self._repo_path}: {self._changes or 'full index'}")
 
-        tasks = []
-        for root, _, files in os.walk(self._repo_path, topdown=True):
-            for file_name in files:
-                file_path = os.path.join(root, file_name)
+        if self._resources is not None:
+            return await self._index(repository)
 
-                tasks.append(pipeline.process_file(file_path))
+        self._resources = PipelineResources(current_app.config)
 
+        try:
+            stats = await self._index(repository)
+        finally:
+            await self._resources.close()
 
-        results = await asyncio.gather(*tasks)
+        self._resources.print_stats()
 
-        await qdrant_utils.store_embeddings_for_repo(self._repo_path, results)
+        return {**stats, **self._resources.stats()}
 
-        for result in results:
-            if result is None:
-                continue
+    async def _index(self, repository: Repository) -> dict:
+        config = current_app.config
+        collection_name = qdrant_utils.make_collection_name(self._repo_path)
 
-            file = File(
-                path=result["file_path"],
-                repository_id=repository.id
-            )
+        # An existing collection keeps the profile it was embedded with until it is migrated.
+        profile = None
+
+        if await qdrant_utils.get_qdrant_client().collection_exists(collection_name):
+            profile = EmbeddingProfile.of_repository(repository)
+
+        profile = profile or EmbeddingProfile.from_config(config)
+
+        self._checkpoints = RunCheckpoints.start(repository.id, self._head_commit, self._changes is not None)
+        resumed_files = set(self._checkpoints.persisted)
 
-            db.session.add(file)
+        self._pipeline = FileProcessingPipeline(self._resources.stages(profile), self._checkpoints)
 
+        await qdrant_utils.create_collection_for_repo(
+            self._repo_path, qdrant_utils.CollectionSettings.from_config(config), size=profile.dimensions
+        )
+
+        profile.record(repository)
+        db.session.commit()
+
+        self._remove_files(repository, [
+            file_path for file_path in self._stale_file_paths(repository) if file_path not in resumed_files
+        ])
+
+        point_ids = dict(self._checkpoints.persisted)
+
+        writer = qdrant_utils.QdrantUpsertWriter(collection_name)
+
+        scheduler = FileScheduler(
+            self._process_file,
+            lambda results: self._persist(repository, results, writer, point_ids),
+            workers=config["PIPELINE_WORKERS"],
+            queue_size=config["PIPELINE_QUEUE_SIZE"],
+            flush_size=config["PIPELINE_FLUSH_SIZE"],
+            on_flush=lambda: self._report_progress("processing", scheduler),
+            slots=self._resources.file_slots
+        )
+
+        file_filter = RepositoryFileFilter(self._repo_path, config["IGNORE_GLOBS"])
+
+        self._report_progress("processing", scheduler)
+
+        await scheduler.run(
+            file_path for file_path in self._file_paths(file_filter) if file_path not in resumed_files
+        )
+
+        self._report_progress("finalizing", scheduler)
+
+        await writer.close()
+
+        await self._sweep_points(repository, point_ids)
+
+        score_rollups.refresh_score_rollups(repository.id)
+
+        if scheduler.failed:
+            # Failed files were removed from the index above. The run is left
+            # unfinished and the indexed commit where it was, so the next run
+            # resumes this one or diffs from the old commit, and retries them.
+            print(f"{scheduler.failed} files failed, leaving run {self._checkpoints.run.id} unfinished")
             db.session.commit()
+        else:
+            if self._head_commit is not None:
+                repository.last_indexed_commit = self._head_commit
+
+            self._checkpoints.complete()
+
+        print(f"Files: {scheduler.stats()}, skipped: {file_filter.stats()}, resumed: {len(resumed_files)}")
+        print(f"Points: {writer.stats()}")
+        print(f"Rows: {self._row_counts}")
+        print(f"Token usage: {self._token_usage}")
+
+        return {
+            "files": scheduler.stats(),
+            "skipped_files": file_filter.stats(),
+            "resumed_files": len(resumed_files),
+            "points": writer.stats(),
+            "rows": self._row_counts,
+            "token_usage": self._token_usage
+        }
+
+    async def _persist(
+        self,
+        repository: Repository,
+        results: List[dict],
+        writer: qdrant_utils.QdrantUpsertWriter,
+        point_ids: Dict[str, List[str]]
+    ) -> None:
+        """Stores a batch of processed files in Qdrant and Postgres."""
+
+        stored_point_ids = await qdrant_utils.store_embeddings_for_repo(self._repo_path, results, writer)
+        point_ids.update(stored_point_ids)
 
-            if result["tasks"]:
-                for task in result["tasks"]:
-                    try:
-                        task = Task(
-                            title=task["title"],
-                            description=task["description"],
-                            category=task["category"],
-                            priority=task["priority"],
-                            prompt=task["prompt"],
-                            file_id=file.id
-                        )
+        # Files are only checkpointed as persisted once their points are
+        # written, and the checkpoint is committed together with the rows below.
+        await writer.flush()
 
-                        db.session.add(task)
-                        db.session.commit()
-                    except Exception as e:
-                        print("Error while creating a new task", e)
+        if writer.failed:
+            raise RuntimeError(f"Failed to store {writer.failed} points in {writer.collection_name}")
 
+        self._checkpoints.mark_persisted(results, stored_point_ids)
 
+        for table, count in bulk_persistence.persist_results(repository.id, results).items():
+            self._row_counts[table] = self._row_counts.get(table, 0) + count
+
+        for result in results:
+            for key, count in (result.get("token_usage") or {}).items():
+                self._token_usage[key] += count
 
+            if result.get("analysis_skipped"):
+                self._token_usage["skipped_files"] += 1
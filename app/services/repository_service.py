@@ -1,24 +1,212 @@
-from flask import Response, jsonify
+import asyncio
+import os
+import time
+from typing import Callable, Optional
+from flask import Response, current_app, jsonify
 
-from .github_repository_extractor import GithubRepositoryExtractor
-from .repository_processsing import RepositoryProcessor
-from ..schemas import SetupRepository
+from .github_repository_extractor import GithubRepositoryExtractor, RepositoryChanges
+from .repository_processsing import PipelineResources, RepositoryProcessor
+from . import job_queue, qdrant_utils, score_rollups
+from ..extensions import db
+from ..schemas import SetupRepositories, SetupRepository
 
-async def setup(data: SetupRepository) -> tuple[Response, int]:
-    """Setup function that triggers the repository download and extraction process."""
+SETUP_JOB = "repository_setup"
+BATCH_SETUP_JOB = "repository_batch_setup"
+
+# Seconds between progress updates of a batch, unless a repository changes stage.
+BATCH_PROGRESS_INTERVAL = 1.0
+
+def setup(data: SetupRepository) -> tuple[Response, int]:
+    """Queues the repository download, extraction and processing and returns the ID of the job."""
+
+    job = job_queue.enqueue(SETUP_JOB, {
+        'github_token': data.github_token,
+        'owner': data.owner,
+        'repo': data.repo,
+        'branch': data.branch,
+        'incremental': data.incremental,
+    }, key=f"{data.owner}_{data.repo}")
+
+    return jsonify({'message': 'Repository setup queued', 'job_id': str(job.id)}), 202
+
+def setup_batch(data: SetupRepositories) -> tuple[Response, int]:
+    """Queues the setup of several repositories as one job and returns the ID of the job."""
+
+    repositories = {}
+
+    for repository in data.repositories:
+        repositories.setdefault(f"{repository['owner']}_{repository['repo']}", repository)
+
+    job = job_queue.enqueue(BATCH_SETUP_JOB, {
+        'github_token': data.github_token,
+        'repositories': list(repositories.values()),
+    })
+
+    return jsonify({
+        'message': 'Repository batch setup queued',
+        'job_id': str(job.id),
+        'repositories': len(repositories),
+    }), 202
+
+def _last_indexed_commit(extractor: GithubRepositoryExtractor) -> Optional[str]:
+    """Returns the commit to index the changes since, when the setup is incremental and the repository was indexed."""
+    if not extractor.data.incremental:
+        return None
+
+    repository = RepositoryProcessor.find_repository(extractor.repo_path)
+
+    return repository.last_indexed_commit if repository is not None else None
+
+def _download(extractor: GithubRepositoryExtractor, since: Optional[str]) -> tuple[str, str, Optional[RepositoryChanges]]:
+    """
+    Clones or fetches a repository and returns its path, head commit and the
+    changes since `since`. Only runs git, so it can run in another thread.
+    """
+    repo_path = extractor.extract()
+    head_commit = extractor.head_commit()
+    changes = extractor.changes_since(since) if since else None
+
+    return repo_path, head_commit, changes
+
+async def run_setup(payload: dict, on_progress: Callable[[dict], None]) -> dict:
+    """Job handler that downloads, extracts and processes a repository."""
+
+    data = SetupRepository(**payload)
+
+    on_progress({'stage': 'downloading'})
 
     try:
         extractor = GithubRepositoryExtractor(data)
-        repo_path = extractor.extract()
+        repo_path, head_commit, changes = _download(extractor, _last_indexed_commit(extractor))
     except Exception as e:
-        return jsonify({'message': 'Failed to download and extract repository', "error": e}), 400
+        raise RuntimeError(f"Failed to download and extract repository: {e}") from e
+
+    print(f"Repository downloaded and extracted to: {repo_path}")
 
     try:
-        await RepositoryProcessor(repo_path).process()
+        stats = await RepositoryProcessor(repo_path, head_commit, changes, on_progress).process()
     except Exception as e:
-        return jsonify({'message': 'Failed to process repository', "error": e}), 400
+        raise RuntimeError(f"Failed to process repository: {e}") from e
+    finally:
+        await qdrant_utils.close_qdrant_client()
 
-    print(f"Repository downloaded and extracted to: {repo_path}")
+    return {'repository': os.path.basename(repo_path), 'stats': stats}
+
+async def run_batch_setup(payload: dict, on_progress: Callable[[dict], None]) -> dict:
+    """
+    Job handler that sets up several repositories. Up to
+    BATCH_CLONE_CONCURRENCY are downloaded at once and up to
+    BATCH_REPOSITORY_CONCURRENCY processed at once, and the files of all of
+    them share one set of pipeline resources and BATCH_PIPELINE_WORKERS
+    slots, so the batch is limited by the API rate limits rather than by
+    setting up each repository. A repository that fails does not stop the
+    others. Each repository's key is held from download to the end of its
+    processing, so no setup or migration job of it runs in the meantime;
+    a repository whose key is taken waits for it.
+    """
+    config = current_app.config
+    started = time.perf_counter()
+
+    repositories = [SetupRepository(github_token=payload['github_token'], **repository) for repository in payload['repositories']]
+    progress = {f"{data.owner}_{data.repo}": {'stage': 'queued'} for data in repositories}
+    last_report = 0.0
+
+    def report(key: str, repository_progress: dict) -> None:
+        nonlocal last_report
+
+        stage_changed = repository_progress.get('stage') != progress[key].get('stage')
+        progress[key] = repository_progress
+
+        if not stage_changed and time.monotonic() - last_report < BATCH_PROGRESS_INTERVAL:
+            return
+
+        last_report = time.monotonic()
+        stages = {}
+
+        for state in progress.values():
+            stages[state['stage']] = stages.get(state['stage'], 0) + 1
+
+        on_progress({'stage': 'processing', 'stages': stages, 'repositories': progress})
+
+    clone_slots = asyncio.Semaphore(config['BATCH_CLONE_CONCURRENCY'])
+    repository_slots = asyncio.Semaphore(config['BATCH_REPOSITORY_CONCURRENCY'])
+    resources = PipelineResources(config, workers=config['BATCH_PIPELINE_WORKERS'])
+    holder_id = job_queue.current_job_id.get()
+    app = current_app._get_current_object()
+
+    async def set_up(data: SetupRepository) -> dict:
+        # Each repository gets its own app context, and so its own database
+        # session, so that a failed transaction or a rollback of one
+        # repository leaves the others and their checkpoints alone.
+        with app.app_context():
+            key = f"{data.owner}_{data.repo}"
+
+            while (hold := job_queue.hold(key, holder_id)) is None:
+                report(key, {'stage': 'waiting'})
+                await asyncio.sleep(config['JOB_POLL_INTERVAL'])
+
+            try:
+                async with clone_slots:
+                    report(key, {'stage': 'downloading'})
+                    extractor = GithubRepositoryExtractor(data)
+                    repo_path, head_commit, changes = await asyncio.to_thread(
+                        _download, extractor, _last_indexed_commit(extractor)
+                    )
+
+                async with repository_slots:
+                    processor = RepositoryProcessor(
+                        repo_path, head_commit, changes, lambda repository_progress: report(key, repository_progress), resources
+                    )
+                    stats = await processor.process()
+            except Exception as e:
+                print(f"Failed to set up repository {key}: {e}")
+                db.session.rollback()
+                report(key, {'stage': 'failed'})
+                return {'status': 'failed', 'error': str(e) or type(e).__name__}
+            finally:
+                job_queue.release(hold)
+
+            report(key, {'stage': 'succeeded'})
+            return {'status': 'succeeded', 'stats': stats}
+
+    try:
+        results = await asyncio.gather(*(set_up(data) for data in repositories))
+    finally:
+        await resources.close()
+        await qdrant_utils.close_qdrant_client()
+
+    resources.print_stats()
+
+    return {
+        'repositories': dict(zip(progress, results)),
+        'stats': resources.stats(),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def get_scores(name: str) -> tuple[Response, int]:
+    """Returns the score rollups of a repository, per language and across all languages."""
+
+    repository = RepositoryProcessor.find_repository(name)
+
+    if repository is None:
+        return jsonify({'message': 'Repository not found'}), 404
 
-    return jsonify({'message': 'Repository downloaded and extracted successfully!'}) , 200
+    rollups = score_rollups.get_score_rollups(repository.id)
 
+    return jsonify({
+        'repository': repository.name,
+        'scores': [
+            {
+                'language': rollup.language,
+                'kind': rollup.scoreKind,
+                'file_count': rollup.file_count,
+                'average': rollup.average,
+                'minimum': rollup.minimum,
+                'maximum': rollup.maximum,
+                'distribution': rollup.distribution,
+                'updated_at': rollup.updated_at.isoformat(),
+            }
+            for rollup in rollups
+        ]
+    }), 200
@@ -0,0 +1,126 @@
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import delete, select
+
+from ..extensions import db
+from ..models import IndexingRun, RunFile
+
+RUNNING = "running"
+COMPLETED = "completed"
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class RunCheckpoints:
+    """
+        Per-file checkpoints of an indexing run. The outputs of each completed
+        stage and the files already persisted are recorded in the run, so when
+        a run is interrupted the next run of the same commit resumes it: files
+        that were persisted are skipped and checkpointed stages are restored
+        instead of being run again.
+
+        Checkpoints are added to the session without committing, and are
+        committed in the same transaction as the next batch of persisted
+        files, so a file is never marked as persisted without its rows.
+    """
+
+    def __init__(self, run: IndexingRun, resumed: bool):
+        self.run = run
+        self.resumed = resumed
+        self.persisted: Dict[str, List[str]] = {}
+        self._files: Dict[str, RunFile] = {}
+
+        if resumed:
+            for run_file in db.session.execute(select(RunFile).filter_by(run_id=run.id)).scalars():
+                if run_file.persisted:
+                    self.persisted[run_file.path] = run_file.point_ids or []
+                else:
+                    self._files[run_file.path] = run_file
+
+    @classmethod
+    def start(cls, repository_id: uuid.UUID, head_commit: Optional[str], incremental: bool) -> "RunCheckpoints":
+        """
+        Resumes the unfinished run of the repository if it indexed the same
+        commit in the same mode, and otherwise discards unfinished runs and
+        starts a new one.
+        """
+        unfinished = list(db.session.execute(
+            select(IndexingRun)
+            .filter_by(repository_id=repository_id, status=RUNNING)
+            .order_by(IndexingRun.created_at.desc())
+        ).scalars())
+
+        if unfinished and head_commit is not None and unfinished[0].head_commit == head_commit \
+                and unfinished[0].incremental == incremental:
+            run = unfinished[0]
+            print(f"Resuming indexing run {run.id} of {head_commit}")
+            return cls(run, resumed=True)
+
+        run_ids = [run.id for run in unfinished]
+
+        if run_ids:
+            db.session.execute(delete(RunFile).where(RunFile.run_id.in_(run_ids)))
+            db.session.execute(delete(IndexingRun).where(IndexingRun.id.in_(run_ids)))
+
+        run = IndexingRun(
+            repository_id=repository_id,
+            head_commit=head_commit,
+            incremental=incremental,
+            status=RUNNING,
+            created_at=_now()
+        )
+        db.session.add(run)
+        db.session.commit()
+
+        return cls(run, resumed=False)
+
+    def _file(self, file_path: str, content_hash: str) -> RunFile:
+        run_file = self._files.get(file_path)
+
+        if run_file is None:
+            run_file = RunFile(run_id=self.run.id, path=file_path, content_hash=content_hash)
+            db.session.add(run_file)
+            self._files[file_path] = run_file
+        elif run_file.content_hash != content_hash:
+            run_file.content_hash = content_hash
+            run_file.stages = {}
+
+        return run_file
+
+    def restore(self, file_path: str, content_hash: str) -> Dict[str, dict]:
+        """Returns the checkpointed outputs of a file per stage, if its content is unchanged."""
+        run_file = self._files.get(file_path)
+
+        if run_file is None or run_file.content_hash != content_hash:
+            return {}
+
+        return run_file.stages
+
+    def record(self, file_path: str, content_hash: str, stage: str, outputs: dict) -> None:
+        run_file = self._file(file_path, content_hash)
+        run_file.stages = {**run_file.stages, stage: outputs}
+
+    def mark_persisted(self, results: List[dict], point_ids: Dict[str, List[str]]) -> None:
+        """Marks files as persisted, dropping their stage outputs which are no longer needed."""
+        for result in results:
+            file_path = result["file_path"]
+            run_file = self._file(file_path, result["content_hash"])
+
+            run_file.stages = {}
+            run_file.persisted = True
+            run_file.point_ids = point_ids.get(file_path, [])
+
+            self.persisted[file_path] = run_file.point_ids
+            del self._files[file_path]
+
+        self.run.updated_at = _now()
+
+    def complete(self) -> None:
+        """Marks the run as completed and deletes its checkpoints."""
+        db.session.execute(delete(RunFile).where(RunFile.run_id == self.run.id))
+
+        self.run.status = COMPLETED
+        self.run.updated_at = self.run.finished_at = _now()
+
+        db.session.commit()
@@ -0,0 +1,116 @@
+import asyncio
+import contextlib
+import itertools
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+# Paths taken from `file_paths` at a time, off the event loop.
+PRODUCER_BATCH_SIZE = 32
+
+class FileScheduler:
+    """
+        Streams files through a pipeline: a producer feeds paths into a bounded
+        queue, a fixed number of workers process them, and results are handed
+        to `sink` in batches as they complete, so memory stays bounded by the
+        queue, worker and batch sizes rather than the repository size.
+        `on_flush` is called after each batch is handed off, e.g. to report
+        progress. Schedulers given the same `slots` share them, bounding the
+        files processed at once across all of them.
+
+        `file_paths` may walk and read the disk lazily, e.g. to filter the
+        files, so it is iterated in a thread.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[str], Awaitable[dict]],
+        sink: Callable[[List[dict]], Awaitable[None]],
+        workers: int = 16,
+        queue_size: int = 64,
+        flush_size: int = 50,
+        on_flush: Optional[Callable[[], None]] = None,
+        slots: Optional[asyncio.Semaphore] = None,
+    ):
+        self.process = process
+        self.sink = sink
+        self.workers = workers
+        self.queue_size = queue_size
+        self.flush_size = flush_size
+        self.on_flush = on_flush
+        self.slots = slots or contextlib.nullcontext()
+
+        self.discovered = 0
+        self.processed = 0
+        self.failed = 0
+        self.persisted = 0
+
+    async def run(self, file_paths: Iterable[str]) -> None:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        results: List[dict] = []
+        flush_lock = asyncio.Lock()
+
+        async def flush():
+            async with flush_lock:
+                if not results:
+                    return
+
+                batch = results[:]
+                results.clear()
+
+                await self.sink(batch)
+
+                self.persisted += len(batch)
+
+                if self.on_flush is not None:
+                    self.on_flush()
+
+        async def produce():
+            iterator = iter(file_paths)
+
+            while batch := await asyncio.to_thread(list, itertools.islice(iterator, PRODUCER_BATCH_SIZE)):
+                for file_path in batch:
+                    self.discovered += 1
+                    await queue.put(file_path)
+
+            for _ in range(self.workers):
+                await queue.put(None)
+
+        async def work():
+            while True:
+                file_path = await queue.get()
+
+                if file_path is None:
+                    return
+
+                try:
+                    async with self.slots:
+                        result = await self.process(file_path)
+                except Exception as e:
+                    print(f"Error processing file {file_path}: {e}")
+                    self.failed += 1
+                    continue
+
+                self.processed += 1
+
+                if result is None:
+                    continue
+
+                results.append(result)
+
+                if len(results) >= self.flush_size:
+                    await flush()
+
+        async with asyncio.TaskGroup() as group:
+            group.create_task(produce())
+
+            for _ in range(self.workers):
+                group.create_task(work())
+
+        await flush()
+
+    def stats(self) -> dict:
+        return {
+            "discovered": self.discovered,
+            "processed": self.processed,
+            "failed": self.failed,
+            "persisted": self.persisted,
+        }
@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+from uuid import UUID
+from sqlalchemy import delete, func, insert, select
+
+from ..extensions import db
+from ..models import File, FileScore, ScoreRollup
+
+ALL_LANGUAGES = "*"
+UNKNOWN_LANGUAGE = "unknown"
+
+# Scores range from 0 to 100 and are bucketed in steps of 10, with 100
+# counted in the last bucket.
+BUCKET_WIDTH = 10
+BUCKET_COUNT = 10
+
+class _Accumulator:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.distribution = [0] * BUCKET_COUNT
+
+    def add(self, score: float, count: int) -> None:
+        self.count += count
+        self.total += score * count
+        self.minimum = score if self.minimum is None else min(self.minimum, score)
+        self.maximum = score if self.maximum is None else max(self.maximum, score)
+
+        bucket = min(max(int(score // BUCKET_WIDTH), 0), BUCKET_COUNT - 1)
+        self.distribution[bucket] += count
+
+def refresh_score_rollups(repository_id: UUID) -> int:
+    """
+    Recomputes the score rollups of a repository from its `FileScore` rows and
+    returns the number of rollup rows written.
+
+    Scores are grouped by (language, kind, score) in the database, which keeps
+    the result small since scores are integers from 0 to 100, and the
+    averages and distributions are derived from those groups.
+    """
+    groups = db.session.execute(
+        select(File.language, FileScore.scoreKind, FileScore.score, func.count())
+        .join(File, FileScore.file_id == File.id)
+        .where(File.repository_id == repository_id)
+        .group_by(File.language, FileScore.scoreKind, FileScore.score)
+    ).all()
+
+    accumulators: Dict[Tuple[str, str], _Accumulator] = {}
+
+    for language, score_kind, score, count in groups:
+        for key in ((language or UNKNOWN_LANGUAGE, score_kind), (ALL_LANGUAGES, score_kind)):
+            accumulators.setdefault(key, _Accumulator()).add(score, count)
+
+    updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows: List[dict] = [
+        {
+            "repository_id": repository_id,
+            "language": language,
+            "scoreKind": score_kind,
+            "file_count": accumulator.count,
+            "average": accumulator.total / accumulator.count,
+            "minimum": accumulator.minimum,
+            "maximum": accumulator.maximum,
+            "distribution": accumulator.distribution,
+            "updated_at": updated_at,
+        }
+        for (language, score_kind), accumulator in accumulators.items()
+    ]
+
+    try:
+        db.session.execute(delete(ScoreRollup).where(ScoreRollup.repository_id == repository_id))
+
+        if rows:
+            db.session.execute(insert(ScoreRollup), rows)
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return len(rows)
+
+def get_score_rollups(repository_id: UUID) -> List[ScoreRollup]:
+    return list(db.session.execute(
+        select(ScoreRollup)
+        .where(ScoreRollup.repository_id == repository_id)
+        .order_by(ScoreRollup.language, ScoreRollup.scoreKind)
+    ).scalars())
@@ -0,0 +1,131 @@
+from typing import Dict, List, Optional
+from flask import Response, current_app, jsonify
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import FieldCondition, Filter, MatchAny, MatchValue
+
+from .embedding_cache import EmbeddingCache
+from .embedding_profiles import EmbeddingProfile
+from .embeddings import BatchEmbedder
+from .repository_processsing import RepositoryProcessor
+from .service_loop import service_loop
+from . import qdrant_utils
+from ..schemas import SearchRepository
+
+# Seconds a search may take before the request fails.
+SEARCH_TIMEOUT = 30
+
+_query_embedders: Dict[EmbeddingProfile, BatchEmbedder] = {}
+_query_cache: Optional[EmbeddingCache] = None
+
+def get_query_embedder(profile: Optional[EmbeddingProfile] = None) -> BatchEmbedder:
+    """
+    Returns the embedder of search queries for an embedding profile,
+    created on first use on the service loop. Queries go through the
+    embedding cache, so repeated searches are not embedded again.
+    """
+    global _query_cache
+
+    profile = profile or EmbeddingProfile()
+
+    if _query_cache is None:
+        _query_cache = EmbeddingCache()
+
+    if profile not in _query_embedders:
+        _query_embedders[profile] = BatchEmbedder(
+            cache=_query_cache,
+            model=profile.model,
+            dimensions=profile.request_dimensions,
+            linger=0
+        )
+
+    return _query_embedders[profile]
+
+def make_filter(languages: List[str], path: Optional[str]) -> Optional[Filter]:
+    conditions = []
+
+    if languages:
+        conditions.append(FieldCondition(key="language", match=MatchAny(any=languages)))
+
+    if path:
+        conditions.append(FieldCondition(key="path_prefixes", match=MatchValue(value=path)))
+
+    return Filter(must=conditions) if conditions else None
+
+async def search_chunks(
+    collection_name: str,
+    search: SearchRepository,
+    embedder: Optional[BatchEmbedder] = None,
+    qdrant_client: Optional[AsyncQdrantClient] = None,
+    settings: Optional[qdrant_utils.CollectionSettings] = None,
+    profile: Optional[EmbeddingProfile] = None
+) -> Optional[List[dict]]:
+    """
+    Returns the chunks of a collection closest to the query, best first, or
+    None when the collection does not exist. The query is embedded with
+    `profile`, which must be the one the collection was embedded with, and
+    searched with the search parameters of `settings` for the collection.
+    """
+    qdrant_client = qdrant_client or qdrant_utils.get_qdrant_client()
+
+    if not await qdrant_client.collection_exists(collection_name):
+        return None
+
+    search_params = None
+    if settings is not None:
+        search_params = settings.search_params(await qdrant_client.get_collection(collection_name))
+
+    [vector] = await (embedder or get_query_embedder(profile)).embed([search.q])
+
+    response = await qdrant_client.query_points(
+        collection_name=collection_name,
+        query=vector,
+        query_filter=make_filter(search.languages, search.path),
+        limit=search.limit,
+        offset=search.offset,
+        score_threshold=search.score_threshold,
+        search_params=search_params,
+        with_payload=True
+    )
+
+    return [
+        {
+            'score': point.score,
+            'file_path': point.payload.get('path') or point.payload['file_path'],
+            'language': point.payload['language'],
+            'chunk_index': point.payload.get('chunk_index'),
+            'start_line': point.payload.get('start_line'),
+            'end_line': point.payload.get('end_line'),
+            'chunk': point.payload['chunk'],
+        }
+        for point in response.points
+    ]
+
+def search(name: str, search: SearchRepository) -> tuple[Response, int]:
+    """Returns the chunks of a repository most similar to a query, with their file and lines."""
+
+    repository = RepositoryProcessor.find_repository(name)
+
+    if repository is None:
+        return jsonify({'message': 'Repository not found'}), 404
+
+    results = service_loop.run(
+        search_chunks(
+            qdrant_utils.make_collection_name(repository.name),
+            search,
+            settings=qdrant_utils.CollectionSettings.from_config(current_app.config),
+            profile=EmbeddingProfile.of_repository(repository)
+        ),
+        timeout=SEARCH_TIMEOUT
+    )
+
+    if results is None:
+        return jsonify({'message': 'Repository is not indexed'}), 404
+
+    return jsonify({
+        'repository': repository.name,
+        'query': search.q,
+        'results': results,
+        'limit': search.limit,
+        'offset': search.offset,
+        'next_offset': search.offset + len(results) if len(results) == search.limit else None,
+    }), 200
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+class ServiceLoop:
+    """
+        Event loop running in a daemon thread, for clients that should outlive
+        a single request. Async views run each request on a short-lived loop,
+        and clients bound to such a loop cannot be reused; coroutines submitted
+        here share one long-lived set of clients and their connection pools.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="service-loop", daemon=True).start()
+                self._loop = loop
+
+            return self._loop
+
+    def run(self, coroutine: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """
+        Runs a coroutine on the loop and waits for its result from the calling
+        thread. A coroutine that times out is cancelled, so it stops using the
+        shared clients.
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._start())
+
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+service_loop = ServiceLoop()
@@ -1,3 +1,5 @@
 from .pipeline_stage  import PipelineStage
 from .stat_generation_stage import StatGenerationStage
 
+from .token_budget_stage import TokenBudgetStage
+from .static_metrics_stage import StaticMetricsStage
@@ -1,7 +1,38 @@
+import asyncio
+import contextlib
+from typing import FrozenSet, Optional
+
 class PipelineStage:
     """
         Base class for all pipeline stages. All pipeline stages must inherit from this class"
+
+        Stages declare the metadata keys they read (`inputs`) and write
+        (`outputs`). A stage runs once the earlier stages producing its inputs
+        are done, concurrently with the stages it does not depend on. Every
+        stage can limit how many files it processes at once (`concurrency`)
+        and how long it may take per file (`timeout`, in seconds), across
+        every pipeline the stage is part of.
     """
 
+    inputs: FrozenSet[str] = frozenset()
+    outputs: FrozenSet[str] = frozenset()
+
+    # Whether the outputs of the stage are checkpointed, so a resumed run can
+    # restore them instead of running the stage again. Stages that are cheap
+    # to re-run, or whose outputs are large, can opt out.
+    checkpoint = True
+
+    def __init__(self, concurrency: Optional[int] = None, timeout: Optional[float] = None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._slots = None
+
+    def slots(self):
+        """Returns the limit on the files the stage processes at once, created on first use."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency) if self.concurrency else contextlib.nullcontext()
+
+        return self._slots
+
     async def process(self, file_path: str, file_content: str, metadata: dict):
         raise NotImplementedError("Pipeline stage must implement the `process` method")
@@ -1,10 +1,21 @@
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
-from pydantic import BaseModel, Field
-from typing import List
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, List, Optional, Tuple
+import asyncio
+import openai
+import time
 
 from . import PipelineStage
+from ..analysis_batching import AnalysisBatcher, PendingAnalysis
+from ..analysis_cache import AnalysisCache
+from ..embedding_cache import content_hash
+from ..rate_limits import RateLimiter, get_rate_limiter
+from ..token_counting import count_tokens
+from ..file_language_detection import UNKNOWN_LANGUAGE
+from ..static_metrics import comment_syntax, compute_metrics, describe_metrics
+from ..triage import TIER_ESCALATED, TIER_FULL, TIER_STATIC, TIER_TRIAGE, TriagePolicy
 
 class Task(BaseModel):
     title: str
@@ -20,19 +31,117 @@ class CodeReport(BaseModel):
     performance_score: int = Field(..., ge=0, le=100)
     tasks: List[Task]
 
-class StatGenerationStage(PipelineStage):
+# Tasks kept for a file after merging the reports of its sections.
+MAX_TASKS = 5
+PRIORITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+# Tokens of the prompt template and of the completion, added to the tokens
+# of the content when estimating what a call counts against the rate limit.
+ANALYSIS_TOKEN_OVERHEAD = 1_200
+
+# Tokens of the header and of the report of each file in a batched analysis.
+BATCH_FILE_TOKEN_OVERHEAD = 400
+
+# Context given in place of the metrics of a file that was not measured.
+UNMEASURED = "not measured"
+
+def merge_reports(reports: List[Tuple[CodeReport, int]]) -> CodeReport:
     """
-    Pipeline stage to generate statistics for a file
+    Merges the reports of the sections of a file into one report. Scores are
+    averaged weighted by the size of each section, and the highest priority
+    tasks across sections are kept.
     """
+    total_weight = sum(weight for _, weight in reports)
+
+    def average(field: str) -> int:
+        return round(sum(getattr(report, field) * weight for report, weight in reports) / total_weight)
+
+    tasks = {}
+    for report, _ in reports:
+        for task in report.tasks:
+            tasks.setdefault(task.title.strip().lower(), task)
+
+    return CodeReport(
+        documentation_score=average("documentation_score"),
+        bugs_score=average("bugs_score"),
+        security_score=average("security_score"),
+        performance_score=average("performance_score"),
+        tasks=sorted(tasks.values(), key=lambda task: PRIORITY_ORDER.get(task.priority.lower(), len(PRIORITY_ORDER)))[:MAX_TASKS]
+    )
+
+def split_reports(parsed: Any, count: int) -> List[Optional[CodeReport]]:
+    """
+    Splits the parsed response of a batched analysis into the report of each
+    of its `count` files, matched by file id. Files without a valid report
+    get None.
+    """
+    entries = parsed.get("reports") if isinstance(parsed, dict) else parsed
+    reports: List[Optional[CodeReport]] = [None] * count
+
+    if not isinstance(entries, list):
+        return reports
+
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
 
-    def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-4")
+        try:
+            index = int(entry.get("file")) - 1
+        except (TypeError, ValueError):
+            continue
+
+        if not 0 <= index < count or reports[index] is not None:
+            continue
+
+        try:
+            reports[index] = CodeReport(**entry)
+        except (ValidationError, TypeError):
+            continue
+
+    return reports
+
+class ReportAnalyzer:
+    """
+    Generates the reports of files with one model. When a cache is given,
+    reports are reused for content that was already analyzed with the same
+    model and prompt, wherever it was found.
+
+    Files of at most `batch_file_tokens` tokens are analyzed together, up to
+    `batch_max_files` files and `batch_max_tokens` tokens per request, so
+    they share one round-trip and one copy of the instructions. A file the
+    batch response has no valid report for is analyzed again on its own.
+    Setting `batch_max_files` to 1 disables batching.
+
+    Calls wait on `semaphore` when given, so analyzers sharing it stay
+    within `max_concurrency` calls in total.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        model: str = "gpt-4",
+        cache: Optional[AnalysisCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        batch_max_files: int = 8,
+        batch_max_tokens: int = 3_000,
+        batch_file_tokens: int = 600,
+        batch_linger: float = 0.2,
+        semaphore: Optional[asyncio.Semaphore] = None
+    ):
+        self.semaphore = semaphore or asyncio.Semaphore(max_concurrency)
+        self.model = model
+        self.cache = cache
+        self.rate_limiter = rate_limiter or get_rate_limiter(model)
+        # Retries are left to the rate limiter, which also reads the rate limit headers.
+        self.llm = ChatOpenAI(model=model, max_retries=0, include_response_headers=True)
         self.prompt = ChatPromptTemplate.from_template(
             """
             Generate a report for this file {file_path}:
 
             {content}
 
+            Metrics measured locally for the whole file: {metrics}
+
             The report should include the following statistics:
 
             - A score from 0 to 100 indicating the percentage of documentation in the file.
@@ -87,30 +196,331 @@ class StatGenerationStage(PipelineStage):
             }}
             """
         )
-        self.chain = self.prompt | self.llm | JsonOutputParser()
+        self.batch_prompt = ChatPromptTemplate.from_template(
+            """
+            Generate a report for each of the following {file_count} files. Each file starts with a line "=== File <id>: <path> ===", followed by a line with metrics measured locally for the whole file.
 
-    async def process(self, file_path: str, file_content: str, metadata: dict):
-        line_count = len(file_content.splitlines())
-        word_count = len(file_content.split())
+            {files}
+
+            For each file, the report should include the following statistics:
+
+            - A score from 0 to 100 indicating the percentage of documentation in the file.
+            - A score from 0 to 100 indicating the presence of potential bugs in the file.
+            - A score from 0 to 100 indicating the presence of potential security vulnerabilities in the file.
+            - A score from 0 to 100 indicating the presence of potential performance issues in the file.
+
+            Also include a list of up to 5 tasks that can be performed to improve each of the above scores.
+            The tasks should include the title, description, priority and a prompt that a llm can use to start working on the task.
+
+            Ensure that the tasks are specific to the code of each file and not generic. Focus on actionable improvements based on the actual content of the file.
+
+            If a file is not a code file, just zero out its scores and return an empty list of tasks.
+
+            The response should be a JSON object with one report per file, in the order the files were given, each with the id of its file:
+
+            {{
+                "reports": [
+                    {{
+                        "file": 1,
+                        "documentation_score": 80,
+                        "bugs_score": 60,
+                        "security_score": 40,
+                        "performance_score": 20,
+                        "tasks": [
+                            {{
+                                "title": "Improve Documentation",
+                                "description": "Add comments to explain the purpose of each function and variable in the code.",
+                                "category": "documentation",
+                                "priority": "high",
+                                "prompt": "Write comments to explain the purpose of each function and variable in the code."
+                            }}
+                        ]
+                    }}
+                ]
+            }}
+            """
+        )
+        self.chain = self.prompt | self.llm
+        self.batch_chain = self.batch_prompt | self.llm
+        self.parser = JsonOutputParser()
+        # Changes to either prompt invalidate the cached reports.
+        self.prompt_version = content_hash(
+            self.prompt.messages[0].prompt.template + self.batch_prompt.messages[0].prompt.template
+        )[:16]
+
+        self.batch_file_tokens = batch_file_tokens
+        self.batcher = AnalysisBatcher(
+            self._analyze_batch,
+            max_files=batch_max_files,
+            max_tokens=batch_max_tokens,
+            linger=batch_linger
+        ) if batch_max_files > 1 else None
+        self.fallbacks = 0
+
+    async def analyze(
+        self,
+        file_path: str,
+        content: str,
+        metrics: str = "",
+        token_count: Optional[int] = None,
+        batchable: bool = True
+    ) -> Tuple[CodeReport, dict]:
+        """
+        Returns the report and usage (tokens and seconds) of some content,
+        running the analysis prompt unless the report is cached. Cached
+        reports cost nothing. `metrics` describes the static metrics of the
+        file, given to the model as context. `token_count` is that of the
+        content when already counted, so it is not counted again on the
+        event loop. Content that is not `batchable`, such as a section of a
+        file, is always analyzed alone.
+        """
+        if token_count is None:
+            token_count = count_tokens(content, self.model)
 
-        metadata.update({"line_count": line_count, "word_count": word_count})
+        if self.cache is None:
+            return await self._analyze_file(file_path, content, metrics, token_count, batchable)
+
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+
+        async def create() -> Tuple[dict, dict]:
+            report, analysis_usage = await self._analyze_file(file_path, content, metrics, token_count, batchable)
+            usage.update(analysis_usage)
+            return report.model_dump(), analysis_usage
+
+        report = await self.cache.get_or_create(self.model, self.prompt_version, content, create)
+
+        return CodeReport(**report), usage
+
+    def batch_stats(self) -> dict:
+        stats = self.batcher.stats() if self.batcher is not None else {}
+        return {**stats, "fallbacks": self.fallbacks}
+
+    async def _analyze_file(
+        self, file_path: str, content: str, metrics: str, token_count: int, batchable: bool
+    ) -> Tuple[CodeReport, dict]:
+        """Analyzes small batchable content in a batch, and anything else or what its batch left out alone."""
+        if self.batcher is not None and batchable:
+            if token_count <= self.batch_file_tokens:
+                result = await self.batcher.analyze(file_path, content, token_count, metrics)
+
+                if result is not None:
+                    return result
+
+                self.fallbacks += 1
+
+        return await self._analyze(file_path, content, metrics, token_count)
+
+    async def _analyze_batch(self, batch: List[PendingAnalysis]) -> List[Optional[Tuple[CodeReport, dict]]]:
+        """
+        Analyzes a batch of files in one request. Usage is split between the
+        files that got a valid report in proportion to their size; files
+        without one get None.
+        """
+        files = "\n\n".join(
+            f"=== File {index + 1}: {pending.file_path} ===\nMetrics: {pending.context or UNMEASURED}\n{pending.content}"
+            for index, pending in enumerate(batch)
+        )
+
+        async def request():
+            message = await self.batch_chain.ainvoke({
+                "file_count": len(batch),
+                "files": files
+            })
+
+            return message, message.response_metadata.get("headers") or {}
+
+        try:
+            async with self.semaphore:
+                started = time.perf_counter()
+                message = await self.rate_limiter.run(
+                    request,
+                    tokens=sum(pending.token_count for pending in batch)
+                    + ANALYSIS_TOKEN_OVERHEAD + BATCH_FILE_TOKEN_OVERHEAD * len(batch)
+                )
+        except openai.BadRequestError as e:
+            # e.g. the batch exceeds the context window: its files are retried alone.
+            print(f"Batched analysis of {len(batch)} files was rejected: {e}")
+            return [None] * len(batch)
 
         try:
-            result = await self.chain.ainvoke({
+            reports = split_reports(self.parser.parse(message.content), len(batch))
+        except Exception as e:
+            print(f"Failed to parse batched analysis of {len(batch)} files: {e}")
+            reports = [None] * len(batch)
+
+        seconds = time.perf_counter() - started
+        usage = message.usage_metadata or {}
+        weights = [pending.token_count + 1 if report is not None else 0 for pending, report in zip(batch, reports)]
+        total_weight = sum(weights) or 1
+
+        return [
+            (report, {
+                "prompt_tokens": round(usage.get("input_tokens", 0) * weight / total_weight),
+                "completion_tokens": round(usage.get("output_tokens", 0) * weight / total_weight),
+                "seconds": seconds
+            }) if report is not None else None
+            for report, weight in zip(reports, weights)
+        ]
+
+    async def _analyze(self, file_path: str, content: str, metrics: str, token_count: int) -> Tuple[CodeReport, dict]:
+        async def request():
+            message = await self.chain.ainvoke({
                 "file_path": file_path,
-                "content": file_content
+                "content": content,
+                "metrics": metrics or UNMEASURED
             })
 
-            report = CodeReport(**result)
+            return message, message.response_metadata.get("headers") or {}
 
-            metadata.update({
-                "scores": {
-                    "documentation": report.documentation_score,
-                    "bugs": report.bugs_score,
-                    "security": report.security_score,
-                    "performance": report.performance_score
-                },
-                "tasks": [task.model_dump() for task in report.tasks]
-            })
-        except Exception as e:
-            print(f"Error processing file {file_path}: {e}")
+        async with self.semaphore:
+            started = time.perf_counter()
+            message = await self.rate_limiter.run(
+                request,
+                tokens=token_count + ANALYSIS_TOKEN_OVERHEAD
+            )
+
+        usage = message.usage_metadata or {}
+
+        return CodeReport(**self.parser.parse(message.content)), {
+            "prompt_tokens": usage.get("input_tokens", 0),
+            "completion_tokens": usage.get("output_tokens", 0),
+            "seconds": time.perf_counter() - started
+        }
+
+class StatGenerationStage(PipelineStage):
+    """
+    Pipeline stage to generate statistics for a file. Files are analyzed by
+    the model `triage` routes them to: the full `model`, or the cheaper
+    triage model, possibly followed by the full model when the triage
+    report is risky. The tier each file went through is recorded with its
+    results. The static metrics of a file are given to the model as context;
+    files skipped by the analysis only get the documentation score they
+    measure.
+    """
+
+    inputs = frozenset({"analysis_skipped", "token_count", "sections", "section_token_counts", "static_metrics"})
+    outputs = frozenset({"scores", "tasks", "token_usage", "analysis_tier", "analysis_model"})
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        model: str = "gpt-4",
+        cache: Optional[AnalysisCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        batch_max_files: int = 8,
+        batch_max_tokens: int = 3_000,
+        batch_file_tokens: int = 600,
+        batch_linger: float = 0.2,
+        triage: Optional[TriagePolicy] = None
+    ):
+        super().__init__(concurrency, timeout)
+
+        batching = {
+            "batch_max_files": batch_max_files,
+            "batch_max_tokens": batch_max_tokens,
+            "batch_file_tokens": batch_file_tokens,
+            "batch_linger": batch_linger,
+        }
+
+        self.triage = triage or TriagePolicy()
+        # Both models share one limit on the calls in flight.
+        semaphore = asyncio.Semaphore(max_concurrency)
+        self.analyzer = ReportAnalyzer(max_concurrency, model, cache, rate_limiter, semaphore=semaphore, **batching)
+        self.triage_analyzer = ReportAnalyzer(
+            max_concurrency, self.triage.model, cache, semaphore=semaphore, **batching
+        ) if self.triage.uses_triage_model else None
+        self.tier_counts = {tier: 0 for tier in (TIER_FULL, TIER_TRIAGE, TIER_ESCALATED, TIER_STATIC)}
+
+    async def analyze(
+        self, file_path: str, content: str, metrics: str = "", token_count: Optional[int] = None
+    ) -> Tuple[CodeReport, dict]:
+        """Returns the report and usage of some content from the full model."""
+        return await self.analyzer.analyze(file_path, content, metrics, token_count)
+
+    def batch_stats(self) -> dict:
+        analyzers = [self.analyzer] + ([self.triage_analyzer] if self.triage_analyzer is not None else [])
+        return {analyzer.model: analyzer.batch_stats() for analyzer in analyzers}
+
+    async def _analyze_sections(
+        self,
+        analyzer: ReportAnalyzer,
+        file_path: str,
+        sections: List[str],
+        token_counts: List[Optional[int]],
+        metrics: str
+    ) -> Tuple[CodeReport, List[Tuple[CodeReport, dict]]]:
+        """Returns the report of a file merged from those of its sections, and the analysis of each section."""
+        if len(sections) == 1:
+            analyses = [await analyzer.analyze(file_path, sections[0], metrics, token_counts[0])]
+        else:
+            analyses = await asyncio.gather(*(
+                analyzer.analyze(
+                    f"{file_path} (section {index + 1} of {len(sections)})", section, metrics, token_count, batchable=False
+                )
+                for index, (section, token_count) in enumerate(zip(sections, token_counts))
+            ))
+
+        report = merge_reports([
+            (section_report, len(section))
+            for section, (section_report, _) in zip(sections, analyses)
+        ]) if len(analyses) > 1 else analyses[0][0]
+
+        return report, list(analyses)
+
+    async def process(self, file_path: str, file_content: str, metadata: dict):
+        metrics = metadata.get("static_metrics")
+
+        if metadata.get("analysis_skipped"):
+            # Only what was measured locally is known about the file.
+            if metrics is not None:
+                self.tier_counts[TIER_STATIC] += 1
+                metadata.update({
+                    "scores": {"documentation": metrics["documentation_score"]},
+                    "analysis_tier": TIER_STATIC
+                })
+            return
+
+        if metrics is None:
+            metrics = compute_metrics(file_content, comment_syntax(metadata.get("language", UNKNOWN_LANGUAGE)))
+
+        # Counted by the token budget stage, with the tokenizer of the full
+        # model, which is close enough for the triage model's batching and
+        # rate limits.
+        if metadata.get("sections"):
+            sections = metadata["sections"]
+            token_counts = metadata.get("section_token_counts") or [None] * len(sections)
+        else:
+            sections = [file_content]
+            token_counts = [metadata.get("token_count")]
+
+        context = describe_metrics(metrics)
+
+        tier = self.triage.first_tier(metrics)
+        analyzer = self.triage_analyzer if tier == TIER_TRIAGE else self.analyzer
+
+        report, analyses = await self._analyze_sections(analyzer, file_path, sections, token_counts, context)
+
+        if tier == TIER_TRIAGE and self.triage.escalate(report):
+            tier, analyzer = TIER_ESCALATED, self.analyzer
+            report, escalated = await self._analyze_sections(analyzer, file_path, sections, token_counts, context)
+            analyses += escalated
+
+        self.tier_counts[tier] += 1
+
+        metadata.update({
+            "scores": {
+                "documentation": report.documentation_score,
+                "bugs": report.bugs_score,
+                "security": report.security_score,
+                "performance": report.performance_score
+            },
+            "tasks": [task.model_dump() for task in report.tasks],
+            "token_usage": {
+                "prompt_tokens": sum(usage["prompt_tokens"] for _, usage in analyses),
+                "completion_tokens": sum(usage["completion_tokens"] for _, usage in analyses)
+            },
+            "analysis_tier": tier,
+            "analysis_model": analyzer.model
+        })
@@ -0,0 +1,58 @@
+from typing import Optional
+
+from . import PipelineStage
+from ..process_pool import ProcessPoolOffloader
+from ..static_metrics import comment_syntax, compute_metrics
+
+class StaticMetricsStage(PipelineStage):
+    """
+    Pipeline stage that measures a file locally, without any API call: line
+    and word counts, comment ratio, cyclomatic complexity, function lengths
+    and TODO markers, using the comment syntax of its language. Files are
+    measured in `offloader` when one is given.
+
+    The metrics are passed to the analysis as context, and files with fewer
+    than `min_code_lines` lines of code are marked to skip it.
+    """
+
+    inputs = frozenset({"language"})
+    outputs = frozenset({"static_metrics", "line_count", "word_count", "analysis_skipped"})
+
+    # Measuring is cheaper than restoring a checkpoint.
+    checkpoint = False
+
+    def __init__(
+        self,
+        offloader: Optional[ProcessPoolOffloader] = None,
+        min_code_lines: int = 0,
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        super().__init__(concurrency, timeout)
+        self.offloader = offloader or ProcessPoolOffloader()
+        self.min_code_lines = min_code_lines
+        self.measured_files = 0
+        self.trivial_files = 0
+
+    def stats(self) -> dict:
+        return {
+            "files": self.measured_files,
+            "trivial": self.trivial_files,
+        }
+
+    async def process(self, file_path: str, file_content: str, metadata: dict):
+        metrics = await self.offloader.run(
+            len(file_content), compute_metrics, file_content, comment_syntax(metadata["language"])
+        )
+
+        self.measured_files += 1
+
+        metadata.update({
+            "static_metrics": metrics,
+            "line_count": metrics["line_count"],
+            "word_count": metrics["word_count"],
+        })
+
+        if metrics["code_lines"] < self.min_code_lines:
+            self.trivial_files += 1
+            metadata["analysis_skipped"] = "trivial"
@@ -0,0 +1,113 @@
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from langchain.text_splitter import RecursiveCharacterTextSplitter, Language
+
+from . import PipelineStage
+from ..process_pool import ProcessPoolOffloader
+from ..token_counting import count_tokens
+
+# Splitters that break sections on the syntax of a language (classes,
+# functions, headings), keyed by the names used in language_map.json.
+SPLITTER_LANGUAGES = {
+    "C": Language.C,
+    "C#": Language.CSHARP,
+    "C++": Language.CPP,
+    "COBOL": Language.COBOL,
+    "Elixir": Language.ELIXIR,
+    "Go": Language.GO,
+    "HTML": Language.HTML,
+    "Haskell": Language.HASKELL,
+    "Java": Language.JAVA,
+    "JavaScript": Language.JS,
+    "Kotlin": Language.KOTLIN,
+    "Lua": Language.LUA,
+    "Markdown": Language.MARKDOWN,
+    "PHP": Language.PHP,
+    "Perl": Language.PERL,
+    "PowerShell": Language.POWERSHELL,
+    "Protocol Buffer": Language.PROTO,
+    "Python": Language.PYTHON,
+    "Ruby": Language.RUBY,
+    "Rust": Language.RUST,
+    "Scala": Language.SCALA,
+    "Solidity": Language.SOL,
+    "Swift": Language.SWIFT,
+    "TSX": Language.TS,
+    "TeX": Language.LATEX,
+    "TypeScript": Language.TS,
+    "reStructuredText": Language.RST,
+}
+
+@lru_cache(maxsize=None)
+def section_splitter(language: str, model: str, section_tokens: int) -> RecursiveCharacterTextSplitter:
+    """Returns the splitter of sections for a language, built once per process."""
+    options = {
+        "chunk_size": section_tokens,
+        "chunk_overlap": 0,
+        "length_function": lambda text: count_tokens(text, model),
+    }
+
+    if language in SPLITTER_LANGUAGES:
+        return RecursiveCharacterTextSplitter.from_language(SPLITTER_LANGUAGES[language], **options)
+
+    return RecursiveCharacterTextSplitter(**options)
+
+def budget_file(
+    content: str, language: str, model: str, max_file_tokens: int, section_tokens: int
+) -> Tuple[int, Optional[List[str]], Optional[List[int]]]:
+    """
+    Returns the token count of a file, and its sections and their token
+    counts when it is over `section_tokens` but within `max_file_tokens`.
+    """
+    token_count = count_tokens(content, model)
+
+    if section_tokens < token_count <= max_file_tokens:
+        sections = section_splitter(language, model, section_tokens).split_text(content)
+        return token_count, sections, [count_tokens(section, model) for section in sections]
+
+    return token_count, None, None
+
+class TokenBudgetStage(PipelineStage):
+    """
+    Pipeline stage that counts the tokens of a file before it is analyzed.
+    Files over `max_file_tokens` are marked to skip analysis, and files over
+    `section_tokens` are split into sections that each fit in one prompt.
+    Counting and splitting run in `offloader` when one is given, and the
+    counts are passed on so the analysis does not count them again.
+    """
+
+    inputs = frozenset({"language"})
+    outputs = frozenset({"token_count", "analysis_skipped", "sections", "section_token_counts"})
+
+    # Counting and splitting is cheap, and the sections are as large as the file.
+    checkpoint = False
+
+    def __init__(
+        self,
+        model: str = "gpt-4",
+        max_file_tokens: int = 100_000,
+        section_tokens: int = 6_000,
+        offloader: Optional[ProcessPoolOffloader] = None,
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        super().__init__(concurrency, timeout)
+        self.model = model
+        self.max_file_tokens = max_file_tokens
+        self.section_tokens = section_tokens
+        self.offloader = offloader or ProcessPoolOffloader()
+
+    async def process(self, file_path: str, file_content: str, metadata: dict):
+        token_count, sections, section_token_counts = await self.offloader.run(
+            len(file_content), budget_file,
+            file_content, metadata["language"], self.model, self.max_file_tokens, self.section_tokens
+        )
+
+        metadata["token_count"] = token_count
+
+        if token_count > self.max_file_tokens:
+            print(f"Skipping analysis of {file_path}: {token_count} tokens is over the budget of {self.max_file_tokens}")
+            metadata["analysis_skipped"] = "too_large"
+        elif sections is not None:
+            metadata["sections"] = sections
+            metadata["section_token_counts"] = section_token_counts
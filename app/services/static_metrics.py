@@ -0,0 +1,193 @@
+import re
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from . import file_language_detection
+
+class CommentSyntax(NamedTuple):
+    """Prefixes of line comments, and delimiters of block comments, of a language."""
+
+    line: Tuple[str, ...] = ()
+    blocks: Tuple[Tuple[str, str], ...] = ()
+
+C_STYLE = CommentSyntax(("//",), (("/*", "*/"),))
+HASH = CommentSyntax(("#",))
+DASHES = CommentSyntax(("--",))
+SEMICOLON = CommentSyntax((";",))
+PERCENT = CommentSyntax(("%",))
+MARKUP = CommentSyntax((), (("<!--", "-->"),))
+
+# Used for languages without a known syntax: the most common line comments.
+GENERIC = CommentSyntax(("#", "//"), (("/*", "*/"),))
+
+# Comment syntax of the editor modes (`aceMode`) of language_map.json, which
+# groups most languages into families sharing a syntax.
+ACE_MODE_COMMENTS: Dict[str, CommentSyntax] = {
+    **{mode: C_STYLE for mode in (
+        "c_cpp", "csharp", "java", "javascript", "typescript", "golang", "rust", "scala", "groovy", "dart",
+        "objectivec", "d", "css", "less", "scss", "glsl", "haxe", "protobuf", "actionscript", "verilog",
+        "vala", "scad", "jsp", "stylus", "livescript", "ejs", "razor", "io", "lsl", "json",
+    )},
+    **{mode: HASH for mode in (
+        "sh", "python", "ruby", "perl", "yaml", "toml", "r", "dockerfile", "makefile", "coffee", "nix",
+        "julia", "tcl", "powershell", "elixir", "properties", "gitignore", "apache_conf", "sass",
+    )},
+    **{mode: DASHES for mode in ("sql", "pgsql", "lua", "haskell", "elm", "vhdl", "ada", "eiffel", "applescript")},
+    **{mode: SEMICOLON for mode in ("lisp", "clojure", "scheme", "assembly_x86", "ini", "autohotkey")},
+    **{mode: PERCENT for mode in ("tex", "erlang", "matlab", "prolog")},
+    **{mode: MARKUP for mode in ("html", "xml", "markdown", "coldfusion", "handlebars", "twig", "liquid")},
+    "php": CommentSyntax(("//", "#"), (("/*", "*/"),)),
+    "ocaml": CommentSyntax((), (("(*", "*)"),)),
+    "pascal": CommentSyntax(("//",), (("{", "}"), ("(*", "*)"))),
+    "batchfile": CommentSyntax(("REM ", "rem ", "::")),
+    "abap": CommentSyntax(("*", '"')),
+    "cobol": CommentSyntax(("*>",)),
+    "forth": CommentSyntax(("\\",), (("(", ")"),)),
+}
+
+# Languages whose editor mode is plain `text` or does not reflect their syntax.
+LANGUAGE_COMMENTS: Dict[str, CommentSyntax] = {
+    **{language: C_STYLE for language in (
+        "Kotlin", "Swift", "Solidity", "Zig", "Odin", "Ballerina", "Bicep", "Ceylon", "Chapel", "HLSL",
+        "Processing", "QML", "Q#", "Jsonnet", "AspectJ", "AngelScript", "Pawn", "Pike", "Gosu", "CUE",
+    )},
+    **{language: HASH for language in (
+        "CMake", "Cython", "Awk", "Puppet", "Meson", "Nim", "GDScript", "Starlark", "Gnuplot", "QMake",
+        "Open Policy Agent", "Crystal", "Raku", "HCL", "Terraform",
+    )},
+    **{language: DASHES for language in ("Agda", "Idris", "Lean", "PigLatin")},
+    "F#": CommentSyntax(("//",), (("(*", "*)"),)),
+    "Fortran": CommentSyntax(("!", "C ", "c ")),
+    "Fortran Free Form": CommentSyntax(("!",)),
+    "Mathematica": CommentSyntax((), (("(*", "*)"),)),
+    "Python": CommentSyntax(("#",), (('"""', '"""'), ("'''", "'''"))),
+    "Visual Basic .NET": CommentSyntax(("'", "REM ")),
+    "VBA": CommentSyntax(("'", "REM ")),
+}
+
+# Keywords and operators that add a decision point to the control flow.
+BRANCH_PATTERN = re.compile(r"\b(?:if|elif|else if|for|foreach|while|case|catch|except|when)\b|&&|\|\||\?\s")
+
+# Lines that start a function or method: a definition keyword, or a C-style
+# signature followed by its body.
+FUNCTION_PATTERN = re.compile(
+    r"^(?:(?:export|public|private|protected|internal|static|async|override|final|abstract|inline|virtual|"
+    r"unsafe|extern|pub(?:\([\w ]+\))?|suspend|open)\s+)*"
+    r"(?:def|function|func|fn|fun|sub|proc|method)\b"
+    r"|^(?!(?:if|for|while|switch|catch|return|else|new|do)\b)[\w<>\[\],.*&:~ ]+\s\**\w+\s*\([^;]*\)\s*(?:const\s*)?(?:\{|$)"
+)
+
+TODO_PATTERN = re.compile(r"\b(?:TODO|FIXME|XXX|HACK)\b")
+
+# Comment ratio from which a file counts as fully documented.
+DOCUMENTED_COMMENT_RATIO = 0.2
+
+@lru_cache(maxsize=None)
+def comment_syntax(language: str) -> CommentSyntax:
+    """Returns the comment syntax of a language, from its name or its editor mode in language_map.json."""
+    if language in LANGUAGE_COMMENTS:
+        return LANGUAGE_COMMENTS[language]
+
+    ace_mode = file_language_detection.get_language_detector().get_language(language).get("aceMode")
+    return ACE_MODE_COMMENTS.get(ace_mode, GENERIC)
+
+def compute_metrics(content: str, syntax: CommentSyntax = GENERIC) -> dict:
+    """
+    Measures a file in a single pass over its lines: line kinds, decision
+    points, functions and their lengths, and TODO markers. Functions end at
+    the next line indented no deeper than their definition, which holds for
+    conventionally formatted code in most languages.
+
+    Plain values only, so the metrics can be computed in another process.
+    """
+    line_count = 0
+    word_count = 0
+    blank_lines = 0
+    comment_lines = 0
+    code_lines = 0
+    branches = 0
+    todo_count = 0
+    function_lengths = []
+
+    # (indent, first line) of the functions the current line may belong to.
+    functions = []
+    last_code_line = 0
+    block_end: Optional[str] = None
+
+    for line_number, line in enumerate(content.splitlines(), 1):
+        line_count += 1
+        word_count += len(line.split())
+        stripped = line.lstrip()
+
+        if not stripped:
+            blank_lines += 1
+            continue
+
+        if "TODO" in stripped or "FIXME" in stripped or "XXX" in stripped or "HACK" in stripped:
+            todo_count += len(TODO_PATTERN.findall(stripped))
+
+        if block_end is not None:
+            comment_lines += 1
+
+            if block_end in stripped:
+                block_end = None
+
+            continue
+
+        if syntax.line and stripped.startswith(syntax.line):
+            comment_lines += 1
+            continue
+
+        block = next((delimiters for delimiters in syntax.blocks if stripped.startswith(delimiters[0])), None)
+
+        if block is not None:
+            comment_lines += 1
+
+            if block[1] not in stripped[len(block[0]):]:
+                block_end = block[1]
+
+            continue
+
+        code_lines += 1
+        branches += len(BRANCH_PATTERN.findall(stripped))
+        indent = len(line) - len(stripped)
+
+        while functions and indent <= functions[-1][0]:
+            function_indent, start = functions.pop()
+            closes = indent == function_indent and stripped[0] in ")]}"
+            function_lengths.append((line_number if closes else last_code_line) - start + 1)
+
+        if FUNCTION_PATTERN.match(stripped):
+            functions.append((indent, line_number))
+
+        last_code_line = line_number
+
+    function_lengths.extend(last_code_line - start + 1 for _, start in functions)
+
+    documented_lines = code_lines + comment_lines
+    comment_ratio = comment_lines / documented_lines if documented_lines else 0.0
+
+    return {
+        "line_count": line_count,
+        "word_count": word_count,
+        "blank_lines": blank_lines,
+        "comment_lines": comment_lines,
+        "code_lines": code_lines,
+        "comment_ratio": round(comment_ratio, 3),
+        "cyclomatic_complexity": branches + 1 if code_lines else 0,
+        "branch_density": round(branches / code_lines, 3) if code_lines else 0.0,
+        "function_count": len(function_lengths),
+        "max_function_length": max(function_lengths, default=0),
+        "mean_function_length": round(sum(function_lengths) / len(function_lengths), 1) if function_lengths else 0.0,
+        "todo_count": todo_count,
+        "documentation_score": round(100 * min(1.0, comment_ratio / DOCUMENTED_COMMENT_RATIO)),
+    }
+
+def describe_metrics(metrics: dict) -> str:
+    """Summarizes metrics in one sentence, for the context of an analysis prompt."""
+    return (
+        f"{metrics['line_count']} lines ({metrics['code_lines']} code, {metrics['comment_lines']} comment), "
+        f"cyclomatic complexity {metrics['cyclomatic_complexity']}, "
+        f"{metrics['function_count']} functions (longest {metrics['max_function_length']} lines), "
+        f"{metrics['todo_count']} TODO/FIXME markers"
+    )
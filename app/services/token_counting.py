@@ -0,0 +1,32 @@
+from functools import lru_cache
+from typing import Optional
+import tiktoken
+
+DEFAULT_ENCODING = "cl100k_base"
+
+# Average characters per token, used when no tokenizer can be loaded.
+CHARACTERS_PER_TOKEN = 4
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    """
+    Returns the tokenizer for a model, falling back to the default encoding for
+    unknown models. Returns None when the encoding files cannot be loaded, e.g.
+    when running offline without a tiktoken cache.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        print(f"Failed to load tokenizer for {model}, estimating token counts: {e}")
+        return None
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = get_encoding(model)
+
+    if encoding is None:
+        return (len(text) + CHARACTERS_PER_TOKEN - 1) // CHARACTERS_PER_TOKEN
+
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,97 @@
+from typing import Mapping
+
+NONE = "none"
+STATIC = "static"
+MODEL = "model"
+MODES = (NONE, STATIC, MODEL)
+
+# Tiers recorded with the results of a file: analyzed by the full model
+# only, by the triage model only, or by the triage model and then the full
+# model because the triage found it risky.
+TIER_FULL = "full"
+TIER_TRIAGE = "triage"
+TIER_ESCALATED = "escalated"
+
+# Tier of files skipped by the analysis, known from their static metrics only.
+TIER_STATIC = "static"
+
+# Code lines at which a file counts as fully large, and decision points per
+# code line at which it counts as fully complex.
+LARGE_FILE_LINES = 400
+COMPLEX_BRANCH_DENSITY = 0.25
+
+def static_risk(metrics: dict) -> int:
+    """
+    Estimates from 0 to 100 how much a file would gain from the full model,
+    from its static metrics: large, branchy and undocumented files score high.
+    """
+    if metrics["code_lines"] == 0:
+        return 0
+
+    size = min(1.0, metrics["code_lines"] / LARGE_FILE_LINES)
+    complexity = min(1.0, metrics["branch_density"] / COMPLEX_BRANCH_DENSITY)
+    undocumented = 1.0 - metrics["documentation_score"] / 100
+
+    return round(100 * (0.4 * size + 0.4 * complexity + 0.2 * undocumented))
+
+def report_risk(report) -> int:
+    """Risk of a file according to a report: its worst bug, security or performance score."""
+    return max(report.bugs_score, report.security_score, report.performance_score)
+
+class TriagePolicy:
+    """
+        Decides which model analyzes each file. With `static`, files whose
+        static risk is under `static_threshold` are analyzed by the triage
+        model and the rest by the full model. With `model`, every file is
+        analyzed by the triage model first and escalated to the full model
+        when the risk of that report reaches `escalation_threshold`. With
+        `none`, every file goes to the full model.
+    """
+
+    def __init__(
+        self,
+        mode: str = NONE,
+        model: str = "gpt-4o-mini",
+        escalation_threshold: int = 50,
+        static_threshold: int = 40,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown triage mode '{mode}', expected one of {', '.join(MODES)}")
+
+        self.mode = mode
+        self.model = model
+        self.escalation_threshold = escalation_threshold
+        self.static_threshold = static_threshold
+
+    @classmethod
+    def from_config(cls, config: Mapping) -> "TriagePolicy":
+        return cls(
+            mode=config["LLM_TRIAGE"],
+            model=config["LLM_TRIAGE_MODEL"],
+            escalation_threshold=config["LLM_TRIAGE_ESCALATION_THRESHOLD"],
+            static_threshold=config["LLM_TRIAGE_STATIC_THRESHOLD"],
+        )
+
+    @property
+    def uses_triage_model(self) -> bool:
+        return self.mode != NONE
+
+    def first_tier(self, metrics: dict) -> str:
+        """Returns the tier that analyzes a file first, given its static metrics."""
+        if self.mode == MODEL:
+            return TIER_TRIAGE
+
+        if self.mode == STATIC and static_risk(metrics) < self.static_threshold:
+            return TIER_TRIAGE
+
+        return TIER_FULL
+
+    def escalate(self, report) -> bool:
+        """Whether a report of the triage model calls for the full model."""
+        return self.mode == MODEL and report_risk(report) >= self.escalation_threshold
+
+    def __repr__(self):
+        return (
+            f"<TriagePolicy(mode={self.mode}, model={self.model}, "
+            f"escalation_threshold={self.escalation_threshold}, static_threshold={self.static_threshold})>"
+        )
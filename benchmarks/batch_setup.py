@@ -0,0 +1,140 @@
+"""
+Wall time of indexing many small repositories one at a time, each with its
+own pipeline resources as separate setup jobs have, versus as one batch
+sharing `PipelineResources` and a global limit on the files in flight.
+
+Runs the pipeline stages against the local fake OpenAI server, whose
+request budget stands in for the API quota; persisting to Postgres and
+Qdrant is left out. A batch is limited by the quota when its requests per
+second approach the server's budget.
+
+    python -m benchmarks.batch_setup
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from .fake_openai_server import FakeOpenAIServer
+
+CACHE_DIRECTORY = tempfile.TemporaryDirectory()
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(CACHE_DIRECTORY.name, "embeddings.sqlite3")
+os.environ["ANALYSIS_CACHE_PATH"] = os.path.join(CACHE_DIRECTORY.name, "analyses.sqlite3")
+
+from app.config import Config
+from app.services.embedding_profiles import EmbeddingProfile
+from app.services.process_pool import shutdown_process_pool
+from app.services.repository_processsing import FileProcessingPipeline, PipelineResources
+from app.services.scheduler import FileScheduler
+
+REPOSITORIES = 40
+FILES_PER_REPOSITORY = 12
+REPOSITORY_CONCURRENCY = 8
+BATCH_WORKERS = 64
+SERVER_OPTIONS = {"requests_limit": 1_200, "tokens_limit": 10_000_000, "window": 60.0, "latency": 0.3, "failure_rate": 0.0}
+
+
+def write_repositories(directory: str, scenario: str):
+    random.seed(0)
+    repositories = []
+
+    for repository in range(REPOSITORIES):
+        paths = []
+
+        for index in range(random.randint(FILES_PER_REPOSITORY // 2, FILES_PER_REPOSITORY * 3 // 2)):
+            lines = random.choice([10, 40, 200])
+            content = "".join(
+                f"def {scenario}_{repository}_{index}_{line}(value):\n    return value * {line}\n\n"
+                for line in range(lines)
+            )
+            path = os.path.join(directory, f"{scenario}_{repository}", f"module_{index}.py")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            with open(path, "w") as file:
+                file.write(content)
+
+            paths.append(path)
+
+        repositories.append(paths)
+
+    return repositories
+
+
+async def index(resources: PipelineResources, config: dict, paths) -> int:
+    pipeline = FileProcessingPipeline(resources.stages(EmbeddingProfile.from_config(config)))
+    persisted = []
+
+    async def sink(results):
+        persisted.extend(results)
+
+    scheduler = FileScheduler(
+        pipeline.process_file, sink, workers=config["PIPELINE_WORKERS"], slots=resources.file_slots
+    )
+    await scheduler.run(paths)
+
+    return scheduler.failed
+
+
+async def one_at_a_time(config: dict, repositories) -> int:
+    failed = 0
+
+    for paths in repositories:
+        resources = PipelineResources(config)
+        failed += await index(resources, config, paths)
+        await resources.close()
+
+    return failed
+
+
+async def batch(config: dict, repositories) -> int:
+    resources = PipelineResources(config, workers=BATCH_WORKERS)
+    repository_slots = asyncio.Semaphore(REPOSITORY_CONCURRENCY)
+
+    async def index_repository(paths):
+        async with repository_slots:
+            return await index(resources, config, paths)
+
+    failed = sum(await asyncio.gather(*(index_repository(paths) for paths in repositories)))
+    await resources.close()
+
+    return failed
+
+
+async def run(name: str, scenario, directory: str):
+    server = FakeOpenAIServer(**SERVER_OPTIONS).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+
+    config = vars(Config())
+    repositories = write_repositories(directory, scenario.__name__)
+
+    started = time.perf_counter()
+    failed = await scenario(config, repositories)
+    elapsed = time.perf_counter() - started
+    stats = server.stats()
+
+    print(
+        f"{name:>36}: {elapsed:6.2f}s, {sum(map(len, repositories)) / elapsed:6.1f} files/s, "
+        f"{stats['served'] / elapsed:5.1f} requests/s of {SERVER_OPTIONS['requests_limit'] / SERVER_OPTIONS['window']:.0f}, "
+        f"{failed} failed"
+    )
+
+    server.stop()
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{REPOSITORIES} repositories of about {FILES_PER_REPOSITORY} files\n")
+
+        await run("one at a time, own resources", one_at_a_time, directory)
+        await run(f"batch of {REPOSITORY_CONCURRENCY}, {BATCH_WORKERS} files at once", batch, directory)
+
+    shutdown_process_pool()
+    CACHE_DIRECTORY.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
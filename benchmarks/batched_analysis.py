@@ -0,0 +1,83 @@
+"""
+Requests and tokens spent analyzing a repository of mostly small files with
+`StatGenerationStage`, one file per request versus small files batched.
+
+Runs against the local fake OpenAI server, with as many files in the stage
+at once as the pipeline allows by default. The server answers batched
+prompts with one report per file; with `malformed_rate` some of those are
+left out or invalid, and the files they belong to fall back to a request
+of their own.
+
+    python -m benchmarks.batched_analysis
+"""
+import asyncio
+import os
+import random
+import time
+
+from .fake_openai_server import FakeOpenAIServer
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from app.services.rate_limits import RateLimiter
+from app.services.stages import StatGenerationStage
+
+SMALL_FILES = 240
+LARGE_FILES = 20
+STAGE_CONCURRENCY = 16
+SERVER_OPTIONS = {"requests_limit": 10_000, "tokens_limit": 10_000_000, "window": 60.0, "latency": 0.2, "failure_rate": 0.0}
+
+
+def files():
+    random.seed(0)
+    contents = [
+        "".join(f"setting_{index}_{line} = {line}\n" for line in range(random.randint(3, 50)))
+        for index in range(SMALL_FILES)
+    ]
+    contents += [
+        "".join(f"def function_{index}_{line}(value):\n    return value * {line}\n\n" for line in range(200))
+        for index in range(LARGE_FILES)
+    ]
+    random.shuffle(contents)
+    return [(f"src/module_{index}.py", content) for index, content in enumerate(contents)]
+
+
+async def run(name: str, batch_max_files: int, malformed_rate: float = 0.0):
+    server = FakeOpenAIServer(**SERVER_OPTIONS, malformed_rate=malformed_rate).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+
+    stage = StatGenerationStage(
+        max_concurrency=STAGE_CONCURRENCY,
+        rate_limiter=RateLimiter("gpt-4", max_concurrency=STAGE_CONCURRENCY),
+        batch_max_files=batch_max_files
+    )
+    slots = asyncio.Semaphore(STAGE_CONCURRENCY)
+
+    async def analyze(file_path, content):
+        async with slots:
+            return await stage.analyze(file_path, content)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(analyze(file_path, content) for file_path, content in files()), return_exceptions=True)
+    failed = sum(isinstance(result, Exception) for result in results)
+    stats = server.stats()
+
+    print(
+        f"{name:>28}: {stats['served']:4} requests, {stats['prompt_tokens']:7} prompt tokens, "
+        f"{stats['completion_tokens']:6} completion tokens, {failed} failed, {time.perf_counter() - started:5.2f}s"
+    )
+    print(f"{'':>28}  {stage.batch_stats()}")
+
+    server.stop()
+
+
+async def main():
+    print(f"{SMALL_FILES} small and {LARGE_FILES} large files, {STAGE_CONCURRENCY} files in the stage at once\n")
+
+    await run("one file per request", batch_max_files=1)
+    await run("batches of up to 8", batch_max_files=8)
+    await run("batches, 10% malformed", batch_max_files=8, malformed_rate=0.1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
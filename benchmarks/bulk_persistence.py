@@ -0,0 +1,108 @@
+"""
+Rows/sec of `persist_results` against per-row `add` + `commit`.
+
+Runs against a local SQLite file by default; set BENCHMARK_DATABASE_URL to
+point it at a local Postgres instead.
+
+    python -m benchmarks.bulk_persistence
+"""
+import os
+import tempfile
+import time
+
+from app.services import bulk_persistence
+
+FILE_COUNT = 2_000
+
+
+def make_results() -> list:
+    return [
+        {
+            "file_path": f"./storage/repo_files/owner_repo/src/module_{index}.py",
+            "scores": {"documentation": 80, "bugs": 60, "security": 40, "performance": 20},
+            "tasks": [
+                {
+                    "title": f"Task {task}",
+                    "description": "Add comments to explain the purpose of each function.",
+                    "category": "documentation",
+                    "priority": "high",
+                    "prompt": "Write comments to explain the purpose of each function.",
+                }
+                for task in range(5)
+            ],
+        }
+        for index in range(FILE_COUNT)
+    ]
+
+
+def persist_row_by_row(repository_id, results) -> int:
+    from app.extensions import db
+    from app.models import File, Task, FileScore
+
+    rows = 0
+
+    for result in results:
+        file = File(path=result["file_path"], repository_id=repository_id)
+        db.session.add(file)
+        db.session.commit()
+        rows += 1
+
+        for task in result["tasks"]:
+            db.session.add(Task(file_id=file.id, **task))
+            db.session.commit()
+            rows += 1
+
+        for kind, score in result["scores"].items():
+            db.session.add(FileScore(file_id=file.id, scoreKind=kind, score=score))
+            db.session.commit()
+            rows += 1
+
+    return rows
+
+
+def persist_bulk(repository_id, results) -> int:
+    counts = {}
+
+    for start in range(0, len(results), 50):
+        for table, count in bulk_persistence.persist_results(repository_id, results[start:start + 50]).items():
+            counts[table] = counts.get(table, 0) + count
+
+    return sum(counts.values())
+
+
+def run():
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_URL"] = os.getenv(
+            "BENCHMARK_DATABASE_URL", f"sqlite:///{os.path.join(directory, 'benchmark.sqlite3')}"
+        )
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+        from app import create_app
+        from app.extensions import db
+        from app.models import Repository
+
+        app = create_app()
+
+        with app.app_context():
+            db.create_all()
+
+            for name, persist in (("row-by-row", persist_row_by_row), ("bulk", persist_bulk)):
+                repository = Repository(name=name)
+                db.session.add(repository)
+                db.session.commit()
+
+                results = make_results()
+
+                started = time.perf_counter()
+                rows = persist(repository.id, results)
+                elapsed = time.perf_counter() - started
+
+                print(f"{name:<12} {rows} rows in {elapsed:6.2f}s ({rows / elapsed:9.0f} rows/sec)")
+
+            db.drop_all()
+            db.session.remove()
+            db.engine.dispose()
+
+
+if __name__ == "__main__":
+    run()
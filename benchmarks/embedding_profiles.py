@@ -0,0 +1,157 @@
+"""
+Recall and search latency of shortened embedding profiles, to pick the
+`EMBEDDING_PROFILE` of new collections.
+
+Vectors are embedded once at full size and shortened the way
+`embedding_profiles.reproject` does it, which for text-embedding-3 models is
+what the API returns when asked for fewer `dimensions`. For each size, the
+corpus is indexed in Qdrant and recall@10 is measured against exact search
+over the full-size vectors, along with p50/p95 search latency and the bytes
+of vectors stored.
+
+By default the corpus is synthetic: clustered vectors whose variance decays
+across dimensions, like vectors of models trained to be shortened. Set
+BENCHMARK_OPENAI=1 (with OPENAI_API_KEY) to embed the chunks of this
+repository and a set of questions about it instead. Set BENCHMARK_QDRANT_URL
+to search a Qdrant server rather than an in-memory one.
+
+    python -m benchmarks.embedding_profiles
+"""
+import asyncio
+import glob
+import os
+import statistics
+import time
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from app.services.embedding_profiles import EMBEDDING_MODEL, MODEL_DIMENSIONS
+
+QDRANT_URL = os.getenv("BENCHMARK_QDRANT_URL")
+USE_OPENAI = os.getenv("BENCHMARK_OPENAI") == "1"
+COLLECTION_NAME = "embedding_profiles_benchmark"
+DIMENSIONS = [1536, 1024, 768, 512, 256, 128]
+LIMIT = 10
+POINT_COUNT = 20_000
+CLUSTERS = 200
+QUERIES = 100
+CHUNK_LINES = 40
+
+QUESTIONS = [
+    "where are queued jobs claimed by workers",
+    "how are stale points deleted from qdrant",
+    "rate limit retry with exponential backoff",
+    "cache analysis reports by content hash",
+    "resume an interrupted indexing run",
+    "split a file into chunks with line numbers",
+    "filter search results by language and path",
+    "count tokens of a file before sending it to the model",
+    "persist tasks and scores in bulk",
+    "detect the language of a file from its extension",
+    "which files are ignored when walking a repository",
+    "compute score rollups per language",
+]
+
+
+def synthetic_vectors():
+    """Corpus and queries with most of their variance in the leading dimensions."""
+    size = MODEL_DIMENSIONS[EMBEDDING_MODEL]
+    generator = np.random.default_rng(0)
+    scale = (1 + np.arange(size)) ** -0.5
+
+    centres = generator.standard_normal((CLUSTERS, size)) * scale
+    corpus = centres[generator.integers(0, CLUSTERS, POINT_COUNT)] + 0.5 * generator.standard_normal((POINT_COUNT, size)) * scale
+    queries = corpus[generator.integers(0, POINT_COUNT, QUERIES)] + 0.5 * generator.standard_normal((QUERIES, size)) * scale
+
+    return corpus, queries
+
+
+async def openai_vectors():
+    from app.services.embeddings import BatchEmbedder
+
+    chunks = []
+
+    for file_path in sorted(glob.glob("app/**/*.py", recursive=True)):
+        with open(file_path, encoding="utf-8") as file:
+            lines = file.readlines()
+
+        for start in range(0, len(lines), CHUNK_LINES):
+            chunk = "".join(lines[start:start + CHUNK_LINES]).strip()
+
+            if chunk:
+                chunks.append(f"{file_path}\n{chunk}")
+
+    embedder = BatchEmbedder()
+    corpus = await embedder.embed(chunks)
+    queries = await embedder.embed(QUESTIONS)
+
+    return np.array(corpus), np.array(queries)
+
+
+def shorten(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    prefix = vectors[:, :dimensions]
+    return prefix / np.linalg.norm(prefix, axis=1, keepdims=True)
+
+
+async def index(client: AsyncQdrantClient, vectors: np.ndarray) -> None:
+    if await client.collection_exists(COLLECTION_NAME):
+        await client.delete_collection(COLLECTION_NAME)
+
+    await client.create_collection(
+        COLLECTION_NAME, vectors_config=VectorParams(size=vectors.shape[1], distance=Distance.COSINE)
+    )
+
+    for start in range(0, len(vectors), 500):
+        await client.upsert(COLLECTION_NAME, points=[
+            PointStruct(id=index, vector=vectors[index].tolist())
+            for index in range(start, min(start + 500, len(vectors)))
+        ], wait=True)
+
+    while (await client.get_collection(COLLECTION_NAME)).status.value != "green":
+        await asyncio.sleep(0.5)
+
+
+async def main():
+    corpus, queries = await openai_vectors() if USE_OPENAI else synthetic_vectors()
+    client = AsyncQdrantClient(url=QDRANT_URL) if QDRANT_URL else AsyncQdrantClient(location=":memory:")
+
+    full_corpus, full_queries = shorten(corpus, corpus.shape[1]), shorten(queries, queries.shape[1])
+    expected = [set(np.argsort(-(full_corpus @ query))[:LIMIT].tolist()) for query in full_queries]
+
+    print(
+        f"{'OpenAI' if USE_OPENAI else 'synthetic'} corpus of {len(corpus)} vectors, {len(queries)} queries, "
+        f"recall@{LIMIT} against exact full-size search, Qdrant {'at ' + QDRANT_URL if QDRANT_URL else 'in memory'}\n"
+    )
+
+    for dimensions in DIMENSIONS:
+        if dimensions > corpus.shape[1]:
+            continue
+
+        await index(client, shorten(corpus, dimensions))
+
+        latencies = []
+        recalls = []
+
+        for query, relevant in zip(shorten(queries, dimensions), expected):
+            started = time.perf_counter()
+            response = await client.query_points(COLLECTION_NAME, query=query.tolist(), limit=LIMIT)
+            latencies.append(time.perf_counter() - started)
+
+            recalls.append(len(relevant & {point.id for point in response.points}) / LIMIT)
+
+        print(
+            f"{EMBEDDING_MODEL}:{dimensions:<5} recall {statistics.mean(recalls):5.3f}, "
+            f"p50 {statistics.median(latencies) * 1000:6.2f} ms, p95 {statistics.quantiles(latencies, n=20)[-1] * 1000:6.2f} ms, "
+            f"vectors {len(corpus) * dimensions * 4 / 2 ** 20:6.1f} MiB"
+        )
+
+    await client.delete_collection(COLLECTION_NAME)
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""
+Embedding throughput (chunks/sec) of `BatchEmbedder` against a fake client.
+
+Simulates many files embedding their chunks concurrently, first with one
+input per request (the previous behaviour) and then with batching. Finally
+re-indexes the same files through the embedding cache after changing 1% of
+them, which should only embed the changed chunks.
+
+    python -m benchmarks.embedding_throughput
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from app.services.embeddings import BatchEmbedder
+from app.services.embedding_cache import EmbeddingCache
+from benchmarks.fakes import FakeAsyncOpenAI
+
+FILE_COUNT = 200
+
+
+def make_files() -> list:
+    random.seed(0)
+    return [
+        [f"def function_{file}_{chunk}(): return {chunk}\n" * 20 for chunk in range(random.randint(1, 6))]
+        for file in range(FILE_COUNT)
+    ]
+
+
+async def run_case(name: str, **embedder_options):
+    client = FakeAsyncOpenAI(latency=0.05)
+    embedder = BatchEmbedder(client=client, **embedder_options)
+    files = make_files()
+    chunk_count = sum(len(chunks) for chunks in files)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(embedder.embed(chunks) for chunks in files))
+    await embedder.flush()
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{name:<12} {chunk_count} chunks in {elapsed:6.2f}s "
+        f"({chunk_count / elapsed:8.1f} chunks/sec, {client.embeddings.request_count} requests)"
+    )
+
+
+async def run_reindex():
+    files = make_files()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = EmbeddingCache(path=os.path.join(directory, "embeddings.sqlite3"))
+
+        for run in ("initial", "1% changed"):
+            client = FakeAsyncOpenAI(latency=0.05)
+            embedder = BatchEmbedder(client=client, cache=cache)
+            hits, misses = cache.hits, cache.misses
+
+            await asyncio.gather(*(embedder.embed(chunks) for chunks in files))
+
+            print(
+                f"{run:<12} {cache.hits - hits} cache hits, {cache.misses - misses} misses, "
+                f"{embedder.input_count} chunks embedded"
+            )
+
+            for chunks in files[::100]:
+                chunks[0] += "# changed\n"
+
+        cache.close()
+
+
+async def main():
+    await run_case("per-chunk", max_batch_inputs=1, max_in_flight=4)
+    await run_case("batched", max_in_flight=4)
+    await run_reindex()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,215 @@
+"""
+Local HTTP server speaking the parts of the OpenAI API used by the pipeline,
+for exercising rate limiting and retries without the real service.
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .fakes import fake_vector
+
+REPORT = {
+    "documentation_score": 50,
+    "bugs_score": 10,
+    "security_score": 5,
+    "performance_score": 7,
+    "tasks": [{"title": "t", "description": "d", "category": "bugs", "priority": "high", "prompt": "p"}],
+}
+
+# Header of each file in a batched analysis prompt.
+BATCH_FILE_PATTERN = re.compile(r"^\s*=== File (\d+):", re.MULTILINE)
+
+
+class Bucket:
+    """Budget of `limit` units replenished evenly over `window` seconds."""
+
+    def __init__(self, limit: float, window: float):
+        self.limit = limit
+        self.rate = limit / window
+        self.level = limit
+        self.updated_at = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.limit, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reset_seconds(self) -> float:
+        return (self.limit - self.level) / self.rate
+
+
+class FakeOpenAIServer:
+    """
+        Serves `/v1/embeddings` and `/v1/chat/completions` with OpenAI's rate
+        limit headers. Requests and tokens are limited per `window` seconds
+        (a scaled-down minute) and requests over the limit get a 429 with
+        `retry-after-ms`. On top of that, `failure_rate` of the requests fail
+        with a 429 regardless of the budget, and every request takes `latency`
+        seconds.
+
+        Batched analysis prompts get one report per file, of which
+        `malformed_rate` are left out or invalid.
+    """
+
+    def __init__(
+        self,
+        requests_limit: int = 120,
+        tokens_limit: int = 200_000,
+        window: float = 6.0,
+        latency: float = 0.05,
+        failure_rate: float = 0.05,
+        dimensions: int = 16,
+        malformed_rate: float = 0.0,
+    ):
+        self.requests = Bucket(requests_limit, window)
+        self.tokens = Bucket(tokens_limit, window)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.dimensions = dimensions
+        self.malformed_rate = malformed_rate
+
+        self.lock = threading.Lock()
+        self.served = 0
+        self.rejected = 0
+        self.injected = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                status, payload, headers = server.handle(self.path, body)
+                data = json.dumps(payload).encode()
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+
+                for name, value in headers.items():
+                    self.send_header(name, value)
+
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _headers(self) -> dict:
+        return {
+            "x-ratelimit-limit-requests": str(int(self.requests.limit)),
+            "x-ratelimit-remaining-requests": str(max(0, int(self.requests.level))),
+            "x-ratelimit-reset-requests": f"{self.requests.reset_seconds():.3f}s",
+            "x-ratelimit-limit-tokens": str(int(self.tokens.limit)),
+            "x-ratelimit-remaining-tokens": str(max(0, int(self.tokens.level))),
+            "x-ratelimit-reset-tokens": f"{self.tokens.reset_seconds():.3f}s",
+        }
+
+    def handle(self, path: str, body: dict):
+        if path.endswith("/embeddings"):
+            texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+            tokens = sum(len(text) // 4 + 1 for text in texts)
+        else:
+            texts = None
+            tokens = sum(len(message["content"]) // 4 + 1 for message in body["messages"]) + 500
+
+        time.sleep(self.latency)
+
+        with self.lock:
+            self.requests.refill()
+            self.tokens.refill()
+
+            if self.requests.level < 1 or self.tokens.level < min(tokens, self.tokens.limit):
+                self.rejected += 1
+                wait = max(
+                    (1 - self.requests.level) / self.requests.rate,
+                    (min(tokens, self.tokens.limit) - self.tokens.level) / self.tokens.rate,
+                )
+                headers = {**self._headers(), "retry-after-ms": str(int(wait * 1000) + 1)}
+                return 429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}, headers
+
+            if random.random() < self.failure_rate:
+                self.injected += 1
+                return 429, {"error": {"message": "Injected rate limit", "type": "requests", "code": "rate_limit_exceeded"}}, self._headers()
+
+            self.requests.level -= 1
+            self.tokens.level -= tokens
+            self.served += 1
+            self.prompt_tokens += tokens
+            headers = self._headers()
+
+        if texts is not None:
+            return 200, {
+                "object": "list",
+                "model": body["model"],
+                "data": [
+                    {"object": "embedding", "index": index, "embedding": fake_vector(text, self.dimensions)}
+                    for index, text in enumerate(texts)
+                ],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            }, headers
+
+        content, completion_tokens = self._analysis(body["messages"][0]["content"], body["model"])
+
+        with self.lock:
+            self.completion_tokens += completion_tokens
+
+        return 200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": tokens, "completion_tokens": completion_tokens, "total_tokens": tokens + completion_tokens},
+        }, headers
+
+    def _analysis(self, prompt: str, model: str):
+        file_ids = BATCH_FILE_PATTERN.findall(prompt)
+
+        if not file_ids:
+            return json.dumps(REPORT), 100
+
+        reports = []
+
+        for file_id in file_ids:
+            if random.random() < self.malformed_rate:
+                if random.random() < 0.5:
+                    reports.append({"file": int(file_id), **REPORT, "bugs_score": 500})
+                continue
+
+            reports.append({"file": int(file_id), **REPORT})
+
+        return json.dumps({"reports": reports}), 100 * len(file_ids)
+
+    def stats(self) -> dict:
+        return {
+            "served": self.served,
+            "rejected": self.rejected,
+            "injected": self.injected,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
@@ -0,0 +1,87 @@
+"""
+Offline stand-ins for the external services used by the pipeline.
+"""
+import asyncio
+import hashlib
+import random
+from types import SimpleNamespace
+from typing import List, Union
+
+
+def fake_vector(text: str, size: int = 1536) -> List[float]:
+    """Deterministic pseudo-embedding derived from the text."""
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+    generator = random.Random(seed)
+    return [generator.uniform(-1, 1) for _ in range(size)]
+
+
+class FakeEmbeddings:
+    def __init__(self, latency: float, per_input_latency: float, size: int):
+        self.latency = latency
+        self.per_input_latency = per_input_latency
+        self.size = size
+        self.request_count = 0
+
+    async def create(self, input: Union[str, List[str]], model: str, **kwargs):
+        texts = [input] if isinstance(input, str) else input
+        size = kwargs.get("dimensions") or self.size
+
+        self.request_count += 1
+        await asyncio.sleep(self.latency + self.per_input_latency * len(texts))
+
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=index, embedding=fake_vector(text, size))
+            for index, text in enumerate(texts)
+        ])
+
+    @property
+    def with_raw_response(self):
+        return SimpleNamespace(create=self._create_raw)
+
+    async def _create_raw(self, **kwargs):
+        response = await self.create(**kwargs)
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+
+class FakeAsyncOpenAI:
+    """
+        Mimics the parts of `openai.AsyncOpenAI` used by the pipeline, with a
+        fixed latency per request plus a small cost per input.
+    """
+
+    def __init__(self, latency: float = 0.2, per_input_latency: float = 0.0005, size: int = 1536):
+        self.embeddings = FakeEmbeddings(latency, per_input_latency, size)
+
+
+class FakeQdrantClient:
+    """
+        Local Qdrant stand-in: wraps an in-memory `AsyncQdrantClient` and adds
+        network-like latency per request and per point. `failure_rate` makes
+        that fraction of upserts fail, and upserts larger than `max_points`
+        time out like oversized requests do against a real server.
+    """
+
+    def __init__(self, latency: float = 0.02, per_point_latency: float = 0.00005, failure_rate: float = 0.0, max_points: int = 2_000):
+        from qdrant_client import AsyncQdrantClient
+
+        self.client = AsyncQdrantClient(location=":memory:")
+        self.latency = latency
+        self.per_point_latency = per_point_latency
+        self.failure_rate = failure_rate
+        self.max_points = max_points
+        self.request_count = 0
+
+    async def upsert(self, collection_name: str, points: list, **kwargs):
+        self.request_count += 1
+        await asyncio.sleep(self.latency + self.per_point_latency * len(points))
+
+        if len(points) > self.max_points:
+            raise TimeoutError(f"Upsert of {len(points)} points timed out")
+
+        if random.random() < self.failure_rate:
+            raise ConnectionError("Injected upsert failure")
+
+        return await self.client.upsert(collection_name=collection_name, points=points, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
@@ -0,0 +1,50 @@
+"""
+Micro-benchmark for `detect_language`.
+
+Detects the language of synthetic repositories of increasing size and prints
+the per-file cost, which should stay flat as the file count grows.
+
+    python -m benchmarks.language_detection
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app", "services"))
+
+from file_language_detection import detect_language, get_language_detector  # noqa: E402
+
+FILE_NAMES = [
+    "main.py", "index.ts", "types.d.ts", "view.blade.php", "Dockerfile", "Makefile",
+    "header.h", "README.md", "styles.css", "app.min.js", "data.json", "notes.txt",
+    "Cargo.toml", "lib.rs", "image.png", "config.yaml", "query.sql", "no_extension",
+]
+
+
+def make_paths(count: int) -> list:
+    random.seed(count)
+    return [
+        os.path.join("src", f"pkg{index % 100}", random.choice(FILE_NAMES))
+        for index in range(count)
+    ]
+
+
+def run():
+    started = time.perf_counter()
+    get_language_detector()
+    print(f"index build: {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    for count in (1_000, 10_000, 50_000, 100_000):
+        paths = make_paths(count)
+
+        started = time.perf_counter()
+        for path in paths:
+            detect_language(path)
+        elapsed = time.perf_counter() - started
+
+        print(f"{count:>7} files: {elapsed * 1000:8.2f} ms total, {elapsed / count * 1e6:6.3f} us/file")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,113 @@
+"""
+Embedding and analysis calls against a local fake OpenAI server that
+enforces rate limits and injects 429s, with and without `RateLimiter`.
+
+Without the limiter every request over the limit, and every injected 429,
+is a lost embedding or a file without scores. With it, calls are paced by
+the rate limit headers and retried, so every one of them should succeed.
+
+    python -m benchmarks.openai_rate_limits
+"""
+import asyncio
+import os
+import time
+
+from openai import AsyncOpenAI
+
+from .fake_openai_server import FakeOpenAIServer
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from app.services.embeddings import BatchEmbedder, EMBEDDING_MODEL
+from app.services.rate_limits import RateLimiter
+from app.services.stages import StatGenerationStage
+
+EMBEDDING_REQUESTS = 300
+TEXTS_PER_REQUEST = 4
+ANALYSES = 100
+CONCURRENCY = 32
+
+SERVER_OPTIONS = {"requests_limit": 120, "tokens_limit": 100_000, "window": 3.0, "latency": 0.05, "failure_rate": 0.05}
+
+
+def texts(count: int):
+    return [f"def function_{index}():\n    return {index}\n" * 20 for index in range(count)]
+
+
+def report(name: str, server: FakeOpenAIServer, succeeded: int, failed: int, elapsed: float, rate_limiter=None):
+    print(f"{name:>24}: {succeeded:4} ok, {failed:4} failed in {elapsed:5.2f}s, server {server.stats()}")
+
+    if rate_limiter is not None:
+        print(f"{'':>24}  limiter {rate_limiter.stats()}")
+
+
+async def without_limiter():
+    server = FakeOpenAIServer(**SERVER_OPTIONS).start()
+    client = AsyncOpenAI(base_url=server.base_url, max_retries=0)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    inputs = texts(EMBEDDING_REQUESTS * TEXTS_PER_REQUEST)
+
+    async def embed(batch):
+        async with semaphore:
+            await client.embeddings.create(input=batch, model=EMBEDDING_MODEL)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        embed(inputs[start:start + TEXTS_PER_REQUEST]) for start in range(0, len(inputs), TEXTS_PER_REQUEST)
+    ), return_exceptions=True)
+    failed = sum(isinstance(result, Exception) for result in results)
+    report("embeddings, no limiter", server, len(results) - failed, failed, time.perf_counter() - started)
+
+    async def analyze(content):
+        async with semaphore:
+            await client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": content}])
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(analyze(content) for content in texts(ANALYSES)), return_exceptions=True)
+    failed = sum(isinstance(result, Exception) for result in results)
+    report("analyses, no limiter", server, len(results) - failed, failed, time.perf_counter() - started)
+
+    await client.close()
+    server.stop()
+
+
+async def with_limiter():
+    server = FakeOpenAIServer(**SERVER_OPTIONS).start()
+    rate_limiter = RateLimiter(EMBEDDING_MODEL, max_concurrency=CONCURRENCY, backoff=0.1)
+    embedder = BatchEmbedder(
+        client=AsyncOpenAI(base_url=server.base_url, max_retries=0),
+        rate_limiter=rate_limiter,
+        max_batch_inputs=TEXTS_PER_REQUEST,
+        max_in_flight=CONCURRENCY,
+        linger=0
+    )
+    inputs = texts(EMBEDDING_REQUESTS * TEXTS_PER_REQUEST)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        embedder.embed(inputs[start:start + TEXTS_PER_REQUEST]) for start in range(0, len(inputs), TEXTS_PER_REQUEST)
+    ), return_exceptions=True)
+    failed = sum(isinstance(result, Exception) for result in results)
+    report("embeddings, limiter", server, len(results) - failed, failed, time.perf_counter() - started, rate_limiter)
+
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    rate_limiter = RateLimiter("gpt-4", max_concurrency=CONCURRENCY, backoff=0.1)
+    stage = StatGenerationStage(max_concurrency=CONCURRENCY, rate_limiter=rate_limiter, batch_max_files=1)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        stage.analyze(f"module_{index}.py", content) for index, content in enumerate(texts(ANALYSES))
+    ), return_exceptions=True)
+    failed = sum(isinstance(result, Exception) for result in results)
+    report("analyses, limiter", server, len(results) - failed, failed, time.perf_counter() - started, rate_limiter)
+
+    server.stop()
+
+
+async def main():
+    await without_limiter()
+    await with_limiter()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
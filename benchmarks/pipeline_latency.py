@@ -0,0 +1,98 @@
+"""
+Per-file latency of `FileProcessingPipeline` with independent stages run
+concurrently versus one after another.
+
+The analysis and embedding stages sleep for a fixed time in place of the
+OpenAI calls. In the serial case the embedding stage declares a dependency
+on the analysis scores, which forces the stages into a chain.
+
+    python -m benchmarks.pipeline_latency
+"""
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from app.services.repository_processsing import FileProcessingPipeline
+from app.services.scheduler import FileScheduler
+from app.services.stages import PipelineStage
+
+FILE_COUNT = 200
+ANALYSIS_LATENCY = 0.3
+EMBEDDING_LATENCY = 0.25
+
+
+class FakeBudgetStage(PipelineStage):
+    inputs = frozenset({"language"})
+    outputs = frozenset({"token_count"})
+
+    async def process(self, file_path, file_content, metadata):
+        metadata["token_count"] = len(file_content) // 4
+
+
+class FakeAnalysisStage(PipelineStage):
+    inputs = frozenset({"token_count"})
+    outputs = frozenset({"scores"})
+
+    async def process(self, file_path, file_content, metadata):
+        await asyncio.sleep(ANALYSIS_LATENCY)
+        metadata["scores"] = {"bugs": 0}
+
+
+class FakeEmbeddingStage(PipelineStage):
+    outputs = frozenset({"chunks"})
+
+    async def process(self, file_path, file_content, metadata):
+        await asyncio.sleep(EMBEDDING_LATENCY)
+        metadata["chunks"] = []
+
+
+class SerialEmbeddingStage(FakeEmbeddingStage):
+    inputs = frozenset({"scores"})
+
+
+async def run_case(name, file_paths, embedding_stage):
+    pipeline = FileProcessingPipeline([FakeBudgetStage(), FakeAnalysisStage(concurrency=16), embedding_stage])
+    latencies = []
+
+    async def process(file_path):
+        started = time.perf_counter()
+        result = await pipeline.process_file(file_path)
+        latencies.append(time.perf_counter() - started)
+        return result
+
+    async def sink(results):
+        pass
+
+    scheduler = FileScheduler(process, sink, workers=16)
+
+    started = time.perf_counter()
+    await scheduler.run(file_paths)
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{name:>10}: mean {statistics.mean(latencies) * 1000:6.1f} ms/file, "
+        f"p95 {statistics.quantiles(latencies, n=20)[-1] * 1000:6.1f} ms/file, "
+        f"{len(latencies) / elapsed:6.1f} files/s"
+    )
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        file_paths = []
+
+        for index in range(FILE_COUNT):
+            file_path = os.path.join(directory, f"module_{index}.py")
+
+            with open(file_path, "w") as file:
+                file.write(f"def function_{index}():\n    return {index}\n" * 50)
+
+            file_paths.append(file_path)
+
+        await run_case("serial", file_paths, SerialEmbeddingStage(concurrency=16))
+        await run_case("concurrent", file_paths, FakeEmbeddingStage(concurrency=16))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Event loop lag and wall time of the CPU-bound stages of the pipeline
+(static metrics, token budget and embedding chunking), with their work on
+the event loop versus offloaded to the process pool in chunks.
+
+Files go through `FileProcessingPipeline` as many at a time as the pipeline
+has workers by default, with embeddings from a fake client answering after
+a fixed latency. Lag is how late the event loop wakes a task sleeping 50ms:
+while it is stalled no other file makes I/O progress.
+
+    python -m benchmarks.process_pool_offload
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from .fakes import FakeAsyncOpenAI
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from app.services.embeddings import BatchEmbedder
+from app.services.event_loop_lag import EventLoopLagMonitor
+from app.services.process_pool import ProcessPoolOffloader, get_process_pool, shutdown_process_pool
+from app.services.repository_processsing import EmbeddingGenerationStage, FileProcessingPipeline
+from app.services.stages import StaticMetricsStage, TokenBudgetStage
+
+FILES = 300
+WORKERS = 16
+SCENARIOS = [
+    ("on the event loop", 0, 1),
+    ("2 workers, one file per submission", 2, 1),
+    ("2 workers, chunks of 16", 2, 16),
+    ("4 workers, chunks of 16", 4, 16),
+]
+
+
+def write_files(directory: str):
+    random.seed(0)
+    paths = []
+
+    for index in range(FILES):
+        functions = random.choice([5, 20, 80, 300])
+        content = "".join(
+            f"# Computes value {index}.{function}\n"
+            f"def function_{function}(value):\n"
+            f"    if value > {function} and value % 3:\n"
+            f"        return value * {function}\n"
+            f"    return value\n\n"
+            for function in range(functions)
+        )
+        path = os.path.join(directory, f"module_{index}.py")
+
+        with open(path, "w") as file:
+            file.write(content)
+
+        paths.append(path)
+
+    return paths
+
+
+async def run(name: str, paths, workers: int, chunk_size: int):
+    offloader = ProcessPoolOffloader(get_process_pool(workers), chunk_size=chunk_size)
+    embedder = BatchEmbedder(client=FakeAsyncOpenAI(latency=0.05, size=8))
+    pipeline = FileProcessingPipeline([
+        StaticMetricsStage(offloader),
+        TokenBudgetStage(offloader=offloader),
+        EmbeddingGenerationStage(embedder, offloader=offloader),
+    ])
+    slots = asyncio.Semaphore(WORKERS)
+
+    async def process(path):
+        async with slots:
+            return await pipeline.process_file(path)
+
+    # Starts the workers, which import the application once.
+    await asyncio.gather(*(process(path) for path in paths[:WORKERS]))
+
+    monitor = EventLoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+
+    await asyncio.gather(*(process(path) for path in paths))
+
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+    lag = monitor.stats()
+
+    print(
+        f"{name:>36}: {elapsed:6.2f}s, lag p99 {lag['p99_ms']:7.1f} ms, max {lag['max_ms']:7.1f} ms, "
+        f"stalled {lag['stalled_seconds']:5.2f}s, {offloader.stats()}"
+    )
+
+    shutdown_process_pool()
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_files(directory)
+        size = sum(os.path.getsize(path) for path in paths)
+
+        print(f"{FILES} files ({size / 2 ** 20:.1f} MiB), {WORKERS} files in the pipeline at once\n")
+
+        for name, workers, chunk_size in SCENARIOS:
+            await run(name, paths, workers, chunk_size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,171 @@
+"""
+Recall, latency and memory of repository collections created with different
+`CollectionSettings`: no quantization, scalar int8 and product quantization,
+vectors on disk, and a denser HNSW graph.
+
+Each configuration indexes the same clustered vectors with the payload
+indexes `create_collection_for_repo` creates, then runs filtered and
+unfiltered queries. Recall@10 is measured against exact search, and memory
+is reported as an estimate of the vector bytes kept in RAM plus the resident
+memory Qdrant reports after indexing.
+
+Quantization, on-disk storage and HNSW only exist in a Qdrant server: set
+BENCHMARK_QDRANT_URL (for example http://localhost:6333). Without it the
+benchmark runs in memory, where every configuration is an exact search and
+only the estimates differ.
+
+    python -m benchmarks.qdrant_collection_tuning
+"""
+import asyncio
+import os
+import re
+import statistics
+import time
+import urllib.request
+import uuid
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import PointStruct, SearchParams
+
+from app.services.qdrant_utils import CollectionSettings, create_collection_for_repo, make_collection_name, path_prefixes
+from app.services.search_service import make_filter
+
+QDRANT_URL = os.getenv("BENCHMARK_QDRANT_URL")
+REPO_PATH = "./storage/repositories/collection_tuning_benchmark"
+POINT_COUNT = 20_000
+VECTOR_SIZE = 1536
+CLUSTERS = 200
+QUERIES = 100
+LIMIT = 10
+LANGUAGES = ["Python", "TypeScript", "Go", "Java"]
+
+CONFIGURATIONS = {
+    "float32": CollectionSettings(),
+    "float32 on disk": CollectionSettings(on_disk=True),
+    "scalar int8": CollectionSettings(quantization="scalar"),
+    "scalar int8, on disk": CollectionSettings(quantization="scalar", on_disk=True),
+    "product x16, on disk": CollectionSettings(quantization="product", product_compression="x16", on_disk=True),
+    "scalar int8, m=32 ef=128": CollectionSettings(quantization="scalar", hnsw_m=32, hnsw_ef_construct=200, search_ef=128),
+}
+
+
+def make_vectors(count: int, seed: int) -> np.ndarray:
+    """Unit vectors scattered around shared centres, closer to real embeddings than uniform noise."""
+    generator = np.random.default_rng(seed)
+    centres = np.random.default_rng(0).standard_normal((CLUSTERS, VECTOR_SIZE))
+    vectors = centres[generator.integers(0, CLUSTERS, count)] + 0.6 * generator.standard_normal((count, VECTOR_SIZE))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def estimated_ram(settings: CollectionSettings) -> int:
+    """Bytes of vectors kept in RAM, ignoring the HNSW graph and payloads."""
+    original = POINT_COUNT * VECTOR_SIZE * 4
+    quantized = {
+        "none": 0,
+        "scalar": POINT_COUNT * VECTOR_SIZE,
+        "product": original // int(settings.product_compression.value[1:]),
+    }[settings.quantization]
+
+    return (0 if settings.on_disk else original) + (quantized if settings.quantization_always_ram else 0)
+
+
+def resident_memory() -> int:
+    """Resident memory of the Qdrant server from its metrics, 0 when unavailable."""
+    if not QDRANT_URL:
+        return 0
+
+    try:
+        with urllib.request.urlopen(f"{QDRANT_URL}/metrics", timeout=5) as response:
+            metrics = response.read().decode()
+    except OSError:
+        return 0
+
+    match = re.search(r"^memory_resident_bytes (\d+)", metrics, re.MULTILINE)
+    return int(match.group(1)) if match else 0
+
+
+async def index(client: AsyncQdrantClient, settings: CollectionSettings, vectors: np.ndarray) -> str:
+    collection_name = make_collection_name(REPO_PATH)
+
+    if await client.collection_exists(collection_name):
+        await client.delete_collection(collection_name)
+
+    await create_collection_for_repo(REPO_PATH, settings, client)
+
+    for start in range(0, POINT_COUNT, 500):
+        points = []
+
+        for index in range(start, min(start + 500, POINT_COUNT)):
+            path = f"src/package_{index % 20}/module_{index % 500}.py"
+            points.append(PointStruct(id=str(uuid.uuid4()), vector=vectors[index].tolist(), payload={
+                "file_path": path,
+                "path": path,
+                "path_prefixes": path_prefixes(path),
+                "language": LANGUAGES[index % len(LANGUAGES)],
+            }))
+
+        await client.upsert(collection_name, points=points, wait=True)
+
+    # Searches are timed once the HNSW graph and quantized vectors are built.
+    while (await client.get_collection(collection_name)).status.value != "green":
+        await asyncio.sleep(0.5)
+
+    return collection_name
+
+
+async def run_case(client, collection_name, settings, queries, query_filter):
+    latencies = []
+    recalls = []
+
+    for query in queries:
+        exact = await client.query_points(
+            collection_name, query=query.tolist(), query_filter=query_filter, limit=LIMIT,
+            search_params=SearchParams(exact=True)
+        )
+
+        started = time.perf_counter()
+        response = await client.query_points(
+            collection_name, query=query.tolist(), query_filter=query_filter, limit=LIMIT,
+            search_params=settings.search_params()
+        )
+        latencies.append(time.perf_counter() - started)
+
+        expected = {point.id for point in exact.points}
+        recalls.append(len(expected & {point.id for point in response.points}) / max(1, len(expected)))
+
+    return statistics.mean(recalls), statistics.median(latencies), statistics.quantiles(latencies, n=20)[-1]
+
+
+async def main():
+    client = AsyncQdrantClient(url=QDRANT_URL) if QDRANT_URL else AsyncQdrantClient(location=":memory:")
+    vectors = make_vectors(POINT_COUNT, seed=1)
+    queries = make_vectors(QUERIES, seed=2)
+
+    if not QDRANT_URL:
+        print("BENCHMARK_QDRANT_URL is not set: local Qdrant ignores these settings and searches exactly.\n")
+
+    print(f"{POINT_COUNT} points of {VECTOR_SIZE} dimensions, {QUERIES} queries, recall@{LIMIT} against exact search\n")
+
+    for name, settings in CONFIGURATIONS.items():
+        collection_name = await index(client, settings, vectors)
+        resident = resident_memory()
+
+        for case, query_filter in (
+            ("unfiltered", None),
+            ("language + path", make_filter(["Python"], "src/package_4")),
+        ):
+            recall, p50, p95 = await run_case(client, collection_name, settings, queries, query_filter)
+            print(
+                f"{name:>26} {case:>16}: recall {recall:5.3f}, p50 {p50 * 1000:6.2f} ms, p95 {p95 * 1000:6.2f} ms, "
+                f"vectors in RAM ~{estimated_ram(settings) / 2 ** 20:6.1f} MiB"
+                + (f", resident {resident / 2 ** 20:7.1f} MiB" if resident else "")
+            )
+
+        await client.delete_collection(collection_name)
+
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
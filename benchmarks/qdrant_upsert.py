@@ -0,0 +1,75 @@
+"""
+Upsert throughput of `QdrantUpsertWriter` against a local Qdrant stand-in.
+
+Compares one upsert for the whole repository (the previous behaviour) with
+streamed fixed-size batches, then injects failures to show they are retried.
+
+    python -m benchmarks.qdrant_upsert
+"""
+import asyncio
+import random
+import time
+import uuid
+
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from app.services.qdrant_utils import QdrantUpsertWriter
+from benchmarks.fakes import FakeQdrantClient
+
+POINT_COUNT = 5_000
+VECTOR_SIZE = 1536
+COLLECTION_NAME = "benchmark"
+
+
+def make_points():
+    random.seed(0)
+    vector = [random.uniform(-1, 1) for _ in range(VECTOR_SIZE)]
+
+    for index in range(POINT_COUNT):
+        yield PointStruct(id=str(uuid.uuid4()), vector=vector, payload={"file_path": f"src/{index}.py"})
+
+
+async def make_client(**options) -> FakeQdrantClient:
+    client = FakeQdrantClient(**options)
+    await client.create_collection(COLLECTION_NAME, vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE))
+    return client
+
+
+async def run_single_request():
+    client = await make_client()
+
+    started = time.perf_counter()
+    try:
+        await client.upsert(collection_name=COLLECTION_NAME, points=list(make_points()), wait=True)
+        outcome = "ok"
+    except TimeoutError as e:
+        outcome = f"failed: {e}"
+    elapsed = time.perf_counter() - started
+
+    print(f"{'single':<10} {elapsed:6.2f}s, {client.request_count} requests, {outcome}")
+
+
+async def run_writer(name: str, **client_options):
+    client = await make_client(**client_options)
+    writer = QdrantUpsertWriter(COLLECTION_NAME, qdrant_client=client, batch_size=256, max_in_flight=4, backoff=0.05)
+
+    started = time.perf_counter()
+    await writer.write(make_points())
+    await writer.close()
+    elapsed = time.perf_counter() - started
+
+    count = (await client.count(COLLECTION_NAME)).count
+    print(
+        f"{name:<10} {elapsed:6.2f}s ({count / elapsed:8.0f} points/sec), "
+        f"{client.request_count} requests, {count} stored, {writer.stats()}"
+    )
+
+
+async def main():
+    await run_single_request()
+    await run_writer("batched")
+    await run_writer("flaky", failure_rate=0.1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
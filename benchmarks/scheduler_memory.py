@@ -0,0 +1,48 @@
+"""
+Peak memory of `FileScheduler` as the repository grows.
+
+Each fake file holds 64KB of content while it is processed and the sink
+discards results, so peak memory should stay flat as the file count grows.
+
+    python -m benchmarks.scheduler_memory
+"""
+import asyncio
+import time
+import tracemalloc
+
+from app.services.scheduler import FileScheduler
+
+FILE_SIZE = 64 * 1024
+
+
+async def process(file_path: str) -> dict:
+    content = file_path * (FILE_SIZE // len(file_path))
+    await asyncio.sleep(0.001)
+    return {"file_path": file_path, "line_count": content.count("\n")}
+
+
+async def sink(results):
+    await asyncio.sleep(0.001)
+
+
+async def run_case(file_count: int):
+    scheduler = FileScheduler(process, sink, workers=16, queue_size=64, flush_size=50)
+    file_paths = (f"src/module_{index}.py" for index in range(file_count))
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await scheduler.run(file_paths)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{file_count:>7} files: peak {peak / 1024 / 1024:6.2f} MB, {elapsed:6.2f}s, {scheduler.stats()}")
+
+
+async def main():
+    for file_count in (1_000, 10_000, 50_000):
+        await run_case(file_count)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+"""
+Latency of repository search through `search_chunks`, run on the service
+loop the way the `/repository/<name>/search` endpoint runs it.
+
+Indexes fake chunks into a local Qdrant, then times queries with a cold
+and a warm query embedding cache, with language and path filters, deep
+pages and a score threshold. Set BENCHMARK_QDRANT_URL (for example
+http://localhost:6333) to run against a Qdrant server, in which case a
+client created per request is timed too; otherwise Qdrant runs in memory.
+
+    python -m benchmarks.search_latency
+"""
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from app.schemas import SearchRepository
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embeddings import BatchEmbedder, EMBEDDING_MODEL
+from app.services.qdrant_utils import path_prefixes
+from app.services.rate_limits import RateLimiter
+from app.services.search_service import search_chunks
+from app.services.service_loop import service_loop
+from benchmarks.fakes import FakeAsyncOpenAI, fake_vector
+
+QDRANT_URL = os.getenv("BENCHMARK_QDRANT_URL")
+COLLECTION_NAME = "search_benchmark"
+POINT_COUNT = 10_000
+VECTOR_SIZE = 1536
+QUERIES = 50
+LANGUAGES = ["Python", "TypeScript", "Go", "Java"]
+
+
+def make_client() -> AsyncQdrantClient:
+    return AsyncQdrantClient(url=QDRANT_URL) if QDRANT_URL else AsyncQdrantClient(location=":memory:")
+
+
+async def index(client: AsyncQdrantClient):
+    if await client.collection_exists(COLLECTION_NAME):
+        await client.delete_collection(COLLECTION_NAME)
+
+    await client.create_collection(COLLECTION_NAME, vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE))
+
+    points = []
+
+    for index in range(POINT_COUNT):
+        path = f"src/package_{index % 20}/module_{index % 500}.py"
+        points.append(PointStruct(id=str(uuid.uuid4()), vector=fake_vector(f"chunk {index}"), payload={
+            "file_path": path,
+            "path": path,
+            "path_prefixes": path_prefixes(path),
+            "language": LANGUAGES[index % len(LANGUAGES)],
+            "chunk": f"chunk {index}",
+            "chunk_index": 0,
+            "start_line": 1,
+            "end_line": 40,
+        }))
+
+    for start in range(0, len(points), 500):
+        await client.upsert(COLLECTION_NAME, points=points[start:start + 500], wait=True)
+
+
+def run_case(name, make_search, qdrant_client, embedder, per_request_client=False):
+    latencies = []
+
+    for index in range(QUERIES):
+        search = make_search(index)
+        started = time.perf_counter()
+
+        if per_request_client:
+            async def search_with_new_client():
+                client = make_client()
+                try:
+                    return await search_chunks(COLLECTION_NAME, search, embedder, client)
+                finally:
+                    await client.close()
+
+            service_loop.run(search_with_new_client())
+        else:
+            service_loop.run(search_chunks(COLLECTION_NAME, search, embedder, qdrant_client))
+
+        latencies.append(time.perf_counter() - started)
+
+    print(
+        f"{name:>28}: p50 {statistics.median(latencies) * 1000:7.2f} ms, "
+        f"p95 {statistics.quantiles(latencies, n=20)[-1] * 1000:7.2f} ms"
+    )
+
+
+async def on_loop(factory):
+    """Creates an object on the service loop, for clients bound to the loop they are created on."""
+    return factory()
+
+
+def search(q, languages=(), path=None, limit=10, offset=0, score_threshold=None):
+    return SearchRepository(q=q, languages=list(languages), path=path, limit=limit, offset=offset, score_threshold=score_threshold)
+
+
+def main():
+    qdrant_client = service_loop.run(on_loop(make_client))
+    service_loop.run(index(qdrant_client))
+
+    with tempfile.TemporaryDirectory() as directory:
+        embedder = service_loop.run(on_loop(lambda: BatchEmbedder(
+            client=FakeAsyncOpenAI(latency=0.15),
+            cache=EmbeddingCache(os.path.join(directory, "embeddings.sqlite3")),
+            rate_limiter=RateLimiter(EMBEDDING_MODEL),
+            linger=0
+        )))
+
+        run_case("cold query embedding", lambda index: search(f"query {index}"), qdrant_client, embedder)
+        run_case("warm query embedding", lambda index: search(f"query {index}"), qdrant_client, embedder)
+        run_case("language filter", lambda index: search(f"query {index}", ["Python"]), qdrant_client, embedder)
+        run_case("path prefix filter", lambda index: search(f"query {index}", path="src/package_3"), qdrant_client, embedder)
+        run_case("language and path filters", lambda index: search(f"query {index}", ["Go"], "src/package_3"), qdrant_client, embedder)
+        run_case("page at offset 200", lambda index: search(f"query {index}", offset=200), qdrant_client, embedder)
+        run_case("score threshold", lambda index: search(f"query {index}", score_threshold=0.05), qdrant_client, embedder)
+
+        if QDRANT_URL:
+            run_case("client per request", lambda index: search(f"query {index}"), qdrant_client, embedder, per_request_client=True)
+
+        embedder.cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Cost of `StaticMetricsStage` over a repository (this one by default, or
+BENCHMARK_REPO_PATH), measured on the event loop and in the process pool,
+and how many files each `LLM_MIN_CODE_LINES` would keep from the LLM. The
+CPU time of this process is what the stage takes from the event loop, and
+so from the other stages.
+
+The repository is repeated until it has at least MIN_FILES files, so the
+pool is measured warm and over enough files to hide its start.
+
+    python -m benchmarks.static_metrics
+"""
+import asyncio
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from app.services.file_filter import RepositoryFileFilter
+from app.services.file_language_detection import detect_language
+from app.services.process_pool import ProcessPoolOffloader, get_process_pool, shutdown_process_pool
+from app.services.stages import StaticMetricsStage
+
+REPO_PATH = os.getenv("BENCHMARK_REPO_PATH", ".")
+MIN_FILES = 2_000
+WORKERS = [0, 2, 4]
+MIN_CODE_LINES = [3, 5, 10, 20]
+
+
+def repository_files():
+    files = []
+
+    for relative_path in RepositoryFileFilter(REPO_PATH).walk():
+        try:
+            with open(os.path.join(REPO_PATH, relative_path), encoding="utf-8") as file:
+                content = file.read()
+        except UnicodeDecodeError:
+            continue
+
+        language = detect_language(relative_path, content)
+
+        if language != "unknown":
+            files.append((relative_path, content, language))
+
+    return files
+
+
+async def measure(stage: StaticMetricsStage, files) -> list:
+    async def process(file_path, content, language):
+        metadata = {"language": language}
+        await stage.process(file_path, content, metadata)
+        return metadata
+
+    return await asyncio.gather(*(process(*file) for file in files))
+
+
+async def main():
+    files = repository_files()
+    repeated = files * (MIN_FILES // len(files) + 1)
+    size = sum(len(content) for _, content, _ in repeated)
+
+    print(f"{len(files)} files of {os.path.abspath(REPO_PATH)}, measured {len(repeated)} times ({size / 2 ** 20:.1f} MiB)\n")
+
+    for workers in WORKERS:
+        offloader = ProcessPoolOffloader(get_process_pool(workers))
+        stage = StaticMetricsStage(offloader)
+
+        # Starts the workers, which import the application once.
+        await measure(stage, repeated[:100])
+
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        results = await measure(stage, repeated)
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+
+        print(
+            f"{'inline' if workers == 0 else f'{workers} workers':>10}: {elapsed:6.3f}s, "
+            f"{elapsed / len(repeated) * 1e6:6.1f} us per file, event loop CPU {cpu:6.3f}s, {offloader.stats()}"
+        )
+
+        shutdown_process_pool()
+
+    print()
+
+    for min_code_lines in MIN_CODE_LINES:
+        trivial = [metadata for metadata in results if metadata["static_metrics"]["code_lines"] < min_code_lines]
+        print(f"LLM_MIN_CODE_LINES={min_code_lines:<3} skips the LLM for {len(trivial) / len(results):4.0%} of files")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,270 @@
+"""
+Cost, latency and agreement of the triage policies of `StatGenerationStage`,
+replayed from cached analyses, to pick `LLM_TRIAGE` and its thresholds.
+
+Every file of a repository (this one by default, or BENCHMARK_REPO_PATH) is
+analyzed once with the full model and once with the triage model, with
+batching off, into an `AnalysisCache`. The policies are then replayed from
+the cache alone: for each one, the tier every file would go through decides
+which cached reports and usage it pays for. Agreement is measured against
+the full model: mean absolute difference of the four scores, and how often
+both agree on whether a file is risky.
+
+By default the analyses come from the local fake OpenAI server, whose
+reports follow the size and branching of each file and are noisier for the
+triage model. Set BENCHMARK_OPENAI=1 (with OPENAI_API_KEY) to record them
+with the real API instead; set BENCHMARK_ANALYSIS_CACHE to keep them between
+runs, so later runs only replay.
+
+    python -m benchmarks.tier_replay
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import statistics
+import tempfile
+import time
+
+from .fake_openai_server import FakeOpenAIServer
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from app.services.analysis_cache import AnalysisCache
+from app.services.file_filter import RepositoryFileFilter
+from app.services.file_language_detection import detect_language
+from app.services.rate_limits import RateLimiter
+from app.services.stages.stat_generation_stage import ReportAnalyzer
+from app.services.static_metrics import comment_syntax, compute_metrics, describe_metrics
+from app.services.token_counting import count_tokens
+from app.services.triage import MODEL, NONE, STATIC, TIER_TRIAGE, TriagePolicy, static_risk
+
+USE_OPENAI = os.getenv("BENCHMARK_OPENAI") == "1"
+REPO_PATH = os.getenv("BENCHMARK_REPO_PATH", ".")
+CACHE_PATH = os.getenv("BENCHMARK_ANALYSIS_CACHE")
+FULL_MODEL = "gpt-4"
+TRIAGE_MODEL = "gpt-4o-mini"
+CONCURRENCY = 16
+
+# Files over this many tokens are analyzed in sections, which are left out.
+SECTION_TOKENS = 6_000
+
+# Dollars per million prompt and completion tokens.
+PRICES = {
+    "gpt-4": (30.00, 60.00),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+# Seconds the fake server takes to answer each model.
+MODEL_LATENCY = {FULL_MODEL: 0.3, TRIAGE_MODEL: 0.08}
+
+# How far from the full model the fake triage model scores a file, at most.
+TRIAGE_NOISE = 20
+
+# Score from which a file counts as risky when comparing reports.
+RISKY_SCORE = 50
+
+POLICIES = [
+    TriagePolicy(NONE),
+    *(TriagePolicy(STATIC, TRIAGE_MODEL, static_threshold=threshold) for threshold in (20, 30, 40, 50)),
+    *(TriagePolicy(MODEL, TRIAGE_MODEL, escalation_threshold=threshold) for threshold in (30, 40, 50, 60)),
+]
+
+SCORES = ("documentation_score", "bugs_score", "security_score", "performance_score")
+
+FILE_PATTERN = re.compile(r"Generate a report for this file .*?:\n(.*)\n\s*Metrics measured locally", re.DOTALL)
+
+
+def jitter(seed: str, spread: int) -> int:
+    return int(hashlib.sha256(seed.encode()).hexdigest()[:8], 16) % (2 * spread + 1) - spread
+
+
+class ReplayServer(FakeOpenAIServer):
+    """Fake server whose reports depend on the file analyzed, and whose triage model is faster and noisier."""
+
+    def handle(self, path: str, body: dict):
+        time.sleep(MODEL_LATENCY.get(body.get("model"), 0.0))
+        return super().handle(path, body)
+
+    def _analysis(self, prompt: str, model: str):
+        match = FILE_PATTERN.search(prompt)
+        content = match.group(1) if match else prompt
+        risk = static_risk(compute_metrics(content))
+
+        report = {
+            "documentation_score": 50 + jitter("documentation" + content, 40),
+            "bugs_score": 0.8 * risk + 10 + jitter("bugs" + content, 15),
+            "security_score": 0.5 * risk + 10 + jitter("security" + content, 10),
+            "performance_score": 0.6 * risk + 10 + jitter("performance" + content, 10),
+            "tasks": [],
+        }
+
+        if model != FULL_MODEL:
+            for score in SCORES:
+                report[score] += jitter(model + score + content, TRIAGE_NOISE)
+
+        for score in SCORES:
+            report[score] = max(0, min(100, round(report[score])))
+
+        return json.dumps(report), 150
+
+
+def repository_files():
+    files = []
+    skipped = 0
+
+    for relative_path in RepositoryFileFilter(REPO_PATH).walk():
+        try:
+            with open(os.path.join(REPO_PATH, relative_path), encoding="utf-8") as file:
+                content = file.read()
+        except UnicodeDecodeError:
+            continue
+
+        if not content.strip():
+            continue
+
+        if count_tokens(content, FULL_MODEL) > SECTION_TOKENS:
+            skipped += 1
+            continue
+
+        metrics = compute_metrics(content, comment_syntax(detect_language(relative_path, content)))
+        files.append((relative_path, content, metrics))
+
+    return files, skipped
+
+
+async def record(cache: AnalysisCache, files, model: str) -> ReportAnalyzer:
+    """Analyzes every file not yet in the cache with one model."""
+    analyzer = ReportAnalyzer(
+        max_concurrency=CONCURRENCY,
+        model=model,
+        cache=cache,
+        rate_limiter=RateLimiter(model, max_concurrency=CONCURRENCY),
+        batch_max_files=1
+    )
+    missing = [file for file in files if cache.lookup(model, analyzer.prompt_version, file[1]) is None]
+
+    if missing:
+        print(f"Recording {len(missing)} analyses with {model}")
+        await asyncio.gather(*(
+            analyzer.analyze(file_path, content, describe_metrics(metrics)) for file_path, content, metrics in missing
+        ))
+
+    return analyzer
+
+
+def cost(model: str, usage: dict) -> float:
+    prompt_price, completion_price = PRICES[model]
+    return (usage.get("prompt_tokens", 0) * prompt_price + usage.get("completion_tokens", 0) * completion_price) / 1_000_000
+
+
+class TriageReport:
+    """Attribute access to the scores of a cached report, as `TriagePolicy` reads them."""
+
+    def __init__(self, report: dict):
+        self.__dict__.update(report)
+
+
+def replay(policy: TriagePolicy, analyses) -> dict:
+    """Sums what a policy pays for every file, and compares its reports with the full model's."""
+    dollars = 0.0
+    latencies = []
+    differences = []
+    agreements = []
+    full_analyses = 0
+
+    for metrics, (full_report, full_usage), (triage_report, triage_usage) in analyses:
+        report = full_report
+        seconds = 0.0
+
+        if policy.first_tier(metrics) == TIER_TRIAGE:
+            dollars += cost(TRIAGE_MODEL, triage_usage)
+            seconds += triage_usage.get("seconds", 0.0)
+            report = triage_report
+
+            if policy.escalate(TriageReport(triage_report)):
+                report = full_report
+
+        if report is full_report:
+            dollars += cost(FULL_MODEL, full_usage)
+            seconds += full_usage.get("seconds", 0.0)
+            full_analyses += 1
+
+        latencies.append(seconds)
+        differences.append(statistics.mean(abs(report[score] - full_report[score]) for score in SCORES))
+        agreements.append(risky(report) == risky(full_report))
+
+    return {
+        "full_analyses": full_analyses,
+        "cost": dollars,
+        "seconds": sum(latencies),
+        "p95_seconds": statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else sum(latencies),
+        "score_difference": statistics.mean(differences),
+        "risk_agreement": sum(agreements) / len(agreements),
+    }
+
+
+def risky(report: dict) -> bool:
+    return max(report["bugs_score"], report["security_score"], report["performance_score"]) >= RISKY_SCORE
+
+
+def describe(policy: TriagePolicy) -> str:
+    if policy.mode == STATIC:
+        return f"static < {policy.static_threshold}"
+
+    if policy.mode == MODEL:
+        return f"model, escalate >= {policy.escalation_threshold}"
+
+    return "none"
+
+
+async def main():
+    files, skipped = repository_files()
+    server = None
+
+    if not USE_OPENAI:
+        server = ReplayServer(requests_limit=10_000, tokens_limit=10_000_000, window=60.0, latency=0.0, failure_rate=0.0).start()
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+
+    directory = None if CACHE_PATH else tempfile.TemporaryDirectory()
+    cache = AnalysisCache(CACHE_PATH or os.path.join(directory.name, "analysis_cache.sqlite3"))
+
+    full = await record(cache, files, FULL_MODEL)
+    triage = await record(cache, files, TRIAGE_MODEL)
+
+    if server is not None:
+        server.stop()
+
+    analyses = [
+        (metrics, cache.lookup(FULL_MODEL, full.prompt_version, content), cache.lookup(TRIAGE_MODEL, triage.prompt_version, content))
+        for _, content, metrics in files
+    ]
+    analyses = [analysis for analysis in analyses if analysis[1] and analysis[2]]
+
+    print(
+        f"\n{len(analyses)} files of {os.path.abspath(REPO_PATH)} ({skipped} sectioned files left out), "
+        f"{FULL_MODEL} against {TRIAGE_MODEL}, analyses from {'OpenAI' if USE_OPENAI else 'the fake server'}\n"
+    )
+
+    baseline = replay(POLICIES[0], analyses)
+
+    for policy in POLICIES:
+        result = replay(policy, analyses)
+
+        print(
+            f"{describe(policy):>26}: {result['full_analyses']:3} on {FULL_MODEL}, "
+            f"${result['cost']:7.3f} ({1 - result['cost'] / baseline['cost']:4.0%} saved), "
+            f"{result['seconds']:6.1f}s of requests (p95 {result['p95_seconds']:4.2f}s), "
+            f"mean |score diff| {result['score_difference']:4.1f}, risk agreement {result['risk_agreement']:4.0%}"
+        )
+
+    cache.close()
+
+    if directory is not None:
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
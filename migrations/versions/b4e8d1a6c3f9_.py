@@ -0,0 +1,39 @@
+"""allow one running job per key
+
+Revision ID: b4e8d1a6c3f9
+Revises: d5a7c9e1b3f4
+Create Date: 2026-10-17 21:12:08.318450
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e8d1a6c3f9'
+down_revision = 'd5a7c9e1b3f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep the most recently updated running job of each key and fail the
+    # others, which would break the unique index.
+    op.execute(sa.text(
+        "UPDATE job SET status = 'failed', error = 'Another job of the same key was running', "
+        "finished_at = CURRENT_TIMESTAMP "
+        "WHERE status = 'running' AND key IS NOT NULL AND EXISTS ("
+        "SELECT 1 FROM job AS other WHERE other.status = 'running' AND other.key = job.key "
+        "AND (other.updated_at > job.updated_at OR (other.updated_at = job.updated_at AND other.id > job.id)))"
+    ))
+
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_job_running_key', ['key'], unique=True,
+            postgresql_where=sa.text("status = 'running'"), sqlite_where=sa.text("status = 'running'")
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index('ix_job_running_key')